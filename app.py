@@ -1,38 +1,72 @@
-from flask import Flask, request, jsonify, render_template, redirect, url_for, flash, session, send_from_directory
+from flask import Flask, request, jsonify, render_template, redirect, url_for, flash, session, send_from_directory, send_file, g
 from flask_wtf import FlaskForm
 import bcrypt
-import json
 from wtforms import StringField, PasswordField, SubmitField
 from wtforms.validators import DataRequired, Length
 import secrets
 from datetime import timedelta
 import os
+import io
+from flask import Request
 from functions import *
+from batching import MicroBatcher, QueueFull, DeadlineExceeded
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from upload_store import UploadStore
+from result_cache import ResultCache
+from thumbnails import ThumbnailCache, THUMBNAIL_SIZES, THUMBNAIL_FORMATS
+from plant_catalog import get_plant_catalog
+from user_store import UserStore, migrate_json_files
+from submissions import SubmissionLog
+from plant_embeddings import get_similarity_index
+import time
+import metrics
+from metrics import timer
+
+
+# Keep uploaded files in memory instead of spooling them to temporary files.
+# The size of a request is bounded by MAX_CONTENT_LENGTH and, for the single-image
+# routes, by limit_upload_size() before anything is read.
+class InMemoryRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return io.BytesIO()
 
 
 app = Flask(__name__)
+app.request_class = InMemoryRequest
 secret_key = secrets.token_hex(16)  # Generates a 16-byte hex string
 app.config['SECRET_KEY'] = secret_key  # Required for using forms and sessions
 
-# Path to the JSON file for storing user data
-USER_DATA_FILE = 'user_data.json'
+# How the models are loaded at startup (every request shares the resident instances):
+# - 'background': load and warm up in a background thread, /ready reports when done (default)
+# - 'eager': load before the app starts serving
+# - 'lazy': load on the first recognition request
+MODEL_PRELOAD = os.environ.get('GREENSPACE_MODEL_PRELOAD', 'background')
 
-# Helper function to load user data from the JSON file
-def load_user_data():
-    try:
-        with open(USER_DATA_FILE, 'r') as file:
-            return json.load(file)
-    except FileNotFoundError:
-        # If file doesn't exist, return an empty dictionary
-        return {}
-    except json.JSONDecodeError as e:
-        print(f"Error loading JSON data: {e}")
-        return {}
-
-# Helper function to save user data to the JSON file
-def save_user_data(data):
-    with open(USER_DATA_FILE, 'w') as file:
-        json.dump(data, file, indent=4)
+if MODEL_PRELOAD == 'eager':
+    get_registry().load()
+elif MODEL_PRELOAD == 'background':
+    get_registry().preload()
+
+# Plant catalog with indexes by catalog key and mapping_name
+get_plant_catalog().load()
+
+# Species -> example image index for the result page (built once if example_images.json is missing)
+get_example_index().load()
+
+# Token for the admin routes (disabled when not set)
+ADMIN_TOKEN = os.environ.get('GREENSPACE_ADMIN_TOKEN')
+
+def is_admin_request():
+    token = request.headers.get('X-Admin-Token', '')
+    return bool(ADMIN_TOKEN) and secrets.compare_digest(token, ADMIN_TOKEN)
+
+# Users and their plant collections are stored in SQLite (see user_store.py).
+# On the first start the existing user_data.json / user_plants.json are imported.
+USER_DATA_FILE = 'user_data.json'
+USER_PLANTS = 'user_plants.json'
+user_store = UserStore()
+if user_store.count_users() == 0:
+    migrate_json_files(user_store, USER_DATA_FILE, USER_PLANTS)
 
 # Login Form
 class LoginForm(FlaskForm):
@@ -56,12 +90,12 @@ def login():
         
     form = LoginForm()
     if form.validate_on_submit():
-        user_data = load_user_data()
         username = form.username.data
         password = form.password.data.encode('utf-8')
+        user = user_store.get_user(username)
 
-        if username in user_data:
-            hashed_password = user_data[username]['password'].encode('utf-8')
+        if user is not None:
+            hashed_password = user['password'].encode('utf-8')
             if bcrypt.checkpw(password, hashed_password):
                 # Store username in session
                 session['username'] = username
@@ -88,35 +122,178 @@ def logout():
 def register():
     form = RegistrationForm()
     if form.validate_on_submit():
-        user_data = load_user_data()
         username = form.username.data
         password = form.password.data.encode('utf-8')
 
         # Check if the username already exists
-        if username in user_data:
+        if user_store.get_user(username) is not None:
             flash(f'Username {username} is already taken, please choose a different one.', 'danger')
         else:
             # Hash the password before saving
             hashed_password = bcrypt.hashpw(password, bcrypt.gensalt())
 
-            # Save the new user data in the JSON file
-            user_data[username] = {
-                'password': hashed_password.decode('utf-8')
-            }
-            save_user_data(user_data)
-
-            flash(f'Account created for {username}!', 'success')
-            return redirect(url_for('login'))
+            # Save the new user (the insert is skipped if the name was taken meanwhile)
+            if user_store.create_user(username, hashed_password.decode('utf-8')):
+                flash(f'Account created for {username}!', 'success')
+                return redirect(url_for('login'))
+            flash(f'Username {username} is already taken, please choose a different one.', 'danger')
 
     return render_template('register.html', form=form)
 
 # Set the directory where the images are stored (outside static folder)
 IMAGE_FOLDER = os.path.join(os.getcwd(), 'house_plant_species')
 
+# Resized copies of the dataset images, stored in thumbnail_cache
+thumbnail_cache = ThumbnailCache(IMAGE_FOLDER, os.path.join(os.getcwd(), 'thumbnail_cache'))
+IMAGE_MAX_AGE = 24 * 60 * 60  # Browsers may reuse the images for a day, then revalidate with the ETag
+RESULT_IMAGE_SIZE = os.environ.get('GREENSPACE_RESULT_IMAGE_SIZE', 'medium')
+
 @app.route('/image/<path:filename>')
 def serve_image(filename):
-    # Serve the image from the house_plant_species folder
-    return send_from_directory(IMAGE_FOLDER, filename)
+    # ?size=small|medium|large serves a thumbnail, no size (or 'full') the original image
+    size = request.args.get('size', 'full')
+    if size == 'full':
+        # Serve the image from the house_plant_species folder
+        return send_from_directory(IMAGE_FOLDER, filename, max_age=IMAGE_MAX_AGE)
+    if size not in THUMBNAIL_SIZES:
+        return jsonify({'error': f'Unknown size {size}'}), 400
+
+    # WebP for browsers that accept it, JPEG otherwise
+    fmt = 'webp' if request.accept_mimetypes['image/webp'] else 'jpeg'
+    thumbnail = thumbnail_cache.get(filename, size, fmt)
+    if thumbnail is None:
+        # Missing, or an image that can't be decoded
+        return jsonify({'error': 'Image not found'}), 404
+
+    path, etag = thumbnail
+    response = send_file(path, mimetype=THUMBNAIL_FORMATS[fmt][1], etag=etag,
+                         conditional=True, max_age=IMAGE_MAX_AGE)
+    response.vary.add('Accept')
+    return response
+
+# Concurrent /recognize requests are gathered into micro-batches:
+# one RF predict per batch and one CNN predict per category
+BATCH_MAX_SIZE = int(os.environ.get('GREENSPACE_BATCH_MAX_SIZE', 16))
+BATCH_WINDOW_MS = float(os.environ.get('GREENSPACE_BATCH_WINDOW_MS', 5))
+# The batches run on a pool of inference threads, never on the request threads.
+# At most INFERENCE_QUEUE_SIZE images wait for them: beyond that /recognize answers
+# 429 with a Retry-After header right away, and an image that isn't recognized
+# within RECOGNIZE_TIMEOUT seconds gets a 503 (it is dropped if still queued).
+INFERENCE_WORKERS = int(os.environ.get('GREENSPACE_INFERENCE_WORKERS', 1))
+INFERENCE_QUEUE_SIZE = int(os.environ.get('GREENSPACE_INFERENCE_QUEUE', 64))
+RECOGNIZE_TIMEOUT = float(os.environ.get('GREENSPACE_RECOGNIZE_TIMEOUT', 30))
+recognition_batcher = MicroBatcher(recognize_plants, BATCH_MAX_SIZE, BATCH_WINDOW_MS,
+                                   max_queue=INFERENCE_QUEUE_SIZE, workers=INFERENCE_WORKERS)
+
+# Uploads are read into memory (never written to disk on the hot path).
+# Set GREENSPACE_KEEP_UPLOADS=1 to keep them in the uploads folder for future training.
+MAX_UPLOAD_BYTES = int(float(os.environ.get('GREENSPACE_MAX_UPLOAD_MB', 10)) * 1024 * 1024)
+# MAX_CONTENT_LENGTH fits a full /recognize_batch; the single-image routes get a lower limit below
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES * BATCH_MAX_SIZE
+SINGLE_UPLOAD_ROUTES = ('recognize', 'similar_plants')
+UPLOAD_FORM_OVERHEAD = 64 * 1024  # multipart headers and the other form fields
+upload_store = UploadStore('uploads', enabled=os.environ.get('GREENSPACE_KEEP_UPLOADS') == '1')
+
+# Results of images seen before are served from memory.
+# The cache is emptied whenever the model registry swaps in a new model version.
+result_cache = ResultCache(max_entries=int(os.environ.get('GREENSPACE_CACHE_SIZE', 1024)),
+                           ttl=float(os.environ.get('GREENSPACE_CACHE_TTL', 3600)),
+                           perceptual=os.environ.get('GREENSPACE_CACHE_PERCEPTUAL') == '1')
+get_registry().add_listener(result_cache.clear)
+get_registry().add_listener(get_similarity_index().clear_models)
+
+# Request metrics for /metrics (see metrics.py). With GREENSPACE_PROFILE_HEADER=1 (or the
+# admin token) a request sent with "X-Profile: 1" gets its stage breakdown in a Server-Timing header.
+PROFILE_HEADER = os.environ.get('GREENSPACE_PROFILE_HEADER') == '1'
+REQUEST_SECONDS = metrics.registry.histogram('greenspace_request_seconds', 'Request handling time', ['endpoint'])
+REQUESTS_TOTAL = metrics.registry.counter('greenspace_requests_total', 'Handled requests',
+                                          ['endpoint', 'method', 'status'])
+metrics.registry.gauge('greenspace_models_loaded', 'Whether the models are loaded',
+                       lambda: int(get_registry().is_loaded()))
+metrics.registry.gauge('greenspace_result_cache_entries', 'Entries in the result cache',
+                       lambda: result_cache.stats()['entries'])
+metrics.registry.gauge('greenspace_result_cache_hits_total', 'Result cache hits',
+                       lambda: result_cache.stats()['hits'], type='counter')
+metrics.registry.gauge('greenspace_result_cache_misses_total', 'Result cache misses',
+                       lambda: result_cache.stats()['misses'], type='counter')
+metrics.registry.gauge('greenspace_inference_queue_depth', 'Images waiting for an inference worker',
+                       lambda: recognition_batcher.stats()['queued'] + similarity_batcher.stats()['queued'])
+metrics.registry.gauge('greenspace_inference_busy_workers', 'Inference workers processing a batch',
+                       lambda: recognition_batcher.stats()['busy_workers'] + similarity_batcher.stats()['busy_workers'])
+
+@app.before_request
+def start_request_timer():
+    g.started_at = time.perf_counter()
+    if request.headers.get('X-Profile') == '1' and (PROFILE_HEADER or is_admin_request()):
+        g.profile = metrics.start_profile()
+
+@app.after_request
+def record_request_metrics(response):
+    started_at = g.get('started_at')
+    if started_at is not None:
+        elapsed = time.perf_counter() - started_at
+        endpoint = request.endpoint or 'unmatched'
+        REQUEST_SECONDS.observe(elapsed, endpoint)
+        REQUESTS_TOTAL.inc(endpoint, request.method, str(response.status_code))
+        profile = g.get('profile')
+        if profile is not None:
+            response.headers['Server-Timing'] = profile.server_timing(total=elapsed)
+    return response
+
+@app.teardown_request
+def end_request_profile(exception=None):
+    metrics.end_profile()
+
+@app.before_request
+def limit_upload_size():
+    # Refuse an oversized single-image upload from its Content-Length, before it is buffered in memory
+    if request.endpoint not in SINGLE_UPLOAD_ROUTES or request.method != 'POST':
+        return None
+    if request.content_length is None:
+        return jsonify({'error': 'The Content-Length header is required'}), 411
+    if request.content_length > MAX_UPLOAD_BYTES + UPLOAD_FORM_OVERHEAD:
+        return jsonify({'error': f'The file is larger than {MAX_UPLOAD_BYTES} bytes'}), 413
+    return None
+
+#Adjust image paths to show them on result page
+def format_results(results):
+    for result in results:
+        path = result.get('image_path')
+        if path:
+            path = path.replace('\\', '/')
+            path = path.replace('house_plant_species/', '', 1)
+            result['image_path'] = url_for('serve_image', filename=path, size=RESULT_IMAGE_SIZE)
+        result['category'] = int(result['category'])
+    return results
+
+def read_upload(file):
+    # Read the uploaded file into memory; None if it is bigger than the limit
+    with timer('upload_read'):
+        data = file.stream.read(MAX_UPLOAD_BYTES + 1)
+    if len(data) > MAX_UPLOAD_BYTES:
+        return None
+    return data
+
+def recognize_with_deadline(source):
+    return recognition_batcher(source, timeout=RECOGNIZE_TIMEOUT)
+
+def overloaded_response(error, status, retry_after):
+    # 429 / 503 telling the client when to try again
+    response = jsonify({'error': error})
+    response.status_code = status
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+def queue_full_response(e):
+    return overloaded_response('Too many images are being recognized, try again later', 429, e.retry_after)
+
+def deadline_response(batcher=recognition_batcher):
+    return overloaded_response('The recognition took too long, try again later', 503, batcher.retry_after())
+
+def inference_error_response(e):
+    # Any other error of the inference worker (e.g. the models failed to load): a JSON 503 like /ready
+    print(f"Recognition failed: {e}")
+    return jsonify({'error': f'The recognition is not available: {e}'}), 503
 
 #Run recognizing function
 @app.route('/recognize', methods=['POST'])
@@ -130,42 +307,158 @@ def recognize():
     if file.filename == '':
         return jsonify({'error': 'No selected file'}), 400
 
-    # Save the file temporarily
-    file_path = os.path.join('uploads', file.filename)
-    file.save(file_path)
+    data = read_upload(file)
+    if data is None:
+        return jsonify({'error': f'The file is larger than {MAX_UPLOAD_BYTES} bytes'}), 413
 
-    # Call Python function to process the image
-    results = recognize_plant(file_path)  
-
-    #Adjust image paths to show them on result page
-    for result in results:
-        path = result.get('image_path')
-        path = path.replace('house_plant_species\\', '')
-        path = path.replace('\\', '/')
-        result['image_path'] = url_for('serve_image', filename=path)
-        result['category'] = int(result['category'])
+    # Call Python function to process the image (batched with concurrent requests)
+    try:
+        with timer('recognize'):
+            results = result_cache.recognize(data, recognize_with_deadline)
+    except QueueFull as e:
+        return queue_full_response(e)
+    except DeadlineExceeded:
+        return deadline_response()
+    except Exception as e:
+        return inference_error_response(e)
+    if results is None:
+        return jsonify({'error': 'The image could not be recognized'}), 400
+
+    # Optionally keep the upload for future training, written in the background
+    response = jsonify(format_results(results))
+    upload_id = upload_store.persist(data, file.filename)
+    if upload_id:
+        response.headers['X-Upload-Id'] = upload_id
 
     # Return the results as JSON
-    print(results)
-    return jsonify(results)
+    return response
+
+# Recognize several images sent in one POST (form field 'files')
+@app.route('/recognize_batch', methods=['POST'])
+def recognize_batch():
+    files = [file for file in request.files.getlist('files') if file.filename != '']
+    if not files:
+        return jsonify({'error': 'No files in the request'}), 400
+    if len(files) > BATCH_MAX_SIZE:
+        return jsonify({'error': f'At most {BATCH_MAX_SIZE} files per request'}), 400
+
+    images = [read_upload(file) for file in files]
+    if any(data is None for data in images):
+        return jsonify({'error': f'Each file must be at most {MAX_UPLOAD_BYTES} bytes'}), 413
+
+    # Queued as individual items: the inference workers batch them (with other requests)
+    deadline = time.monotonic() + RECOGNIZE_TIMEOUT
+    futures = []
+    try:
+        for data in images:
+            futures.append(recognition_batcher.submit(data, deadline))
+    except QueueFull as e:
+        for future in futures:
+            future.cancel()
+        return queue_full_response(e)
+    try:
+        batch_results = [future.result(timeout=max(0, deadline - time.monotonic())) for future in futures]
+    except FutureTimeoutError:
+        for future in futures:
+            future.cancel()
+        return deadline_response()
+    except Exception as e:
+        for future in futures:
+            future.cancel()
+        return inference_error_response(e)
+
+    response = []
+    for file, data, results in zip(files, images, batch_results):
+        if results is None:
+            response.append({'filename': file.filename, 'error': 'The image could not be recognized'})
+        else:
+            response.append({'filename': file.filename, 'results': format_results(results),
+                             'upload_id': upload_store.persist(data, file.filename)})
+    return jsonify(response)
+
+# Dataset images that look like the upload (see plant_embeddings.py).
+# The searches run on their own inference thread, with the same queue bound and deadline as /recognize.
+SIMILAR_MAX_K = 50
+similarity_batcher = MicroBatcher(get_similarity_index().find_similar_batch, BATCH_MAX_SIZE, BATCH_WINDOW_MS,
+                                  max_queue=INFERENCE_QUEUE_SIZE)
+
+@app.route('/similar_plants', methods=['POST'])
+def similar_plants():
+    if 'file' not in request.files or request.files['file'].filename == '':
+        return jsonify({'error': 'No file part in the request'}), 400
+    similarity_index = get_similarity_index()
+    if not similarity_index.is_available():
+        return jsonify({'error': 'The similarity index has not been built'}), 503
+    if not similarity_index.is_current():
+        return jsonify({'error': 'The similarity index was built with other models, it must be rebuilt'}), 503
 
-PLANTS_CATALOG = 'corrected_species_data.json'
-USER_PLANTS = 'user_plants.json'
+    data = read_upload(request.files['file'])
+    if data is None:
+        return jsonify({'error': f'The file is larger than {MAX_UPLOAD_BYTES} bytes'}), 413
+    k = min(max(request.args.get('k', 8, type=int), 1), SIMILAR_MAX_K)
 
-def read_user_plants():
     try:
-        with open(USER_PLANTS, 'r') as file:
-            return json.load(file)
-    except FileNotFoundError:
-        # If file doesn't exist, return an empty dictionary
-        return {}
-    except json.JSONDecodeError as e:
-        return {}    
-
-# Save the JSON file with updated user plants
-def save_user_plants(data):
-    with open(USER_PLANTS, 'w') as file:
-        json.dump(data, file, indent=4)
+        found = similarity_batcher((data, k), timeout=RECOGNIZE_TIMEOUT)
+    except QueueFull as e:
+        return queue_full_response(e)
+    except DeadlineExceeded:
+        return deadline_response(similarity_batcher)
+    except Exception as e:
+        return inference_error_response(e)
+    if found is None:
+        return jsonify({'error': 'The image could not be recognized'}), 400
+    category_result, matches = found
+
+    similar = []
+    for path, similarity in matches:
+        filename = path.replace('\\', '/').replace('house_plant_species/', '', 1)
+        similar.append({
+            "label": filename.split('/', 1)[0],
+            "image_path": url_for('serve_image', filename=filename, size='small'),
+            "similarity": round(similarity, 4),
+        })
+    return jsonify({"category": category_result, "similar": similar})
+
+# Readiness probe for the load balancer: 200 once the models are loaded and warm
+@app.route('/ready')
+def ready():
+    registry = get_registry()
+    if registry.is_loaded():
+        return jsonify({"ready": True, "version": registry.version})
+    return jsonify({"ready": False, "error": registry.load_error}), 503
+
+# Hit and miss counters of the result cache
+@app.route('/admin/cache_stats')
+def cache_stats():
+    if not is_admin_request():
+        return jsonify({"success": False, "message": "Forbidden"}), 403
+    return jsonify(result_cache.stats())
+
+# Prometheus metrics of this process: stage and request histograms, counters
+@app.route('/metrics')
+def prometheus_metrics():
+    return app.response_class(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
+# Set by serve.py: with several worker processes the master reloads all of them
+model_reload_hook = None
+
+# Hot-swap the models to a new version without restarting the app
+@app.route('/admin/reload_models', methods=['POST'])
+def reload_models():
+    if not is_admin_request():
+        return jsonify({"success": False, "message": "Forbidden"}), 403
+
+    data = request.get_json(silent=True) or {}
+    if model_reload_hook is not None:
+        model_reload_hook(data.get('model_dir'), data.get('version'))
+        return jsonify({"success": True, "message": "Reloading the models of every worker"}), 202
+    try:
+        models = get_registry().load(model_dir=data.get('model_dir'), version=data.get('version'))
+    except Exception as e:
+        # The previous version stays active if the new one can't be loaded
+        return jsonify({"success": False, "message": f"Model loading failed: {e}"}), 500
+
+    return jsonify({"success": True, "version": models.version})
 
 # Route to add plant to user's plant list
 @app.route('/add_plant', methods=['POST'])
@@ -173,75 +466,70 @@ def add_plant():
     data = request.get_json()
     print(data)
     username = session['username']
-    plants_data = load_plant_data()
-    for key, value in plants_data.items():
-        if value.get('mapping_name') == data.get('name'):
-            plant_name = key
+    plant_name = get_plant_catalog().key_for_mapping_name(data.get('name'))
+    if plant_name is None:
+        return jsonify({"success": False, "message": "Plant not found"}), 404
     plant_image = data.get('image')
     plant_nickname = data.get('nickname')
 
-    # Load the existing user plants
-    user_plants = read_user_plants()
-
-    # Add plant to the user's list
-    if username not in user_plants:
-        user_plants[username] = []
-    
-    # Add plant to user's list if it doesn't already exist
-    user_plants[username].append({
-        'name': plant_name,
-        'image': plant_image,
-        'nickname': plant_nickname
-    })
-
-    # Save the updated list
-    save_user_plants(user_plants)
+    # Add plant to the user's list (a single-row insert)
+    user_store.add_user_plant(username, plant_name, plant_image, plant_nickname)
 
     return jsonify({"success": True, "message": f"Plant {plant_name} added successfully!"})
 
-# Load plant data from the corrected_species_data.json file
+# Load plant data from the corrected_species_data.json file (kept in memory, reloaded when the file changes)
 def load_plant_data():
-    with open('corrected_species_data.json', 'r') as file:
-        return json.load(file)
+    return get_plant_catalog().all()
+
 # Route to fetch plant details
 @app.route('/plant_details/<plant_name>', methods=['GET'])
 def plant_details(plant_name):
-    plant_data = load_plant_data()
-
-    # Find plant details by plant_name
-    plant_info = plant_data.get(plant_name)
-    
-    if plant_info:
-        print (jsonify({
-            "success": True,
-            "description": plant_info.get('description', {}),
-            "details": plant_info.get('details', {}),
-            "care_info": plant_info.get('care_info', {})
-        }))
-        return jsonify({
-            "success": True,
-            "description": plant_info.get('description', {}),
-            "details": plant_info.get('details', {}),
-            "care_info": plant_info.get('care_info', {})
-        })
-    else:
+    # Find the pre-serialized plant details by plant_name
+    details = get_plant_catalog().details_response(plant_name)
+
+    if details is None:
         return jsonify({"success": False, "message": "Plant not found"}), 404
-    
+
+    body, etag = details
+    response = app.response_class(body, mimetype='application/json')
+    # Browsers revalidate with the ETag and get a 304 while the care info is unchanged
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+# Submitted names are buffered and appended to submitted_plants.json in batches
+submission_log = SubmissionLog('submitted_plants.json',
+                               flush_interval=float(os.environ.get('GREENSPACE_SUBMIT_FLUSH_INTERVAL', 2)),
+                               durability=os.environ.get('GREENSPACE_SUBMIT_DURABILITY', 'batch'))
+
 @app.route('/submit_plant_name', methods=['POST'])
 def submit_plant_name():
     print('SUBMIT_PLANT_NAME STARTED')
     data = request.get_json()
     plant_name = data.get('plant_name')
+    if plant_name is not None and not isinstance(plant_name, str):
+        return jsonify({"success": False, "message": "Plant name must be a string."}), 400
 
     if plant_name:
         # Here, save the plant name for future AI training, for example, storing it in a file.
-        with open('submitted_plants.json', 'a') as file:
-            file.write(json.dumps({"plant_name": plant_name}) + "\n")
+        # upload_id links the name to the kept upload (see X-Upload-Id of /recognize).
+        submission = {"plant_name": plant_name}
+        if data.get('upload_id'):
+            submission['upload_id'] = data.get('upload_id')
+        submission_log.submit(submission)
         
         return jsonify({"success": True, "message": "Plant name submitted successfully."})
     else:
         return jsonify({"success": False, "message": "Plant name is required."}), 400
 
+# Most submitted plant names, for the administrators
+@app.route('/admin/submitted_plants')
+def submitted_plants_summary():
+    if not is_admin_request():
+        return jsonify({"success": False, "message": "Forbidden"}), 403
+    limit = request.args.get('limit', 20, type=int)
+    return jsonify(submission_log.summary(limit))
+
 # Route to load predefined nicknames
 @app.route('/get_nicknames/<category>')
 def get_nicknames(category):    
@@ -254,8 +542,7 @@ def get_nicknames(category):
 def main_page():
     if 'username' in session:  # Check if the user is logged in by checking if the username is stored in the session
         username = session['username']  # Retrieve the username from the session
-        user_plants = read_user_plants( )
-        plants = user_plants.get(username)  # Fetch plants for the user 
+        plants = user_store.get_user_plants(username) or None  # Fetch plants for the user 
         return render_template('index.html', username=username, plants=plants)
     else:
         flash('Please log in to access this page.', 'danger')
@@ -0,0 +1,177 @@
+import math
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from metrics import registry as metrics_registry, current_profiles, recording_to, record
+
+BATCH_SIZE = metrics_registry.histogram('greenspace_batch_size', 'Number of items processed per batch',
+                                        buckets=(1, 2, 4, 8, 16, 32, 64))
+REJECTED = metrics_registry.counter('greenspace_batcher_rejected_total',
+                                    'Items refused (queue full) or dropped (deadline passed)', ['reason'])
+
+
+class QueueFull(Exception):
+    """
+    Raised by MicroBatcher.submit when the queue is full.
+
+    Attributes:
+    - retry_after: Estimated number of seconds until the queue has room again.
+    """
+    def __init__(self, retry_after):
+        super().__init__(f"The queue is full, retry in {retry_after} s")
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(FutureTimeoutError):
+    # The result wasn't ready before the deadline of the item
+    pass
+
+
+class MicroBatcher:
+    """
+    Gathers concurrent requests into small batches for a pool of worker threads.
+
+    A worker waits for the first request, then keeps collecting for up to
+    max_wait_ms or until max_batch_size requests are queued, and passes the
+    whole batch to process_batch. process_batch gets a list of items and
+    must return a list of results in the same order.
+
+    The queue holds at most max_queue items (0: unbounded); submit raises
+    QueueFull instead of letting the backlog grow. An item may have a deadline:
+    once it has passed, the item is dropped from the queue instead of being
+    processed, and the caller waiting for it gets DeadlineExceeded.
+
+    The time an item waited in the queue is recorded as the 'batch_wait'
+    stage, and the stages timed while processing a batch are added to the
+    profiles of all the requests in it.
+    """
+    def __init__(self, process_batch, max_batch_size=16, max_wait_ms=5, max_queue=0, workers=1):
+        self.process_batch = process_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.max_queue = max(0, int(max_queue))
+        self.workers = max(1, int(workers))
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._threads = []
+        self._lock = threading.Lock()
+        self._batch_seconds = None  # moving average of the processing time of a batch
+        self._busy = 0
+
+    def submit(self, item, deadline=None):
+        """
+        Queues one item for the next batch.
+
+        Parameters:
+        - item: The item passed to process_batch.
+        - deadline: Optional time.monotonic() value after which the result is no longer needed.
+
+        Returns:
+        - A Future with the result of this item.
+        """
+        self._ensure_workers()
+        future = Future()
+        try:
+            self._queue.put_nowait((item, future, current_profiles(), time.perf_counter(), deadline))
+        except queue.Full:
+            REJECTED.inc('queue_full')
+            raise QueueFull(self.retry_after())
+        return future
+
+    def __call__(self, item, timeout=None):
+        """
+        Blocking call: queues the item and waits for its own result.
+
+        Raises QueueFull when the queue is full and DeadlineExceeded when the
+        result isn't ready within timeout seconds.
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        future = self.submit(item, deadline)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            # Still queued: the worker will skip it. Already running: the result is dropped.
+            future.cancel()
+            raise DeadlineExceeded(f"No result within {timeout} s")
+
+    def retry_after(self):
+        # Seconds until the items queued now should be processed (at least 1)
+        with self._lock:
+            batch_seconds = self._batch_seconds or 0.0
+        batches = math.ceil(self._queue.qsize() / self.max_batch_size) + 1
+        return max(1, math.ceil(batches * batch_seconds / self.workers))
+
+    def stats(self):
+        with self._lock:
+            return {"queued": self._queue.qsize(), "max_queue": self.max_queue, "workers": self.workers,
+                    "busy_workers": self._busy, "batch_seconds": self._batch_seconds}
+
+    def _ensure_workers(self):
+        if self._threads:
+            return
+        with self._lock:
+            if not self._threads:
+                for number in range(self.workers):
+                    thread = threading.Thread(target=self._run, name=f'micro-batcher-{number}', daemon=True)
+                    thread.start()
+                    self._threads.append(thread)
+
+    def _take(self, timeout=None):
+        # Next item that is still wanted; expired and cancelled items are dropped on the way
+        end = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            remaining = None if end is None else end - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                raise queue.Empty
+            entry = self._queue.get(timeout=remaining)
+            future, deadline = entry[1], entry[4]
+            if deadline is not None and time.monotonic() >= deadline:
+                REJECTED.inc('deadline')
+                if future.set_running_or_notify_cancel():
+                    future.set_exception(DeadlineExceeded("The deadline passed while the item was queued"))
+                continue
+            if future.set_running_or_notify_cancel():
+                return entry
+
+    def _collect_batch(self):
+        batch = [self._take()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._take(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            items = [item for item, _, _, _, _ in batch]
+            profiles = [profile for _, _, item_profiles, _, _ in batch for profile in item_profiles or ()]
+
+            started = time.perf_counter()
+            BATCH_SIZE.observe(len(batch))
+            with self._lock:
+                self._busy += 1
+            try:
+                with recording_to(profiles):
+                    for _, _, item_profiles, submitted, _ in batch:
+                        with recording_to(item_profiles or ()):
+                            record('batch_wait', started - submitted)
+                    try:
+                        results = self.process_batch(items)
+                    except Exception as e:
+                        for _, future, _, _, _ in batch:
+                            future.set_exception(e)
+                        continue
+                for (_, future, _, _, _), result in zip(batch, results):
+                    future.set_result(result)
+            finally:
+                elapsed = time.perf_counter() - started
+                with self._lock:
+                    self._busy -= 1
+                    self._batch_seconds = elapsed if self._batch_seconds is None \
+                        else 0.8 * self._batch_seconds + 0.2 * elapsed
@@ -0,0 +1,354 @@
+import os
+import sys
+import json
+import time
+import shutil
+import pickle
+import platform
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Latency and throughput of the recognition pipeline, stage by stage and through /recognize.
+#
+#   python benchmark_recognition.py --resolutions 256 1024 3024x4032 --concurrency 1 4 8 --output bench.json
+#   python benchmark_recognition.py --compare bench_before.json bench.json
+#
+# Run it from the project directory. When the model files are missing, small stand-in
+# models are trained on synthetic images, so it also runs offline and in CI.
+
+from model_registry import RF_MODEL_FILE, CATEGORY_MODEL_FILES, IMG_SIZE
+
+STAGES = ('extract_features', 'prediction_class', 'prediction_species', 'recognize_plant', 'endpoint')
+DEFAULT_RESOLUTIONS = ('256', '1024', '3024x4032')
+
+
+def parse_resolution(text):
+    # "1024" -> (1024, 1024), "3024x4032" -> (3024, 4032) as (width, height)
+    width, _, height = text.lower().partition('x')
+    return int(width), int(height or width)
+
+
+def synthetic_plant_image(width, height, seed=0):
+    """
+    Draws a plant-like photo: a wall, a pot and green leaves (some with flowers).
+
+    Returns:
+    - uint8 BGR array of shape (height, width, 3).
+    """
+    import cv2
+
+    rng = np.random.RandomState(seed)
+    image = np.empty((height, width, 3), dtype=np.uint8)
+    wall = rng.randint(150, 240, size=3)
+    image[:] = wall
+
+    # Pot
+    pot_color = tuple(int(c) for c in rng.randint(40, 140, size=3))
+    pot_top = int(height * 0.65)
+    points = np.array([[width * 0.3, pot_top], [width * 0.7, pot_top],
+                       [width * 0.62, height * 0.95], [width * 0.38, height * 0.95]], dtype=np.int32)
+    cv2.fillConvexPoly(image, points, pot_color)
+
+    # Leaves around the top of the pot
+    scale = min(width, height)
+    for _ in range(rng.randint(15, 40)):
+        center = (int(width * rng.uniform(0.2, 0.8)), int(pot_top - scale * rng.uniform(0.0, 0.5)))
+        axes = (max(1, int(scale * rng.uniform(0.04, 0.12))), max(1, int(scale * rng.uniform(0.015, 0.04))))
+        green = (int(rng.randint(10, 90)), int(rng.randint(90, 220)), int(rng.randint(10, 100)))
+        cv2.ellipse(image, center, axes, float(rng.uniform(0, 180)), 0, 360, green, -1)
+
+    # Flowers on some of the images
+    if rng.rand() < 0.5:
+        flower = tuple(int(c) for c in rng.randint(0, 256, size=3))
+        for _ in range(rng.randint(3, 10)):
+            center = (int(width * rng.uniform(0.25, 0.75)), int(pot_top - scale * rng.uniform(0.1, 0.5)))
+            cv2.circle(image, center, max(1, int(scale * rng.uniform(0.01, 0.03))), flower, -1)
+
+    noise = rng.normal(0, 6, size=image.shape)
+    return np.clip(image + noise, 0, 255).astype(np.uint8)
+
+
+def write_images(resolutions, count, directory):
+    """
+    Writes count JPEG images per resolution.
+
+    Returns:
+    - Dictionary resolution label -> list of (path, bytes).
+    """
+    import cv2
+
+    images = {}
+    for label in resolutions:
+        width, height = parse_resolution(label)
+        images[label] = []
+        for i in range(count):
+            ok, encoded = cv2.imencode('.jpg', synthetic_plant_image(width, height, seed=i),
+                                       [cv2.IMWRITE_JPEG_QUALITY, 90])
+            path = os.path.join(directory, f'synthetic_{label}_{i}.jpg')
+            with open(path, 'wb') as file:
+                file.write(encoded.tobytes())
+            images[label].append((path, encoded.tobytes()))
+    return images
+
+
+def models_available(model_dir):
+    files = [RF_MODEL_FILE] + [model_file for model_file, _ in CATEGORY_MODEL_FILES.values()]
+    return all(os.path.exists(os.path.join(model_dir, file)) for file in files)
+
+
+def build_stand_in_models(directory, source_dir='.'):
+    """
+    Trains a small RF and four tiny CNNs with the same inputs and outputs as the
+    real models, and saves them with the real file names in directory.
+    The class_indices_*.json files are copied from source_dir.
+    """
+    import tensorflow as tf
+    from sklearn.ensemble import RandomForestClassifier
+    from preprocessing import prepare_rgb
+
+    os.makedirs(os.path.join(directory, 'saved_models'), exist_ok=True)
+
+    # RF on histograms of synthetic images with random categories
+    rng = np.random.RandomState(0)
+    features = np.stack([prepare_rgb(synthetic_plant_image(256, 256, seed=i)[:, :, ::-1]).hist_features
+                         for i in range(40)])
+    categories = np.arange(len(features)) % len(CATEGORY_MODEL_FILES)
+    rf_model = RandomForestClassifier(n_estimators=20, random_state=0).fit(features, categories)
+    with open(os.path.join(directory, RF_MODEL_FILE), 'wb') as file:
+        pickle.dump(rf_model, file)
+
+    for model_file, class_indices_file in CATEGORY_MODEL_FILES.values():
+        shutil.copy(os.path.join(source_dir, class_indices_file), directory)
+        with open(os.path.join(directory, class_indices_file), 'r') as file:
+            num_classes = len(json.load(file))
+
+        model = tf.keras.Sequential([
+            tf.keras.layers.Input(shape=(IMG_SIZE, IMG_SIZE, 3)),
+            tf.keras.layers.Conv2D(8, (3, 3), activation='relu'),
+            tf.keras.layers.MaxPool2D((4, 4)),
+            tf.keras.layers.Conv2D(16, (3, 3), activation='relu'),
+            tf.keras.layers.GlobalAveragePooling2D(),
+            tf.keras.layers.Dense(num_classes, activation='softmax'),
+        ])
+        model.compile(optimizer='adam', loss='sparse_categorical_crossentropy')
+        model.fit(rng.rand(8, IMG_SIZE, IMG_SIZE, 3).astype(np.float32), rng.randint(0, num_classes, 8),
+                  epochs=1, verbose=0)
+        model.save(os.path.join(directory, model_file))
+
+
+def peak_rss_mb():
+    # Peak resident memory of the process so far
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def run_stage(function, inputs, repeat, concurrency=1, warmup=2):
+    """
+    Calls function on the inputs (cycled) repeat times with the given number of
+    concurrent callers.
+
+    Returns:
+    - Dictionary with the latency percentiles in ms, the throughput and the peak RSS.
+    """
+    for i in range(min(warmup, repeat)):
+        function(inputs[i % len(inputs)])
+
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def call(i):
+        nonlocal errors
+        start = time.perf_counter()
+        try:
+            ok = function(inputs[i % len(inputs)]) is not False
+        except Exception as e:
+            print(f"Benchmark call failed: {e}")
+            ok = False
+        elapsed = (time.perf_counter() - start) * 1000
+        with lock:
+            latencies.append(elapsed)
+            if not ok:
+                errors += 1
+
+    start = time.perf_counter()
+    if concurrency <= 1:
+        for i in range(repeat):
+            call(i)
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(call, range(repeat)))
+    wall = time.perf_counter() - start
+
+    latencies = np.array(latencies)
+    return {
+        "requests": repeat,
+        "errors": errors,
+        "concurrency": concurrency,
+        "latency_ms_p50": round(float(np.percentile(latencies, 50)), 3),
+        "latency_ms_p95": round(float(np.percentile(latencies, 95)), 3),
+        "latency_ms_p99": round(float(np.percentile(latencies, 99)), 3),
+        "latency_ms_mean": round(float(latencies.mean()), 3),
+        "throughput_per_s": round(repeat / wall, 2),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def make_stage_functions(models, rf_model_path, images):
+    # Each stage on its own, with the resident models (no model loading in the timings)
+    import functions
+
+    # The category of every image is computed up front, so only the CNN stage is timed
+    categories = {path: functions.prediction_class(rf_model_path, path, model=models.rf_model)
+                  for label_images in images.values() for path, _ in label_images}
+
+    def species_stage(image):
+        category_result = categories[image[0]]
+        return functions.prediction_species(category_result, image[0],
+                                            model=models.category_models[category_result],
+                                            indices_to_labels=models.class_indices[category_result]) is not None
+
+    return {
+        'extract_features': lambda image: functions.extract_features(image[0]) is not None,
+        'prediction_class': lambda image: functions.prediction_class(rf_model_path, image[0],
+                                                                     model=models.rf_model) is not None,
+        'prediction_species': species_stage,
+        'recognize_plant': lambda image: functions.recognize_plant(image[0]) is not None,
+    }
+
+
+def make_endpoint_function(app):
+    # POST /recognize through the Flask test client, one client per thread
+    import io
+
+    local = threading.local()
+
+    def post(image):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = app.test_client()
+        response = client.post('/recognize', data={'file': (io.BytesIO(image[1]), 'plant.jpg')},
+                               content_type='multipart/form-data')
+        return response.status_code == 200
+
+    return post
+
+
+def run_benchmarks(args):
+    model_dir = os.environ.get('GREENSPACE_MODEL_DIR', '.')
+    work_dir = tempfile.mkdtemp(prefix='greenspace_bench_')
+    try:
+        stand_in = args.stand_in or not models_available(model_dir)
+        if stand_in:
+            print("Model files not found, training small stand-in models")
+            build_stand_in_models(os.path.join(work_dir, 'models'))
+            model_dir = os.path.join(work_dir, 'models')
+
+        # Configure the app before importing it: lazy models, a throwaway user
+        # database and no result cache (the same images are sent many times)
+        os.environ['GREENSPACE_MODEL_DIR'] = model_dir
+        os.environ.setdefault('GREENSPACE_MODEL_PRELOAD', 'lazy')
+        os.environ.setdefault('GREENSPACE_DB', os.path.join(work_dir, 'bench.db'))
+        if not args.cache:
+            os.environ['GREENSPACE_CACHE_SIZE'] = '0'
+
+        from model_registry import get_registry
+        models = get_registry().load(model_dir)
+        rf_model_path = os.path.join(model_dir, RF_MODEL_FILE)
+
+        images = write_images(args.resolutions, args.images, work_dir)
+        stage_functions = make_stage_functions(models, rf_model_path, images)
+
+        results = []
+        for stage in args.stages:
+            for label in args.resolutions:
+                if stage == 'endpoint':
+                    from app import app
+                    function = make_endpoint_function(app)
+                    levels = args.concurrency
+                else:
+                    function = stage_functions[stage]
+                    levels = [1]
+                for concurrency in levels:
+                    result = run_stage(function, images[label], args.repeat, concurrency)
+                    result.update({"stage": stage, "resolution": label})
+                    results.append(result)
+                    print(format_result(result))
+
+        return {
+            "created": time.strftime('%Y-%m-%dT%H:%M:%S'),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "models": "stand-in" if stand_in else model_dir,
+            "inference_backend": get_registry().backend,
+            "rf_backend": get_registry().rf_backend,
+            "species_model": get_registry().species_model,
+            "repeat": args.repeat,
+            "results": results,
+        }
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def format_result(result):
+    return (f"{result['stage']:>18} {result['resolution']:>10} x{result['concurrency']:<3} "
+            f"p50 {result['latency_ms_p50']:>9.2f} ms  p95 {result['latency_ms_p95']:>9.2f} ms  "
+            f"p99 {result['latency_ms_p99']:>9.2f} ms  {result['throughput_per_s']:>8.2f}/s  "
+            f"peak RSS {result['peak_rss_mb']} MB" + (f"  errors {result['errors']}" if result['errors'] else ''))
+
+
+def compare(before_file, after_file):
+    # Prints the change of p50/p95 and throughput for every stage found in both runs
+    with open(before_file, 'r') as file:
+        before = {(r['stage'], r['resolution'], r['concurrency']): r for r in json.load(file)['results']}
+    with open(after_file, 'r') as file:
+        after = json.load(file)['results']
+
+    def change(old, new):
+        return f"{(new - old) / old * 100:+.1f}%" if old else 'n/a'
+
+    for result in after:
+        old = before.get((result['stage'], result['resolution'], result['concurrency']))
+        if old is None:
+            continue
+        print(f"{result['stage']:>18} {result['resolution']:>10} x{result['concurrency']:<3} "
+              f"p50 {change(old['latency_ms_p50'], result['latency_ms_p50']):>8}  "
+              f"p95 {change(old['latency_ms_p95'], result['latency_ms_p95']):>8}  "
+              f"throughput {change(old['throughput_per_s'], result['throughput_per_s']):>8}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the recognition pipeline.")
+    parser.add_argument('--resolutions', nargs='+', default=list(DEFAULT_RESOLUTIONS),
+                        help="Image sizes, e.g. 1024 or 3024x4032 (width x height)")
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=list(STAGES))
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 4],
+                        help="Concurrent clients for the endpoint benchmark")
+    parser.add_argument('--repeat', type=int, default=50, help="Calls per stage and resolution")
+    parser.add_argument('--images', type=int, default=5, help="Distinct images per resolution")
+    parser.add_argument('--stand-in', action='store_true', help="Use stand-in models even if the real ones exist")
+    parser.add_argument('--cache', action='store_true', help="Keep the result cache of /recognize enabled")
+    parser.add_argument('--output', help="Write the results to this JSON file")
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help="Compare two result files")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+    else:
+        report = run_benchmarks(args)
+        if args.output:
+            with open(args.output, 'w') as file:
+                json.dump(report, file, indent=4)
+            print(f"Results saved to {args.output}")
@@ -0,0 +1,162 @@
+import os
+import json
+import argparse
+import numpy as np
+
+# Flattened, array-backed version of the first stage RandomForest.
+#
+#   python compiled_forest.py saved_models/rf_classifier_model.pkl saved_models/rf_compiled --check
+#
+# The app uses it with GREENSPACE_RF_BACKEND=compiled.
+
+COMPILED_RF_DIR = os.path.join('saved_models', 'rf_compiled')
+ARRAYS = ('feature', 'threshold', 'left', 'right', 'value', 'roots')
+
+
+class CompiledForest:
+    """
+    All trees of the forest in contiguous NumPy arrays (one entry per node).
+
+    Leaves point to themselves, so walking a batch of rows through every tree
+    is max_depth vectorized steps. predict() gives exactly the same classes as
+    sklearn's RandomForestClassifier.predict.
+
+    Attributes:
+    - feature, threshold: Split of each node (feature 0 and threshold inf for leaves).
+    - left, right: Children of each node (global node indices).
+    - value: Class probabilities of each node.
+    - roots: Root node of each tree.
+    - classes: The class labels.
+    """
+    def __init__(self, feature, threshold, left, right, value, roots, classes, n_features, max_depth):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.classes_ = np.asarray(classes)
+        self.n_features_in_ = n_features
+        self.max_depth = max_depth
+
+    @classmethod
+    def from_sklearn(cls, forest):
+        """
+        Flattens a fitted sklearn RandomForestClassifier.
+        """
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            n_nodes = tree.node_count
+            node_ids = np.arange(n_nodes)
+            is_leaf = tree.children_left == -1
+
+            # Leaves point to themselves, children are shifted to global indices
+            lefts.append(np.where(is_leaf, node_ids, tree.children_left) + offset)
+            rights.append(np.where(is_leaf, node_ids, tree.children_right) + offset)
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(np.where(is_leaf, np.inf, tree.threshold))
+
+            # Same normalization as DecisionTreeClassifier.predict_proba
+            value = tree.value[:, 0, :].astype(np.float64)
+            normalizer = value.sum(axis=1, keepdims=True)
+            normalizer[normalizer == 0.0] = 1.0
+            values.append(value / normalizer)
+
+            roots.append(offset)
+            offset += n_nodes
+            max_depth = max(max_depth, tree.max_depth)
+
+        return cls(np.concatenate(features).astype(np.int32),
+                   np.concatenate(thresholds).astype(np.float64),
+                   np.concatenate(lefts).astype(np.int32),
+                   np.concatenate(rights).astype(np.int32),
+                   np.concatenate(values),
+                   np.array(roots, dtype=np.int32),
+                   forest.classes_.tolist(), int(forest.n_features_in_), int(max_depth))
+
+    def apply(self, X):
+        """
+        Returns the leaf reached in every tree: array of shape (rows, trees).
+        """
+        # sklearn compares float32 features with float64 thresholds
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        rows = np.arange(len(X))[:, np.newaxis]
+        nodes = np.broadcast_to(self.roots, (len(X), len(self.roots))).copy()
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return nodes
+
+    def predict_proba(self, X):
+        leaves = self.apply(X)
+        # Sum the trees in order, like sklearn, then average
+        proba = np.zeros((leaves.shape[0], self.value.shape[1]), dtype=np.float64)
+        for tree in range(leaves.shape[1]):
+            proba += self.value[leaves[:, tree]]
+        return proba / leaves.shape[1]
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+    def save(self, directory):
+        # Plain .npy files (memory-mappable, no pickle) and a small JSON file
+        os.makedirs(directory, exist_ok=True)
+        for name in ARRAYS:
+            np.save(os.path.join(directory, f'{name}.npy'), getattr(self, name), allow_pickle=False)
+        meta = {"classes": self.classes_.tolist(), "n_features": self.n_features_in_, "max_depth": self.max_depth}
+        with open(os.path.join(directory, 'forest.json'), 'w') as file:
+            json.dump(meta, file, indent=4)
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """
+        Loads a saved forest. With mmap the arrays are memory-mapped: loading is
+        instant and worker processes share the pages.
+        """
+        with open(os.path.join(directory, 'forest.json'), 'r') as file:
+            meta = json.load(file)
+        arrays = {name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r' if mmap else None,
+                                allow_pickle=False)
+                  for name in ARRAYS}
+        return cls(classes=meta["classes"], n_features=meta["n_features"], max_depth=meta["max_depth"], **arrays)
+
+
+def check_against_sklearn(forest, compiled, X):
+    # Returns the number of rows where the predictions differ
+    return int(np.sum(forest.predict(X) != compiled.predict(X)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert the pickled RandomForest to the compiled array format.")
+    parser.add_argument('model', nargs='?', default=os.path.join('saved_models', 'rf_classifier_model.pkl'))
+    parser.add_argument('output', nargs='?', default=COMPILED_RF_DIR)
+    parser.add_argument('--check', action='store_true', help="Compare the predictions with sklearn")
+    parser.add_argument('--features', default='val_features.pkl',
+                        help="Pickled feature matrix used by --check (random histograms if missing)")
+    args = parser.parse_args()
+
+    import pickle
+    with open(args.model, 'rb') as file:
+        forest = pickle.load(file)
+
+    compiled = CompiledForest.from_sklearn(forest)
+    compiled.save(args.output)
+    print(f"Saved {len(compiled.roots)} trees ({len(compiled.feature)} nodes, depth {compiled.max_depth}) to {args.output}")
+
+    if args.check:
+        compiled = CompiledForest.load(args.output)
+        if os.path.exists(args.features):
+            with open(args.features, 'rb') as file:
+                X = np.asarray(pickle.load(file))
+        else:
+            # Histograms of random 256x256 images
+            X = np.random.RandomState(0).multinomial(65536, np.ones(256) / 256, size=(1000, 3)).reshape(1000, -1)
+        mismatches = check_against_sklearn(forest, compiled, X)
+        print(f"Checked {len(X)} rows: {mismatches} predictions differ from sklearn")
+        if mismatches:
+            raise SystemExit(1)
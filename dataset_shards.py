@@ -0,0 +1,319 @@
+import os
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from model_registry import CATEGORY_MODEL_FILES, CATEGORY_NAMES, IMG_SIZE
+
+# Preprocessed training set for the category CNNs.
+#
+#   python dataset_shards.py compile                 # decode and resize every image once
+#   python dataset_shards.py train --epochs 30       # train the four category models in one pass per epoch
+#
+# Every image of image_data.csv is decoded once, resized to 128x128 the same way the
+# app does it (preprocessing.prepare_rgb) and stored as uint8 in fixed-length records:
+#
+#   category (int16) | class index in the category (int16) | subset (int16, 0 train, 1 validation) | pixels
+#
+# The shards can be memory-mapped with numpy (RECORD_DTYPE) or read natively by
+# tf.data.FixedLengthRecordDataset, so the training input pipeline doesn't run Python.
+
+SHARD_DIR = 'dataset_shards'
+MANIFEST_FILE = 'manifest.json'
+SHARD_SIZE = 2048  # images per shard, about 100 MB
+
+RECORD_DTYPE = np.dtype([('category', '<i2'), ('class_index', '<i2'), ('subset', '<i2'),
+                         ('image', 'u1', (IMG_SIZE, IMG_SIZE, 3))])
+LABEL_BYTES = 6
+
+
+def split_rows(rows, validation_split=0.2):
+    """
+    Marks the validation images like train_model's flow_from_directory does:
+    per species the sorted files, the first 20% are the validation subset.
+
+    Returns:
+    - List of (image path, category, class index, subset).
+    """
+    by_species = {}
+    for path, category, class_index in rows:
+        by_species.setdefault(os.path.dirname(path), []).append((path, category, class_index))
+
+    split = []
+    for species_dir in sorted(by_species):
+        images = sorted(by_species[species_dir])
+        validation = int(validation_split * len(images))
+        split += [(path, category, class_index, int(i < validation))
+                  for i, (path, category, class_index) in enumerate(images)]
+    return split
+
+
+def load_training_image(path):
+    # uint8 128x128 RGB, preprocessed exactly like the images the app recognizes (None if unreadable)
+    from preprocessing import decode_image, to_rgb
+    import cv2
+
+    try:
+        with open(path, 'rb') as file:
+            image_rgb = decode_image(file.read())
+    except OSError as e:
+        print(f"Image not found or corrupted: {path} ({e})")
+        return None
+    if image_rgb is None:
+        print(f"Image not found or corrupted: {path}")
+        return None
+    return cv2.resize(to_rgb(image_rgb), (IMG_SIZE, IMG_SIZE), interpolation=cv2.INTER_NEAREST_EXACT)
+
+
+def compile_shards(shard_dir=SHARD_DIR, csv_file='image_data.csv', base_dir='house_plant_species',
+                   validation_split=0.2, shard_size=SHARD_SIZE, workers=None):
+    """
+    Decodes, resizes and writes the whole dataset into shards.
+
+    Returns:
+    - The manifest (shard files, image counts, species of every category).
+    """
+    from multihead_model import read_dataset
+
+    rows, species = read_dataset(csv_file, base_dir)
+    rows = split_rows(rows, validation_split)
+    os.makedirs(shard_dir, exist_ok=True)
+
+    # Shards of a previous compile are replaced when the new manifest is written
+    generation = str(time.time_ns())
+    shards = []
+    counts = {name: {'training': 0, 'validation': 0} for name in CATEGORY_NAMES.values()}
+    failed = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for start in range(0, len(rows), shard_size):
+            chunk = rows[start:start + shard_size]
+            images = list(executor.map(load_training_image, [row[0] for row in chunk], chunksize=16))
+            records = np.zeros(sum(image is not None for image in images), dtype=RECORD_DTYPE)
+            i = 0
+            for (path, category, class_index, subset), image in zip(chunk, images):
+                if image is None:
+                    failed += 1
+                    continue
+                records[i] = (category, class_index, subset, image)
+                counts[CATEGORY_NAMES[category]]['validation' if subset else 'training'] += 1
+                i += 1
+
+            file_name = f'shard_{generation}_{len(shards):05d}.bin'
+            records.tofile(os.path.join(shard_dir, file_name))
+            shards.append({"file": file_name, "count": len(records)})
+            print(f"Wrote {file_name}: {len(records)} images")
+
+    manifest = {
+        "img_size": IMG_SIZE,
+        "record_bytes": RECORD_DTYPE.itemsize,
+        "validation_split": validation_split,
+        "shards": shards,
+        "counts": counts,
+        "failed": failed,
+        "species": {CATEGORY_NAMES[category]: labels for category, labels in species.items()},
+    }
+    tmp_path = os.path.join(shard_dir, f'{MANIFEST_FILE}.{os.getpid()}.tmp')
+    with open(tmp_path, 'w') as file:
+        json.dump(manifest, file, indent=4)
+    os.replace(tmp_path, os.path.join(shard_dir, MANIFEST_FILE))
+
+    current = {shard['file'] for shard in shards}
+    for file_name in os.listdir(shard_dir):
+        if file_name.startswith('shard_') and file_name not in current:
+            os.remove(os.path.join(shard_dir, file_name))
+    return manifest
+
+
+def load_manifest(shard_dir=SHARD_DIR):
+    with open(os.path.join(shard_dir, MANIFEST_FILE), 'r') as file:
+        return json.load(file)
+
+
+def open_shards(shard_dir=SHARD_DIR):
+    # The shards as memory-mapped numpy record arrays (for inspection or other frameworks)
+    manifest = load_manifest(shard_dir)
+    return [np.memmap(os.path.join(shard_dir, shard['file']), dtype=RECORD_DTYPE, mode='r')
+            for shard in manifest['shards'] if shard['count']]
+
+
+def make_augmentation():
+    # The augmentation of train_model's ImageDataGenerator, as Keras layers working on batches of tensors
+    from tensorflow.keras import layers, Sequential
+
+    return Sequential([
+        layers.RandomRotation(30 / 360, fill_mode='nearest'),
+        layers.RandomZoom(0.2, fill_mode='nearest'),
+        layers.RandomTranslation(0.1, 0.1, fill_mode='nearest'),
+        layers.RandomFlip('horizontal'),
+    ])
+
+
+def make_dataset(shard_dir=SHARD_DIR, subset='training', category=None, batch_size=128, augment=None,
+                 cache=True, shuffle_buffer=4096):
+    """
+    tf.data pipeline over the shards.
+
+    Parameters:
+    - subset: 'training' or 'validation'.
+    - category: Only the images of this category_result (default: all categories).
+    - augment: Apply the random augmentation (default: for the training subset).
+    - cache: Keep the decoded records in memory after the first epoch.
+
+    Returns:
+    - A dataset of (float32 images in [0, 1], category, class index) batches.
+    """
+    import tensorflow as tf
+
+    manifest = load_manifest(shard_dir)
+    files = [os.path.join(shard_dir, shard['file']) for shard in manifest['shards'] if shard['count']]
+    img_size = manifest['img_size']
+    training = subset == 'training'
+    if augment is None:
+        augment = training
+
+    def parse(record):
+        data = tf.io.decode_raw(record, tf.uint8)
+        labels = tf.bitcast(tf.reshape(data[:LABEL_BYTES], (3, 2)), tf.int16)
+        image = tf.reshape(data[LABEL_BYTES:], (img_size, img_size, 3))
+        return image, tf.cast(labels[0], tf.int32), tf.cast(labels[1], tf.int32), labels[2]
+
+    dataset = tf.data.FixedLengthRecordDataset(files, manifest['record_bytes'],
+                                               num_parallel_reads=tf.data.AUTOTUNE)
+    dataset = dataset.map(parse, num_parallel_calls=tf.data.AUTOTUNE)
+    wanted_subset = 0 if training else 1
+    dataset = dataset.filter(lambda image, c, class_index, s: tf.equal(s, wanted_subset))
+    if category is not None:
+        dataset = dataset.filter(lambda image, c, class_index, s: tf.equal(c, category))
+    dataset = dataset.map(lambda image, c, class_index, s: (image, c, class_index))
+    if cache:
+        dataset = dataset.cache()
+    if training:
+        dataset = dataset.shuffle(shuffle_buffer, seed=0, reshuffle_each_iteration=True)
+    dataset = dataset.batch(batch_size)
+
+    augmentation = make_augmentation() if augment else None
+
+    def to_float(images, categories, class_indices):
+        images = tf.cast(images, tf.float32) / 255.0
+        if augmentation is not None:
+            images = augmentation(images, training=True)
+        return images, categories, class_indices
+
+    return dataset.map(to_float, num_parallel_calls=tf.data.AUTOTUNE).prefetch(tf.data.AUTOTUNE)
+
+
+def build_category_model(num_classes, img_size=IMG_SIZE):
+    # The model of train_model in the notebook
+    from tensorflow.keras import layers, models
+    from tensorflow.keras.optimizers import RMSprop
+
+    model = models.Sequential([layers.Input(shape=(img_size, img_size, 3))])
+    for filters, dropout in ((32, 0), (64, 0.1), (64, 0), (128, 0.2), (256, 0.2)):
+        model.add(layers.Conv2D(filters, (3, 3), strides=1, padding='same', activation='relu'))
+        if dropout:
+            model.add(layers.Dropout(dropout))
+        model.add(layers.BatchNormalization())
+        model.add(layers.MaxPool2D((2, 2), strides=2, padding='same'))
+    model.add(layers.Flatten())
+    model.add(layers.Dense(units=128, activation='relu'))
+    model.add(layers.Dropout(0.2))
+    model.add(layers.Dense(units=num_classes, activation='softmax'))
+    model.compile(optimizer=RMSprop(learning_rate=0.0001), loss='categorical_crossentropy', metrics=['accuracy'])
+    return model
+
+
+def train_all_categories(shard_dir=SHARD_DIR, output_dir='.', epochs=30, batch_size=128):
+    """
+    Trains the four category models together: every batch of the shuffled
+    training set is split by category and each part trains its own model,
+    so one pass over the shards is one epoch of all four models.
+
+    Returns:
+    - Dictionary category_result -> trained model, and the history of each epoch.
+    """
+    import tensorflow as tf
+
+    manifest = load_manifest(shard_dir)
+    num_classes = {category: len(manifest['species'][name]) for category, name in CATEGORY_NAMES.items()}
+    category_models = {category: build_category_model(num_classes[category]) for category in CATEGORY_NAMES}
+    loss_function = tf.keras.losses.CategoricalCrossentropy()
+
+    def make_train_step(model):
+        @tf.function(reduce_retracing=True)
+        def train_step(images, labels):
+            with tf.GradientTape() as tape:
+                predictions = model(images, training=True)
+                loss = loss_function(labels, predictions)
+            gradients = tape.gradient(loss, model.trainable_variables)
+            model.optimizer.apply_gradients(zip(gradients, model.trainable_variables))
+            return loss
+        return train_step
+
+    train_steps = {category: make_train_step(model) for category, model in category_models.items()}
+    train_dataset = make_dataset(shard_dir, 'training', batch_size=batch_size)
+    val_dataset = make_dataset(shard_dir, 'validation', batch_size=batch_size)
+
+    history = []
+    for epoch in range(epochs):
+        start = time.perf_counter()
+        losses = {category: tf.keras.metrics.Mean() for category in category_models}
+        for images, categories, class_indices in train_dataset:
+            for category, model in category_models.items():
+                mask = tf.equal(categories, category)
+                if not tf.reduce_any(mask):
+                    continue
+                labels = tf.one_hot(tf.boolean_mask(class_indices, mask), num_classes[category])
+                losses[category].update_state(train_steps[category](tf.boolean_mask(images, mask), labels))
+
+        correct = {category: 0 for category in category_models}
+        total = {category: 0 for category in category_models}
+        for images, categories, class_indices in val_dataset:
+            for category, model in category_models.items():
+                mask = tf.equal(categories, category)
+                if not tf.reduce_any(mask):
+                    continue
+                predictions = model(tf.boolean_mask(images, mask), training=False)
+                predicted = tf.argmax(predictions, axis=1, output_type=tf.int32)
+                correct[category] += int(tf.reduce_sum(tf.cast(tf.equal(predicted, tf.boolean_mask(class_indices, mask)), tf.int32)))
+                total[category] += int(tf.reduce_sum(tf.cast(mask, tf.int32)))
+
+        epoch_result = {CATEGORY_NAMES[category]: {
+            "loss": round(float(losses[category].result()), 4),
+            "val_accuracy": round(correct[category] / total[category], 4) if total[category] else None,
+        } for category in category_models}
+        history.append(epoch_result)
+        print(f"Epoch {epoch + 1}/{epochs} ({time.perf_counter() - start:.1f} s): " + ', '.join(
+            f"{name} loss {result['loss']} val_acc {result['val_accuracy']}" for name, result in epoch_result.items()))
+
+    os.makedirs(output_dir, exist_ok=True)
+    for category, model in category_models.items():
+        model_file = os.path.join(output_dir, CATEGORY_MODEL_FILES[category][0])
+        model.save(model_file)
+        print(f'Model saved as {model_file}')
+    return category_models, history
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Preprocessed, sharded dataset for the category models.")
+    parser.add_argument('--shards', default=SHARD_DIR)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    compile_parser = subparsers.add_parser('compile', help="Decode and resize the dataset into shards")
+    compile_parser.add_argument('--csv', default='image_data.csv')
+    compile_parser.add_argument('--base-dir', default='house_plant_species')
+    compile_parser.add_argument('--shard-size', type=int, default=SHARD_SIZE)
+    compile_parser.add_argument('--workers', type=int, default=None, help="Number of processes (default: all cores)")
+    train_parser = subparsers.add_parser('train', help="Train the four category models from the shards")
+    train_parser.add_argument('--epochs', type=int, default=30)
+    train_parser.add_argument('--batch-size', type=int, default=128,
+                              help="Images per batch over all categories (about 32 per category)")
+    train_parser.add_argument('--output-dir', default='trained_models')
+    args = parser.parse_args()
+
+    if args.command == 'compile':
+        manifest = compile_shards(args.shards, args.csv, args.base_dir, shard_size=args.shard_size,
+                                  workers=args.workers)
+        total = sum(shard['count'] for shard in manifest['shards'])
+        print(f"Compiled {total} images into {len(manifest['shards'])} shards ({manifest['failed']} unreadable)")
+    else:
+        train_all_categories(args.shards, args.output_dir, args.epochs, args.batch_size)
@@ -0,0 +1,142 @@
+import os
+import json
+import threading
+import time
+from metrics import timer, timed
+
+# The index is stored next to image_data.csv
+INDEX_FILE = 'example_images.json'
+BASE_DIR = 'house_plant_species'
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+
+def directory_mtimes(base_dir):
+    # Modification times of the dataset folder and of every species folder.
+    # A folder's mtime changes when files are added, removed or renamed in it.
+    mtimes = {}
+    if not os.path.isdir(base_dir):
+        return mtimes
+    mtimes['.'] = os.stat(base_dir).st_mtime
+    with os.scandir(base_dir) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                mtimes[entry.name] = entry.stat().st_mtime
+    return mtimes
+
+
+def find_example_image(label_dir):
+    # The first image of the folder (sorted, so the choice is stable)
+    try:
+        file_names = sorted(os.listdir(label_dir))
+    except OSError:
+        return None  # Directory not found
+    for file_name in file_names:
+        if file_name.lower().endswith(IMAGE_EXTENSIONS):
+            return os.path.join(label_dir, file_name)
+    return None  # No image found
+
+
+def build_index(base_dir=BASE_DIR):
+    """
+    Scans the dataset once and picks a representative image for every species.
+
+    Parameters:
+    - base_dir: The folder with one subfolder per species.
+
+    Returns:
+    - Dictionary with the species -> image path mapping and the folder mtimes.
+    """
+    mtimes = directory_mtimes(base_dir)
+    images = {}
+    for label in sorted(mtimes):
+        if label == '.':
+            continue
+        images[label] = find_example_image(os.path.join(base_dir, label))
+    return {"base_dir": base_dir, "mtimes": mtimes, "images": images}
+
+
+def save_index(index, index_file=INDEX_FILE):
+    # Write to a temporary file and rename it, so readers never see a partial file
+    tmp_file = f"{index_file}.{os.getpid()}.tmp"
+    with open(tmp_file, 'w') as file:
+        json.dump(index, file, indent=4)
+    os.replace(tmp_file, index_file)
+
+
+class ExampleImageIndex:
+    """
+    Species -> example image lookups for the result page.
+
+    The index is read from INDEX_FILE (or built if missing) and rebuilt when
+    the mtimes of the dataset folders change. The mtimes are checked at most
+    every check_interval seconds, so a lookup is normally a dictionary access.
+    """
+    def __init__(self, base_dir=BASE_DIR, index_file=INDEX_FILE, check_interval=30):
+        self.base_dir = base_dir
+        self.index_file = index_file
+        self.check_interval = check_interval
+        self._images = None
+        self._mtimes = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    @timed('example_index_load')
+    def load(self):
+        """
+        Loads the stored index, rebuilding it if it is missing or outdated.
+        """
+        with self._lock:
+            index = None
+            try:
+                with open(self.index_file, 'r') as file:
+                    index = json.load(file)
+            except (FileNotFoundError, json.JSONDecodeError):
+                pass
+
+            mtimes = directory_mtimes(self.base_dir)
+            if index is None or index.get("base_dir") != self.base_dir or index.get("mtimes") != mtimes:
+                index = build_index(self.base_dir)
+                try:
+                    save_index(index, self.index_file)
+                except OSError as e:
+                    print(f"Saving the example image index failed: {e}")
+
+            self._images = index["images"]
+            self._mtimes = index["mtimes"]
+            self._checked_at = time.monotonic()
+
+    def refresh_if_changed(self):
+        if self._images is None:
+            self.load()
+            return
+        if time.monotonic() - self._checked_at < self.check_interval:
+            return
+        self._checked_at = time.monotonic()
+        with timer('example_index_scan'):
+            mtimes = directory_mtimes(self.base_dir)
+        if mtimes != self._mtimes:
+            print("Dataset changed, rebuilding the example image index")
+            self.load()
+
+    def lookup(self, label):
+        """
+        Returns the example image path of a species (None if it has no image).
+        """
+        self.refresh_if_changed()
+        return self._images.get(label)
+
+
+# Shared index used by functions.py
+example_index = ExampleImageIndex()
+
+
+def get_example_index():
+    return example_index
+
+
+if __name__ == "__main__":
+    # Build the index as a deployment step: python example_images.py
+    index = build_index(BASE_DIR)
+    save_index(index, INDEX_FILE)
+    found = sum(1 for path in index["images"].values() if path)
+    print(f"Indexed example images for {found} of {len(index['images'])} species in {INDEX_FILE}")
@@ -0,0 +1,137 @@
+import os
+import argparse
+import numpy as np
+from model_registry import CATEGORY_MODEL_FILES, CATEGORY_NAMES, load_class_indices
+from inference_backends import QUANTIZATIONS, TFLiteModel, tflite_model_file
+from preprocessing import prepare_image
+
+# Converts the four category CNNs to post-training quantized TFLite models and checks
+# that they agree with the Keras models on the validation split:
+#
+#   python export_models.py --quantization float16 int8 --check
+#
+# The app uses them with GREENSPACE_INFERENCE_BACKEND=tflite.
+
+BASE_DIR = 'house_plant_species'
+KERAS_IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.ppm', '.tif', '.tiff')
+
+
+def split_images(species_list, subset, validation_split=0.2, base_dir=BASE_DIR, limit=None):
+    """
+    Lists the images of a subset the same way train_model's flow_from_directory does:
+    per species the sorted files, the first 20% are the validation subset.
+
+    Returns:
+    - List of (image path, class index).
+    """
+    images = []
+    for class_index, species in enumerate(species_list):
+        species_dir = os.path.join(base_dir, species)
+        if not os.path.isdir(species_dir):
+            continue
+        files = sorted(f for f in os.listdir(species_dir) if f.lower().endswith(KERAS_IMAGE_EXTENSIONS))
+        split = int(validation_split * len(files))
+        files = files[:split] if subset == 'validation' else files[split:]
+        if limit:
+            files = files[:limit]
+        images += [(os.path.join(species_dir, f), class_index) for f in files]
+    return images
+
+
+def load_batch(paths):
+    # (batch of the readable images, boolean mask of the paths that were readable)
+    prepared = [prepare_image(path) for path in paths]
+    valid = np.array([image is not None for image in prepared], dtype=bool)
+    if not valid.any():
+        return None, valid
+    return np.stack([image.cnn_input for image in prepared if image is not None]), valid
+
+
+def convert(keras_model, quantization, representative_paths):
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(keras_model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantization == 'float16':
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantization == 'int8':
+        # Calibrate the activation ranges on training images; input and output stay float32
+        def representative_dataset():
+            for path in representative_paths:
+                image = prepare_image(path)
+                if image is not None:
+                    yield [image.cnn_input[np.newaxis]]
+        converter.representative_dataset = representative_dataset
+    # 'dynamic': weights in int8, activations in float
+    return converter.convert()
+
+
+def check_parity(keras_model, tflite_model, images, batch_size=32):
+    """
+    Compares the Keras and TFLite predictions.
+
+    Returns:
+    - Dictionary with top-1 agreement, top-3 overlap, max probability difference and both accuracies.
+    """
+    agree = top3_overlap = keras_correct = tflite_correct = checked = 0
+    max_diff = 0.0
+    for start in range(0, len(images), batch_size):
+        chunk = images[start:start + batch_size]
+        batch, valid = load_batch([path for path, _ in chunk])
+        if batch is None:
+            continue
+        # Labels of the images that could be read only
+        labels = np.array([label for _, label in chunk])[valid]
+        checked += len(labels)
+        expected = keras_model.predict(batch, verbose=0)
+        actual = tflite_model.predict(batch)
+
+        agree += int(np.sum(expected.argmax(1) == actual.argmax(1)))
+        keras_correct += int(np.sum(expected.argmax(1) == labels))
+        tflite_correct += int(np.sum(actual.argmax(1) == labels))
+        max_diff = max(max_diff, float(np.abs(expected - actual).max()))
+        for e, a in zip(expected, actual):
+            top3_overlap += len(set(np.argsort(e)[-3:]) & set(np.argsort(a)[-3:])) / 3
+    total = max(checked, 1)
+    return {
+        "images": checked,
+        "top1_agreement": agree / total,
+        "top3_overlap": top3_overlap / total,
+        "max_probability_diff": max_diff,
+        "keras_accuracy": keras_correct / total,
+        "tflite_accuracy": tflite_correct / total,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the category models to quantized TFLite.")
+    parser.add_argument('--model-dir', default='.')
+    parser.add_argument('--quantization', nargs='+', default=['float16'], choices=QUANTIZATIONS)
+    parser.add_argument('--check', action='store_true', help="Compare with Keras on the validation split")
+    parser.add_argument('--per-class', type=int, default=None, help="Limit the validation images per species")
+    parser.add_argument('--threads', type=int, default=None, help="TFLite interpreter threads for the check")
+    args = parser.parse_args()
+
+    import tensorflow as tf
+
+    for category, (model_file, class_indices_file) in CATEGORY_MODEL_FILES.items():
+        keras_model = tf.keras.models.load_model(os.path.join(args.model_dir, model_file))
+        indices_to_labels = load_class_indices(os.path.join(args.model_dir, class_indices_file))
+        species_list = [indices_to_labels[i] for i in sorted(indices_to_labels)]
+        representative = [path for path, _ in split_images(species_list, 'training', limit=20)]
+
+        for quantization in args.quantization:
+            output_path = os.path.join(args.model_dir, tflite_model_file(model_file, quantization))
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            with open(output_path, 'wb') as file:
+                file.write(convert(keras_model, quantization, representative))
+            size_mb = os.path.getsize(output_path) / 1e6
+            print(f"{CATEGORY_NAMES[category]}: wrote {output_path} ({size_mb:.1f} MB)")
+
+            if args.check:
+                images = split_images(species_list, 'validation', limit=args.per_class)
+                report = check_parity(keras_model, TFLiteModel(output_path, args.threads), images)
+                print(f"  parity on {report['images']} validation images: "
+                      f"top-1 agreement {report['top1_agreement']:.2%}, top-3 overlap {report['top3_overlap']:.2%}, "
+                      f"max prob diff {report['max_probability_diff']:.4f}, "
+                      f"accuracy keras {report['keras_accuracy']:.2%} / tflite {report['tflite_accuracy']:.2%}")
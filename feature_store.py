@@ -0,0 +1,305 @@
+import os
+import csv
+import json
+import time
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+# Precomputed first stage features of the dataset, for training the RF without
+# re-decoding every JPEG.
+#
+#   python feature_store.py build                  # only new or changed images are processed
+#   python feature_store.py build --features combined --check hash
+#   python feature_store.py train --output saved_models/rf_classifier_model.pkl
+#
+# The store is a directory with one float32 .npy matrix (one row per image) and an
+# index.json with the image path, label and file stats of every row. The rows are
+# ordered train first, then validation (same split as the notebook), so the two
+# matrices are slices of the memory-mapped file and loading them copies nothing.
+
+STORE_DIR = 'feature_store'
+INDEX_FILE = 'index.json'
+BASE_DIR = 'house_plant_species'
+CSV_FILE = 'image_data.csv'
+
+HIST_FEATURES = 768  # 3 x 256 color histogram bins
+HOG_FEATURES = 8100  # HOG of the 128x128 image: 15 x 15 blocks x 2 x 2 cells x 9 orientations
+FEATURE_SIZES = {'histogram': HIST_FEATURES, 'combined': HIST_FEATURES + HOG_FEATURES}
+
+
+def read_image_rows(csv_file=CSV_FILE, base_dir=BASE_DIR):
+    # (image path, category) for every row of image_data.csv, paths built like in the notebook
+    rows = []
+    with open(csv_file, newline='') as file:
+        for row in csv.DictReader(file):
+            species = (row['species'] or 'Unknown').replace(' ', '_')
+            rows.append((os.path.join(base_dir, species, row['image_name'] or 'Unknown'), row['category']))
+    return rows
+
+
+def file_stat(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def file_hash(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def compute_features(args):
+    """
+    Computes the features of one image (runs in the worker processes).
+
+    Parameters:
+    - args: (image path, feature kind).
+
+    Returns:
+    - (image path, float32 feature vector or None, sha1 of the file or None).
+    """
+    path, kind = args
+    import cv2
+    from preprocessing import color_histogram, to_rgb
+
+    try:
+        with open(path, 'rb') as file:
+            data = file.read()
+    except OSError as e:
+        print(f"Image not found or corrupted: {path} ({e})")
+        return path, None, None
+    sha1 = hashlib.sha1(data).hexdigest()
+
+    if kind == 'histogram':
+        # Same as functions.extract_features
+        image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            print(f"Image not found or corrupted: {path}")
+            return path, None, sha1
+        image_rgb = cv2.cvtColor(cv2.resize(image, (256, 256)), cv2.COLOR_BGR2RGB)
+        return path, color_histogram(image_rgb).astype(np.float32), sha1
+
+    # 'combined': histogram of the full image + HOG, like extract_combined_features in the notebook
+    import io
+    from PIL import Image
+    from skimage.feature import hog
+
+    try:
+        image = Image.open(io.BytesIO(data))
+        if image.mode in ('P', 'RGBA', 'LA'):
+            image = image.convert('RGBA')
+        image = to_rgb(np.array(image))
+    except Exception as e:
+        print(f"Image not found or corrupted: {path} ({e})")
+        return path, None, sha1
+    hist_features = color_histogram(image)
+    hog_features = hog(cv2.resize(image, (128, 128)), orientations=9, pixels_per_cell=(8, 8),
+                       cells_per_block=(2, 2), channel_axis=-1)
+    return path, np.concatenate([hist_features, hog_features]).astype(np.float32), sha1
+
+
+def split_indices(count, validation_split=0.2, random_state=42):
+    # Same split as train_test_split(image_paths, labels, test_size=0.2, random_state=42) in the notebook
+    from sklearn.model_selection import train_test_split
+
+    return train_test_split(np.arange(count), test_size=validation_split, random_state=random_state)
+
+
+class FeatureStore:
+    """
+    A built feature store, with the feature matrix memory-mapped.
+
+    Attributes:
+    - features: float32 matrix, train rows first, then validation rows.
+    - labels: int array of the category index of each row.
+    - paths: Image path of each row.
+    - n_train: Number of training rows.
+    - categories: Category names, in label order.
+    """
+    def __init__(self, store_dir=STORE_DIR, mmap=True):
+        with open(os.path.join(store_dir, INDEX_FILE), 'r') as file:
+            self.index = json.load(file)
+        mmap_mode = 'r' if mmap else None
+        self.features = np.load(os.path.join(store_dir, self.index['features_file']), mmap_mode=mmap_mode)
+        self.labels = np.load(os.path.join(store_dir, self.index['labels_file']), mmap_mode=mmap_mode)
+        self.paths = [row['path'] for row in self.index['rows']]
+        self.n_train = self.index['n_train']
+        self.categories = self.index['categories']
+
+    def train(self):
+        # Views of the memory-mapped file, nothing is copied
+        return self.features[:self.n_train], self.labels[:self.n_train]
+
+    def validation(self):
+        return self.features[self.n_train:], self.labels[self.n_train:]
+
+
+def load_previous(store_dir, kind):
+    # Rows of the current store that can be reused: path -> (row data, features)
+    try:
+        store = FeatureStore(store_dir)
+    except (FileNotFoundError, json.JSONDecodeError, KeyError):
+        return {}, {}
+    if store.index.get('features') != kind:
+        print(f"The store holds '{store.index.get('features')}' features, rebuilding everything")
+        return {}, {}
+    previous = {row['path']: (row, store.features[i]) for i, row in enumerate(store.index['rows'])}
+    return previous, store.index.get('failed', {})
+
+
+def build_store(store_dir=STORE_DIR, csv_file=CSV_FILE, base_dir=BASE_DIR, kind='histogram', check='mtime',
+                workers=None, validation_split=0.2, random_state=42):
+    """
+    Builds or updates the feature store.
+
+    Parameters:
+    - kind: 'histogram' (the features of the deployed RF) or 'combined' (histogram + HOG).
+    - check: How unchanged images are recognized: 'mtime' (modification time and size)
+      or 'hash' (the SHA-1 of the file when its modification time changed).
+    - workers: Number of processes (default: all cores).
+
+    Returns:
+    - Dictionary with the number of reused, computed and failed images.
+    """
+    rows = read_image_rows(csv_file, base_dir)
+    previous, previous_failed = load_previous(store_dir, kind)
+
+    features = {}  # path -> feature vector
+    hashes = {}
+    failed = {}
+    to_compute = []
+    reused = 0
+    for path, _ in dict.fromkeys(rows):
+        stat = file_stat(path)
+        old = previous.get(path)
+        if old is not None and stat is not None:
+            row, vector = old
+            unchanged = row['stat'] == stat
+            if not unchanged and check == 'hash' and row.get('sha1'):
+                unchanged = file_hash(path) == row['sha1']
+            if unchanged:
+                features[path] = vector
+                hashes[path] = row.get('sha1')
+                reused += 1
+                continue
+        if path in previous_failed and previous_failed[path] == stat:
+            # Still the same unreadable file, don't try again
+            failed[path] = stat
+            continue
+        to_compute.append(path)
+
+    computed = 0
+    if to_compute:
+        print(f"Computing {kind} features of {len(to_compute)} images ({reused} unchanged)")
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for path, vector, sha1 in executor.map(compute_features, [(path, kind) for path in to_compute],
+                                                   chunksize=32):
+                if vector is None:
+                    failed[path] = file_stat(path)
+                else:
+                    features[path] = vector
+                    hashes[path] = sha1
+                    computed += 1
+
+    # Row order: the notebook's train / validation split over all csv rows, minus the unreadable images
+    categories = sorted({category for _, category in rows})
+    train_ids, val_ids = split_indices(len(rows), validation_split, random_state)
+    train_rows = [rows[i] for i in train_ids if rows[i][0] in features]
+    val_rows = [rows[i] for i in val_ids if rows[i][0] in features]
+    ordered = train_rows + val_rows
+
+    # New files next to the old ones; index.json is replaced last, so readers always see a complete store
+    os.makedirs(store_dir, exist_ok=True)
+    generation = str(time.time_ns())
+    features_file = f'features_{generation}.npy'
+    labels_file = f'labels_{generation}.npy'
+    matrix = np.lib.format.open_memmap(os.path.join(store_dir, features_file), mode='w+', dtype=np.float32,
+                                       shape=(len(ordered), FEATURE_SIZES[kind]))
+    for i, (path, _) in enumerate(ordered):
+        matrix[i] = features[path]
+    matrix.flush()
+    del matrix
+    labels = np.array([categories.index(category) for _, category in ordered], dtype=np.int16)
+    np.save(os.path.join(store_dir, labels_file), labels)
+
+    index = {
+        "features": kind,
+        "features_file": features_file,
+        "labels_file": labels_file,
+        "categories": categories,
+        "n_train": len(train_rows),
+        "validation_split": validation_split,
+        "random_state": random_state,
+        "rows": [{"path": path, "stat": file_stat(path), "sha1": hashes.get(path)} for path, _ in ordered],
+        "failed": failed,
+    }
+    tmp_path = os.path.join(store_dir, f'{INDEX_FILE}.{os.getpid()}.tmp')
+    with open(tmp_path, 'w') as file:
+        json.dump(index, file)
+    os.replace(tmp_path, os.path.join(store_dir, INDEX_FILE))
+
+    # Remove the files of the previous versions
+    for file_name in os.listdir(store_dir):
+        if file_name.endswith('.npy') and file_name not in (features_file, labels_file):
+            try:
+                os.remove(os.path.join(store_dir, file_name))
+            except OSError as e:
+                print(f"Removing {file_name} failed: {e}")
+
+    return {"rows": len(ordered), "reused": reused, "computed": computed, "failed": len(failed)}
+
+
+def train_rf(store_dir=STORE_DIR, output_file=None, n_estimators=100, random_state=42, n_jobs=None):
+    # Trains the first stage RF like the notebook, from the memory-mapped store
+    import pickle
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.metrics import accuracy_score
+
+    store = FeatureStore(store_dir)
+    train_features, train_labels = store.train()
+    val_features, val_labels = store.validation()
+
+    rf_classifier = RandomForestClassifier(n_estimators=n_estimators, random_state=random_state, n_jobs=n_jobs)
+    rf_classifier.fit(train_features, train_labels)
+    val_accuracy = accuracy_score(val_labels, rf_classifier.predict(val_features))
+    print(f"Validation Accuracy: {val_accuracy:.4f}")
+
+    if output_file:
+        os.makedirs(os.path.dirname(output_file) or '.', exist_ok=True)
+        with open(output_file, 'wb') as file:
+            pickle.dump(rf_classifier, file)
+        print(f"Model saved as {output_file}")
+    return rf_classifier, val_accuracy
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Feature store of the dataset for training the RF.")
+    parser.add_argument('--store', default=STORE_DIR)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build_parser = subparsers.add_parser('build', help="Build or update the store")
+    build_parser.add_argument('--csv', default=CSV_FILE)
+    build_parser.add_argument('--base-dir', default=BASE_DIR)
+    build_parser.add_argument('--features', choices=list(FEATURE_SIZES), default='histogram')
+    build_parser.add_argument('--check', choices=['mtime', 'hash'], default='mtime',
+                              help="How unchanged images are detected")
+    build_parser.add_argument('--workers', type=int, default=None, help="Number of processes (default: all cores)")
+    train_parser = subparsers.add_parser('train', help="Train the RF from the store")
+    train_parser.add_argument('--output', help="Save the trained model to this file")
+    train_parser.add_argument('--n-estimators', type=int, default=100)
+    train_parser.add_argument('--jobs', type=int, default=None)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        start = time.perf_counter()
+        result = build_store(args.store, args.csv, args.base_dir, args.features, args.check, args.workers)
+        print(f"Feature store {args.store}: {result['rows']} images ({result['computed']} computed, "
+              f"{result['reused']} unchanged, {result['failed']} unreadable) in {time.perf_counter() - start:.1f} s")
+    else:
+        train_rf(args.store, args.output, args.n_estimators, n_jobs=args.jobs)
@@ -1,22 +1,19 @@
 import pickle
-from flask import request
-from PIL import Image
 import numpy as np
-import cv2
 import json
-import matplotlib.image as mpimg
 import os
 os.environ['TF_ENABLE_ONEDNN_OPTS'] = '0'
 
-import tensorflow as tf
-from tensorflow.keras.models import load_model
-from tensorflow.keras.preprocessing import image
+# OpenCV and TensorFlow are imported inside the functions that use them,
+# so importing this module stays fast and does no work.
+from model_registry import get_registry, CATEGORY_MODEL_FILES
+from preprocessing import color_histogram, prepare_image
+from example_images import get_example_index
+from metrics import timer, current_profiles, recording_to, registry as metrics_registry
+from concurrent.futures import ThreadPoolExecutor
+import threading
 
-
-#image_path = r'test_images\images (4).jpg'
-image_path = r'test_images\anthurium.jpg'
-#image_path = r'test_images\download.jpg'
-model_path = r'saved_models\rf_classifier_model.pkl'
+model_path = os.path.join('saved_models', 'rf_classifier_model.pkl')
 
 ### Prediction first_stage:
 
@@ -58,6 +55,7 @@ def load_model(filename='rf_classifier_model.pkl'):
 
 # Function to extract color histogram features
 def extract_features(image_path):
+    import cv2
     image = cv2.imread(image_path)
     if image is None:
         print(f"Image not found or corrupted: {image_path}")
@@ -66,20 +64,15 @@ def extract_features(image_path):
     # Convert image to RGB
     image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
     
-    # Extract color histograms for each channel (R, G, B)
-    hist_r = cv2.calcHist([image_rgb], [0], None, [256], [0, 256]).flatten()
-    hist_g = cv2.calcHist([image_rgb], [1], None, [256], [0, 256]).flatten()
-    hist_b = cv2.calcHist([image_rgb], [2], None, [256], [0, 256]).flatten()
-    
-    # Concatenate the histograms into a single feature vector
-    hist_features = np.concatenate([hist_r, hist_g, hist_b])
-    
-    return hist_features
+    # Color histograms of the R, G and B channels as a single feature vector
+    return color_histogram(image_rgb)
 
 
-def prediction_class(model_path, image_path):
+def prediction_class(model_path, image_path, model=None):
+    # model: an already loaded RF model (from the model registry); loaded from model_path if not given
     try:
-        model = load_model(model_path)
+        if model is None:
+            model = load_model(model_path)
         if model is not None:
             predicted_class = predict_image_class(model, image_path)
             if predicted_class is not None:
@@ -92,25 +85,28 @@ def prediction_class(model_path, image_path):
     except Exception as e:
         print(f"An error occurred: {e}")
 
-category_result = prediction_class(model_path, image_path)
-#print(category_result)
-
 ###Prediction second stage:
 
 
-def prediction_species(category_result, img_path):
+def prediction_species(category_result, img_path, model=None, indices_to_labels=None):
     """
     Predicts the species of the plant given an image and a category result.
 
     Parameters:
     - category_result: The category result (0 or 1).
     - img_path: The path to the image file.
+    - model: Optional already loaded Keras model for the category (from the model registry).
+    - indices_to_labels: Optional class indices of that model.
 
     Returns:
     - predicted_label: The predicted species label.
     """
+    import tensorflow as tf
+
     # Load the appropriate model and class indices based on the category result
-    if category_result == 0:
+    if model is not None and indices_to_labels is not None:
+        class_indices_file = None
+    elif category_result == 0:
         model = tf.keras.models.load_model('my_model_flowering_128_for_project.keras')
         class_indices_file = 'class_indices_flowering.json'
     elif category_result == 1:
@@ -126,56 +122,52 @@ def prediction_species(category_result, img_path):
         print("Invalid category result. Must be 0 (flowering) or 1 (foliage), 2 (palms_and_ferns) or 3 (succulents_and_cacti).")
         return None
 
-    # Load the class indices from the JSON file
-    with open(class_indices_file, 'r') as f:
-        indices_to_labels = json.load(f)
-
-    # Convert string keys to integers
-    indices_to_labels = {int(k): v for k, v in indices_to_labels.items()}
+    if class_indices_file is not None:
+        # Load the class indices from the JSON file
+        with open(class_indices_file, 'r') as f:
+            indices_to_labels = json.load(f)
 
-    img_size = 128  # the input size of model
+        # Convert string keys to integers
+        indices_to_labels = {int(k): v for k, v in indices_to_labels.items()}
 
     # Load and preprocess the image
-    img = image.load_img(img_path, target_size=(img_size, img_size))
-    img_array = image.img_to_array(img) / 255.0  # Normalize the image
+    img_array = load_cnn_input(img_path)
     img_array = np.expand_dims(img_array, axis=0)  # Add batch dimension
 
     # Make a prediction
-    prediction = model.predict(img_array)
+    prediction = model.predict(img_array, verbose=0)
+
+    # Return the top 3 predictions with their probabilities and image paths
+    return build_top_3_results(prediction[0], indices_to_labels, category_result)
+
+
+# Function to load an image as the normalized input of the category models
+def load_cnn_input(img_path, img_size=128):
+    from tensorflow.keras.preprocessing import image
+
+    img = image.load_img(img_path, target_size=(img_size, img_size))
+    return image.img_to_array(img) / 255.0  # Normalize the image
 
-    # Get the index of the predicted class
-    predicted_class_idx = np.argmax(prediction, axis=1)[0]
 
-    # Map the predicted class index to the class label
-    predicted_label = indices_to_labels[predicted_class_idx]
+def build_top_3_results(prediction, indices_to_labels, category_result):
+    """
+    Builds the top 3 results of the category model for one image.
 
-    #print(f"Predicted label: {predicted_label}")
+    Parameters:
+    - prediction: The predicted probabilities of one image.
+    - indices_to_labels: Dictionary class index -> species label of the category model.
+    - category_result: The category of the image.
 
+    Returns:
+    - List of the top 3 predictions with their probabilities and example image paths.
+    """
     # Get the top 3 predictions
-    top_3_indices = np.argsort(prediction[0])[-3:][::-1]  # Indices of top 3 probabilities
-    top_3_probs = prediction[0][top_3_indices]
+    top_3_indices = np.argsort(prediction)[-3:][::-1]  # Indices of top 3 probabilities
+    top_3_probs = prediction[top_3_indices]
     top_3_labels = [indices_to_labels[idx] for idx in top_3_indices]
 
-    class_labels = indices_to_labels.values()
-    # Initialize an empty dictionary to store the mapping of class labels to image paths
-    class_label_to_image_path = {}
-    base_dir = 'house_plant_species'
-
-    #Loop through each class label and find an image for each label in the base directory
-    for label in class_labels:
-        label_dir = os.path.join(base_dir, label)
-        if os.path.exists(label_dir):
-            found_image = False
-            for file_name in os.listdir(label_dir):
-                if file_name.lower().endswith(('.png', '.jpg', '.jpeg')):
-                    image_path = os.path.join(label_dir, file_name)
-                    class_label_to_image_path[label] = image_path
-                    found_image = True
-                    break
-            if not found_image:
-                class_label_to_image_path[label] = None  # No image found
-        else:
-            class_label_to_image_path[label] = None  # Directory not found
+    # Example images come from the precomputed index, no directory scans per request
+    example_index = get_example_index()
 
     # Prepare the result to return
     top_3_results = []
@@ -183,17 +175,13 @@ def prediction_species(category_result, img_path):
         label = top_3_labels[i]
         result = {
             "label": label,
-            "probability": round(top_3_probs[i] * 100, 2),  # Convert to percentage
-            "image_path": class_label_to_image_path.get(label, None),
+            "probability": round(float(top_3_probs[i]) * 100, 2),  # Convert to percentage (plain float for JSON)
+            "image_path": example_index.lookup(label),
             "category": category_result
         }
         top_3_results.append(result)
 
-    # Return the top 3 predictions with their probabilities and image paths
-    # print (top_3_results) 
-    return top_3_results 
-     
-prediction_species(category_result,image_path)
+    return top_3_results
 
 #Offering funny_names:
 def get_funny_plant_names(category_result):
@@ -234,6 +222,195 @@ def get_funny_plant_names(category_result):
         return []
 
 def recognize_plant(file_path):
-    model_path = r'saved_models\rf_classifier_model.pkl'
-    category_result = prediction_class(model_path, file_path)
-    return prediction_species(category_result,file_path)
\ No newline at end of file
+    """
+    Recognizes one image with the resident models.
+
+    Parameters:
+    - file_path: Path to the image file, or the image in memory (bytes or RGB array).
+
+    Returns:
+    - The top 3 results, or None if the image couldn't be recognized.
+    """
+    return recognize_plants([file_path])[0]
+
+
+# Speculative second stage: when the RF is unsure of the category (the probability of
+# its first choice is less than SPECULATIVE_MARGIN above the second one), the CNNs of
+# its SPECULATIVE_TOP_K most likely categories all run on the image and their top 3
+# lists are merged. The category models run concurrently, so this costs about the
+# latency of one CNN instead of a second request. 0 disables it.
+SPECULATIVE_MARGIN = float(os.environ.get('GREENSPACE_SPECULATIVE_MARGIN', 0))
+SPECULATIVE_TOP_K = int(os.environ.get('GREENSPACE_SPECULATIVE_TOP_K', 2))
+
+SPECULATIVE_IMAGES = metrics_registry.counter('greenspace_speculative_images_total',
+                                              'Images sent to several category models')
+
+_category_pool = None
+_category_pool_lock = threading.Lock()
+
+
+def category_pool():
+    # Threads running the category models of one batch concurrently (TensorFlow releases the GIL)
+    global _category_pool
+    if _category_pool is None:
+        with _category_pool_lock:
+            if _category_pool is None:
+                _category_pool = ThreadPoolExecutor(max_workers=len(CATEGORY_MODEL_FILES),
+                                                    thread_name_prefix='category-model')
+    return _category_pool
+
+
+def route_categories(rf_model, features, margin=SPECULATIVE_MARGIN, top_k=SPECULATIVE_TOP_K):
+    """
+    First stage: the candidate categories of each image.
+
+    Returns:
+    - List with, for each image, a list of (category_result, weight) pairs. There
+      is one pair with weight 1 unless the RF is unsure of the category, then the
+      top_k categories weighted by their RF probability.
+    """
+    if margin <= 0 or top_k < 2 or not hasattr(rf_model, 'predict_proba'):
+        return [[(category_result, 1.0)] for category_result in rf_model.predict(features)]
+
+    probabilities = rf_model.predict_proba(features)
+    candidates = []
+    for row in probabilities:
+        order = np.argsort(row)[::-1]
+        if len(order) < 2 or row[order[0]] - row[order[1]] >= margin:
+            candidates.append([(rf_model.classes_[order[0]], 1.0)])
+            continue
+        top = order[:top_k]
+        total = float(row[top].sum()) or 1.0
+        candidates.append([(rf_model.classes_[i], float(row[i]) / total) for i in top])
+        SPECULATIVE_IMAGES.inc()
+    return candidates
+
+
+def predict_categories(models, batches):
+    """
+    Second stage: runs several category models, concurrently when there are several.
+
+    Parameters:
+    - models: The ModelSet.
+    - batches: Dictionary category_result -> batch of CNN inputs.
+
+    Returns:
+    - Dictionary category_result -> predicted probabilities.
+    """
+    heads = [models.category_models[category] for category in batches]
+    multihead = getattr(heads[0], 'multihead', None)
+    if len(batches) > 1 and multihead is not None and all(getattr(h, 'multihead', None) is multihead for h in heads):
+        # One shared backbone: run it once on all the images, then every head that is needed
+        order = list(batches)
+        union = np.concatenate([batches[category] for category in order])
+        with timer('cnn_predict'):
+            predictions = multihead.predict_heads(union, order)
+        result = {}
+        start = 0
+        for category in order:
+            end = start + len(batches[category])
+            result[category] = predictions[category][start:end]
+            start = end
+        return result
+
+    def predict(category):
+        with timer('cnn_predict'):
+            return models.category_models[category].predict(batches[category], verbose=0)
+
+    if len(batches) == 1:
+        category = next(iter(batches))
+        return {category: predict(category)}
+    # The timers of the pool threads count for the requests of this batch
+    profiles = current_profiles() or ()
+
+    def predict_in_pool(category):
+        with recording_to(profiles):
+            return predict(category)
+
+    return dict(zip(batches, category_pool().map(predict_in_pool, list(batches))))
+
+
+def merge_top_3_results(predictions, class_indices):
+    """
+    Merges the top 3 results of several category models for one image.
+
+    Parameters:
+    - predictions: List of (category_result, weight, predicted probabilities); the
+      probability of a species is its category weight times its CNN probability.
+    - class_indices: Dictionary category_result -> class indices of the model.
+
+    Returns:
+    - The 3 most probable species over all the categories.
+    """
+    if len(predictions) == 1:
+        category_result, _, prediction = predictions[0]
+        return build_top_3_results(prediction, class_indices[category_result], category_result)
+
+    candidates = []
+    for category_result, weight, prediction in predictions:
+        for idx in np.argsort(prediction)[-3:][::-1]:
+            candidates.append((weight * float(prediction[idx]), category_result, idx))
+    candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+
+    example_index = get_example_index()
+    top_3_results = []
+    for probability, category_result, idx in candidates[:3]:
+        label = class_indices[category_result][idx]
+        top_3_results.append({
+            "label": label,
+            "probability": round(probability * 100, 2),
+            "image_path": example_index.lookup(label),
+            "category": category_result
+        })
+    return top_3_results
+
+
+def recognize_plants(images):
+    """
+    Recognizes several images at once: one RF predict for the whole batch,
+    then one predict per category model for the images routed to it.
+    Each image is decoded once and both stages use the same decoded pixels.
+
+    Parameters:
+    - images: List of image paths or in-memory images (bytes or RGB arrays).
+
+    Returns:
+    - List with the top 3 results of each image (None if the image couldn't be recognized).
+    """
+    models = get_registry().get()
+    results = [None] * len(images)
+
+    prepared = [prepare_image(source) for source in images]
+    valid = [i for i, image in enumerate(prepared) if image is not None]
+    if not valid:
+        return results
+
+    # First stage for the whole batch
+    features = np.stack([prepared[i].hist_features for i in valid])
+    with timer('rf_predict'):
+        candidates = route_categories(models.rf_model, features)
+
+    # Group the images by candidate category (an image the RF is unsure of is in several groups)
+    groups = {}
+    for i, image_candidates in zip(valid, candidates):
+        for category_result, _ in image_candidates:
+            if category_result in models.category_models:
+                groups.setdefault(category_result, []).append(i)
+    if not groups:
+        return results
+
+    # Second stage: one batched predict per category model
+    batches = {category_result: np.stack([prepared[i].cnn_input for i in indices])
+               for category_result, indices in groups.items()}
+    category_predictions = predict_categories(models, batches)
+    rows = {(category_result, i): row for category_result, indices in groups.items()
+            for row, i in enumerate(indices)}
+
+    with timer('top_3_results'):
+        for i, image_candidates in zip(valid, candidates):
+            predictions = [(category_result, weight, category_predictions[category_result][rows[category_result, i]])
+                           for category_result, weight in image_candidates if (category_result, i) in rows]
+            if predictions:
+                results[i] = merge_top_3_results(predictions, models.class_indices)
+
+    return results
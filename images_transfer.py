@@ -1,110 +1,292 @@
 import os
+import csv
+import json
 import shutil
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
 
-def count_images_in_directory(base_dir):
-    total_images = 0
-    species_counts = {}
-    for species in os.listdir(base_dir):
-        species_dir = os.path.join(base_dir, species)
-        if os.path.isdir(species_dir):
-            image_files = [f for f in os.listdir(species_dir)
-                           if f.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff'))]
-            species_counts[species] = len(image_files)
-            total_images += len(image_files)
-    return total_images, species_counts
-
-def move_images(source_base_dir, target_base_dir):
-    # List of species (folder names)
-    species_list = [
-        'African_Violet_Saintpaulia_ionantha', 'Aloe_Vera', 'Anthurium_Anthurium_andraeanum',
-        'Areca_Palm_Dypsis_lutescens', 'Asparagus_Fern_Asparagus_setaceus', 'Begonia_Begonia_spp',
-        'Birds_Nest_Fern_Asplenium_nidus', 'Bird_of_Paradise_Strelitzia_reginae', 'Boston_Fern_Nephrolepis_exaltata',
-        'Calathea', 'Cast_Iron_Plant_Aspidistra_elatior', 'Chinese_evergreen_Aglaonema', 'Chinese_Money_Plant_Pilea_peperomioides',
-        'Christmas_Cactus_Schlumbergera_bridgesii', 'Chrysanthemum', 'Ctenanthe', 'Daffodils_Narcissus_spp', 'Dracaena',
-        'Dumb_Cane_Dieffenbachia_spp', 'Elephant_Ear_Alocasia_spp', 'English_Ivy_Hedera_helix', 'Hyacinth_Hyacinthus_orientalis',
-        'Iron_Cross_begonia_Begonia_masoniana', 'Jade_plant_Crassula_ovata', 'Kalanchoe', 'Lilium_Hemerocallis',
-        'Lily_of_the_valley_Convallaria_majalis', 'Money_Tree_Pachira_aquatica', 'Monstera_Deliciosa_Monstera_deliciosa',
-        'Orchid', 'Parlor_Palm_Chamaedorea_elegans', 'Peace_lily', 'Poinsettia_Euphorbia_pulcherrima', 'Polka_Dot_Plant_Hypoestes_phyllostachya',
-        'Ponytail_Palm_Beaucarnea_recurvata', 'Pothos_Ivy_arum', 'Prayer_Plant_Maranta_leuconeura', 'Rattlesnake_Plant_Calathea_lancifolia',
-        'Rubber_Plant_Ficus_elastica', 'Sago_Palm_Cycas_revoluta', 'Schefflera', 'Snake_plant_Sanseviera', 'Tradescantia', 'Tulip',
-        'Venus_Flytrap', 'Yucca', 'ZZ_Plant_Zamioculcas_zamiifolia'
-    ]
+# Moves the downloaded images of 'dataset' into 'house_plant_species'.
+#
+#   python images_transfer.py                       # resumes where an interrupted run stopped
+#   python images_transfer.py --workers 16
+#
+# Every image is hashed; an image whose content is already in the target (or was
+# moved earlier in the run) is skipped instead of being stored a second time. The
+# hashes and the state of every source file are kept in MANIFEST_FILE, so the
+# target is only hashed once and an interrupted run continues from the manifest.
+# A file downloaded again under a name that was already processed (bing-image-downloader
+# reuses Image_N.jpg) is hashed and planned again.
+# The moved images are appended to image_data.csv.
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff')
+MANIFEST_FILE = 'transfer_manifest.json'
+SAVE_EVERY = 200  # manifest saves during the moves
+
+# List of species (folder names)
+SPECIES_LIST = [
+    'African_Violet_Saintpaulia_ionantha', 'Aloe_Vera', 'Anthurium_Anthurium_andraeanum',
+    'Areca_Palm_Dypsis_lutescens', 'Asparagus_Fern_Asparagus_setaceus', 'Begonia_Begonia_spp',
+    'Birds_Nest_Fern_Asplenium_nidus', 'Bird_of_Paradise_Strelitzia_reginae', 'Boston_Fern_Nephrolepis_exaltata',
+    'Calathea', 'Cast_Iron_Plant_Aspidistra_elatior', 'Chinese_evergreen_Aglaonema', 'Chinese_Money_Plant_Pilea_peperomioides',
+    'Christmas_Cactus_Schlumbergera_bridgesii', 'Chrysanthemum', 'Ctenanthe', 'Daffodils_Narcissus_spp', 'Dracaena',
+    'Dumb_Cane_Dieffenbachia_spp', 'Elephant_Ear_Alocasia_spp', 'English_Ivy_Hedera_helix', 'Hyacinth_Hyacinthus_orientalis',
+    'Iron_Cross_begonia_Begonia_masoniana', 'Jade_plant_Crassula_ovata', 'Kalanchoe', 'Lilium_Hemerocallis',
+    'Lily_of_the_valley_Convallaria_majalis', 'Money_Tree_Pachira_aquatica', 'Monstera_Deliciosa_Monstera_deliciosa',
+    'Orchid', 'Parlor_Palm_Chamaedorea_elegans', 'Peace_lily', 'Poinsettia_Euphorbia_pulcherrima', 'Polka_Dot_Plant_Hypoestes_phyllostachya',
+    'Ponytail_Palm_Beaucarnea_recurvata', 'Pothos_Ivy_arum', 'Prayer_Plant_Maranta_leuconeura', 'Rattlesnake_Plant_Calathea_lancifolia',
+    'Rubber_Plant_Ficus_elastica', 'Sago_Palm_Cycas_revoluta', 'Schefflera', 'Snake_plant_Sanseviera', 'Tradescantia', 'Tulip',
+    'Venus_Flytrap', 'Yucca', 'ZZ_Plant_Zamioculcas_zamiifolia'
+]
 
+
+def list_species_images(base_dir, species_list=SPECIES_LIST):
+    # "species/file name" of every image of the listed species
+    images = []
     for species in species_list:
-        source_species_folder = os.path.join(source_base_dir, species)
-        target_species_folder = os.path.join(target_base_dir, species)
+        species_dir = os.path.join(base_dir, species)
+        if not os.path.isdir(species_dir):
+            continue
+        images += [f"{species}/{f}" for f in sorted(os.listdir(species_dir)) if f.lower().endswith(IMAGE_EXTENSIONS)]
+    return images
+
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_signature(path):
+    # [size, mtime] of a file, None if it doesn't exist
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def load_manifest(manifest_file):
+    try:
+        with open(manifest_file, 'r') as file:
+            return json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {"target_indexed": False, "hashes": {}, "files": {}}
+
+
+def save_manifest(manifest, manifest_file):
+    tmp_path = f"{manifest_file}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as file:
+        json.dump(manifest, file)
+    os.replace(tmp_path, manifest_file)
+
+
+def species_categories(csv_file):
+    # species -> category, from the rows already in image_data.csv and the class indices files
+    categories = {}
+    try:
+        from multihead_model import category_species
+        from model_registry import CATEGORY_NAMES
+
+        for category, species in category_species().items():
+            for name in species:
+                categories[name] = CATEGORY_NAMES[category]
+    except (OSError, ValueError) as e:
+        print(f"Reading the class indices failed: {e}")
+    if os.path.exists(csv_file):
+        with open(csv_file, newline='') as file:
+            for row in csv.DictReader(file):
+                categories.setdefault(row['species'], row['category'])
+    return categories
 
-        if not os.path.exists(source_species_folder):
-            print(f"Source folder does not exist: {source_species_folder}")
+
+def csv_rows(csv_file):
+    # (species, image name) pairs already listed in image_data.csv
+    if not os.path.exists(csv_file):
+        return set()
+    with open(csv_file, newline='') as file:
+        return {(row['species'], row['image_name']) for row in csv.DictReader(file)}
+
+
+def free_target_name(target_dir, image_file, reserved):
+    # image.jpg, image_copy.jpg, image_copy2.jpg, ... (names planned in this run count as taken)
+    base, ext = os.path.splitext(image_file)
+    candidate = image_file
+    number = 1
+    while os.path.exists(os.path.join(target_dir, candidate)) or os.path.join(target_dir, candidate) in reserved:
+        candidate = f"{base}_copy{ext}" if number == 1 else f"{base}_copy{number}{ext}"
+        number += 1
+    return candidate
+
+
+def index_target(target_base_dir, manifest, workers):
+    # One-time hashing of the images already in the target
+    images = list_species_images(target_base_dir)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        hashes = executor.map(lambda image: hash_file(os.path.join(target_base_dir, image)), images)
+        for image, digest in tqdm(zip(images, hashes), total=len(images), desc="Hashing the target images"):
+            manifest["hashes"].setdefault(digest, image)
+    manifest["target_indexed"] = True
+
+
+def move_images(source_base_dir, target_base_dir, manifest_file=MANIFEST_FILE, csv_file='image_data.csv',
+                workers=8):
+    """
+    Moves the images of every species from source_base_dir to target_base_dir.
+
+    Parameters:
+    - source_base_dir: Folder with the downloaded images, one subfolder per species.
+    - target_base_dir: The dataset folder.
+    - manifest_file: Manifest of the hashes and of the processed files (resume state).
+    - csv_file: image_data.csv, the moved images are appended to it.
+    - workers: Number of threads hashing and moving files.
+
+    Returns:
+    - Dictionary with the number of moved, duplicate (skipped) and failed images.
+    """
+    manifest = load_manifest(manifest_file)
+    files = manifest["files"]
+    if not manifest["target_indexed"]:
+        index_target(target_base_dir, manifest, workers)
+        save_manifest(manifest, manifest_file)
+
+    categories = species_categories(csv_file)
+    listed = csv_rows(csv_file)
+    new_rows = []
+    rows_added = 0
+
+    def finish_move(entry):
+        # Record a completed move: hash index and image_data.csv row
+        nonlocal rows_added
+        entry["status"] = "moved"
+        manifest["hashes"][entry["sha256"]] = entry["target"]
+        species, image_name = entry["target"].split('/', 1)
+        if (species, image_name) not in listed:
+            listed.add((species, image_name))
+            new_rows.append([image_name, categories.get(species, ''), species])
+            rows_added += 1
+
+    # Resume: moves planned by an interrupted run
+    for source, entry in files.items():
+        if entry["status"] != "moving":
             continue
+        target = os.path.join(target_base_dir, entry["target"])
+        if not os.path.exists(os.path.join(source_base_dir, source)):
+            if os.path.exists(target):
+                finish_move(entry)
+                continue
+            print(f"{source} is neither in the source nor in the target")
+        elif os.path.exists(target):
+            # A move between disks copies first: the target is an incomplete copy
+            os.remove(target)
+        entry["status"] = "pending"
+        if manifest["hashes"].get(entry["sha256"]) == entry["target"]:
+            del manifest["hashes"][entry["sha256"]]
+
+    def is_done(image):
+        # A moved file that is in the source again, or a duplicate that changed, is a new download
+        entry = files.get(image, {})
+        if entry.get("status") == "duplicate":
+            return entry.get("stat") == file_signature(os.path.join(source_base_dir, image))
+        return entry.get("status") == "moved" and not os.path.exists(os.path.join(source_base_dir, image))
 
-        if not os.path.exists(target_species_folder):
-            print(f"Target folder does not exist: {target_species_folder}. Creating it.")
-            os.makedirs(target_species_folder, exist_ok=True)
+    pending = [image for image in list_species_images(source_base_dir) if not is_done(image)]
+    for species in SPECIES_LIST:
+        if not os.path.exists(os.path.join(source_base_dir, species)):
+            print(f"Source folder does not exist: {os.path.join(source_base_dir, species)}")
 
-        # List of image files in the source species folder
-        image_files = [f for f in os.listdir(source_species_folder)
-                       if f.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff'))]
+    # Hash the source images in parallel
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        hashes = list(tqdm(executor.map(lambda image: hash_file(os.path.join(source_base_dir, image)), pending),
+                           total=len(pending), desc="Hashing the new images"))
 
-        for image_file in tqdm(image_files, desc=f"Moving images for {species}"):
-            source_image_path = os.path.join(source_species_folder, image_file)
-            target_image_path = os.path.join(target_species_folder, image_file)
+    # Plan in one thread: skip content that is already there, pick free names for the rest
+    moves = []
+    reserved = set()
+    duplicates = 0
+    duplicates_of = {}  # target planned in this run -> images skipped as its duplicates
+    for image, digest in zip(pending, hashes):
+        if digest in manifest["hashes"]:
+            target = manifest["hashes"][digest]
+            files[image] = {"status": "duplicate", "sha256": digest, "target": target,
+                            "stat": file_signature(os.path.join(source_base_dir, image))}
+            duplicates_of.setdefault(target, []).append(image)
+            duplicates += 1
+            continue
+        species, image_file = image.split('/', 1)
+        target_dir = os.path.join(target_base_dir, species)
+        target_name = free_target_name(target_dir, image_file, reserved)
+        reserved.add(os.path.join(target_dir, target_name))
+        # Later identical files in this run are duplicates of this one
+        manifest["hashes"][digest] = f"{species}/{target_name}"
+        files[image] = {"status": "moving", "sha256": digest, "target": f"{species}/{target_name}"}
+        moves.append(image)
 
-            # Check if the file already exists in the target folder
-            if os.path.exists(target_image_path):
-                # If the file exists, rename the source file to avoid overwriting
-                base, ext = os.path.splitext(image_file)
-                new_image_file = f"{base}_copy{ext}"
-                target_image_path = os.path.join(target_species_folder, new_image_file)
+    # Write-ahead: the planned moves are in the manifest before any file is moved
+    save_manifest(manifest, manifest_file)
 
-            # Move the image
-            shutil.move(source_image_path, target_image_path)
+    def move(image):
+        target = os.path.join(target_base_dir, files[image]["target"])
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.move(os.path.join(source_base_dir, image), target)
+        return image
 
-        print(f"Moved images from {source_species_folder} to {target_species_folder}")
+    moved = 0
+    failed = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(move, image) for image in moves]
+        for image, future in tqdm(zip(moves, futures), total=len(moves), desc="Moving images"):
+            try:
+                future.result()
+            except OSError as e:
+                print(f"Moving {image} failed: {e}")
+                files[image]["status"] = "pending"
+                del manifest["hashes"][files[image]["sha256"]]
+                failed += 1
+                # Its duplicates point to a file that isn't there: they are planned again by the next run
+                for duplicate in duplicates_of.get(files[image]["target"], []):
+                    files[duplicate]["status"] = "pending"
+                    duplicates -= 1
+                continue
+            finish_move(files[image])
+            moved += 1
+            if moved % SAVE_EVERY == 0:
+                append_csv_rows(csv_file, new_rows)
+                save_manifest(manifest, manifest_file)
 
-if __name__ == "__main__":
-    source_base_dir = 'dataset'
-    target_base_dir = 'house_plant_species'
+    append_csv_rows(csv_file, new_rows)
+    save_manifest(manifest, manifest_file)
+    return {"moved": moved, "duplicates": duplicates, "failed": failed, "csv_rows": rows_added}
 
-    # Count images before the move
-    print("Counting images before the move...\n")
-    dataset_total_before, dataset_species_counts_before = count_images_in_directory(source_base_dir)
-    houseplant_total_before, houseplant_species_counts_before = count_images_in_directory(target_base_dir)
 
-    print(f"Total images in '{source_base_dir}' before move: {dataset_total_before}")
-    print(f"Total images in '{target_base_dir}' before move: {houseplant_total_before}\n")
+def append_csv_rows(csv_file, rows):
+    # Appends and empties rows (image_name, category, species)
+    if not rows:
+        return
+    new_file = not os.path.exists(csv_file)
+    with open(csv_file, 'a', newline='') as file:
+        writer = csv.writer(file)
+        if new_file:
+            writer.writerow(['image_name', 'category', 'species'])
+        writer.writerows(rows)
+    rows.clear()
 
-    # Optionally, print counts per species
-    print("Images per species in 'dataset' before move:")
-    for species, count in dataset_species_counts_before.items():
-        print(f"{species}: {count}")
-    print("\n")
 
-    print("Images per species in 'house_plant_species' before move:")
-    for species, count in houseplant_species_counts_before.items():
-        print(f"{species}: {count}")
-    print("\n")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move downloaded images into the dataset without duplicates.")
+    parser.add_argument('--source', default='dataset')
+    parser.add_argument('--target', default='house_plant_species')
+    parser.add_argument('--manifest', default=MANIFEST_FILE)
+    parser.add_argument('--csv', default='image_data.csv')
+    parser.add_argument('--workers', type=int, default=8)
+    args = parser.parse_args()
 
-    # Move the images
     print("Moving images...\n")
-    move_images(source_base_dir, target_base_dir)
-
-    # Count images after the move
-    print("\nCounting images after the move...\n")
-    dataset_total_after, dataset_species_counts_after = count_images_in_directory(source_base_dir)
-    houseplant_total_after, houseplant_species_counts_after = count_images_in_directory(target_base_dir)
-
-    print(f"Total images in '{source_base_dir}' after move: {dataset_total_after}")
-    print(f"Total images in '{target_base_dir}' after move: {houseplant_total_after}\n")
-
-    # Optionally, print counts per species
-    print("Images per species in 'dataset' after move:")
-    for species, count in dataset_species_counts_after.items():
-        print(f"{species}: {count}")
-    print("\n")
-
-    print("Images per species in 'house_plant_species' after move:")
-    for species, count in houseplant_species_counts_after.items():
-        print(f"{species}: {count}")
-    print("\n")
+    result = move_images(args.source, args.target, args.manifest, args.csv, args.workers)
+
+    print(f"\nMoved {result['moved']} images from '{args.source}' to '{args.target}', "
+          f"skipped {result['duplicates']} duplicates, {result['failed']} failed")
+    print(f"Added {result['csv_rows']} rows to {args.csv}")
@@ -0,0 +1,97 @@
+import os
+import threading
+import numpy as np
+
+# Where export_models.py writes the converted category models
+TFLITE_DIR = os.path.join('saved_models', 'tflite')
+QUANTIZATIONS = ('float16', 'int8', 'dynamic')
+
+
+def tflite_model_file(model_file, quantization):
+    # my_model_foliage_128_last.keras -> saved_models/tflite/my_model_foliage_128_last_float16.tflite
+    stem = os.path.splitext(os.path.basename(model_file))[0]
+    return os.path.join(TFLITE_DIR, f"{stem}_{quantization}.tflite")
+
+
+def make_interpreter(model_path, num_threads=None):
+    # Prefer the small standalone runtimes, fall back to the one bundled with TensorFlow
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError:
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+    return Interpreter(model_path=model_path, num_threads=num_threads)
+
+
+class TFLiteModel:
+    """
+    A converted category model run with the TFLite interpreter on CPU.
+
+    Has the same predict(batch) method as the Keras model, so the rest of the
+    code doesn't need to know which backend is used.
+    """
+    def __init__(self, model_path, num_threads=None):
+        self.model_path = model_path
+        self.interpreter = make_interpreter(model_path, num_threads)
+        self.interpreter.allocate_tensors()
+        self.input_detail = self.interpreter.get_input_details()[0]
+        self.output_detail = self.interpreter.get_output_details()[0]
+        self._batch_size = int(self.input_detail['shape'][0])
+        # The interpreter is not thread-safe
+        self._lock = threading.Lock()
+
+    def _resize(self, batch_size):
+        if batch_size == self._batch_size:
+            return
+        shape = list(self.input_detail['shape'])
+        shape[0] = batch_size
+        self.interpreter.resize_tensor_input(self.input_detail['index'], shape)
+        self.interpreter.allocate_tensors()
+        self.input_detail = self.interpreter.get_input_details()[0]
+        self.output_detail = self.interpreter.get_output_details()[0]
+        self._batch_size = batch_size
+
+    def predict(self, batch, verbose=0):
+        batch = np.asarray(batch, dtype=np.float32)
+        with self._lock:
+            self._resize(len(batch))
+
+            # Fully integer models take quantized input
+            input_dtype = self.input_detail['dtype']
+            if input_dtype in (np.int8, np.uint8):
+                scale, zero_point = self.input_detail['quantization']
+                batch = np.round(batch / scale + zero_point).astype(input_dtype)
+
+            self.interpreter.set_tensor(self.input_detail['index'], batch)
+            self.interpreter.invoke()
+            output = self.interpreter.get_tensor(self.output_detail['index']).copy()
+
+            if self.output_detail['dtype'] in (np.int8, np.uint8):
+                scale, zero_point = self.output_detail['quantization']
+                output = (output.astype(np.float32) - zero_point) * scale
+        return output
+
+
+def load_category_model(model_dir, model_file, backend='keras', quantization='float16', num_threads=None):
+    """
+    Loads one category model with the chosen inference backend.
+
+    Parameters:
+    - model_dir: The model directory.
+    - model_file: The .keras file of the category.
+    - backend: 'keras' (full TensorFlow) or 'tflite' (exported with export_models.py).
+    - quantization: Which exported TFLite artifact to use.
+    - num_threads: CPU threads of the TFLite interpreter.
+
+    Returns:
+    - An object with a Keras-like predict(batch) method.
+    """
+    if backend == 'tflite':
+        return TFLiteModel(os.path.join(model_dir, tflite_model_file(model_file, quantization)), num_threads)
+    if backend == 'keras':
+        import tensorflow as tf
+        return tf.keras.models.load_model(os.path.join(model_dir, model_file))
+    raise ValueError(f"Unknown inference backend {backend}, use 'keras' or 'tflite'")
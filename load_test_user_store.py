@@ -0,0 +1,61 @@
+import os
+import argparse
+import tempfile
+import time
+from multiprocessing import Process
+from threading import Thread
+from user_store import UserStore
+
+# Load test for the SQLite user store: several processes with several threads each
+# add plants to the same users at the same time, then we check that no write was lost.
+#
+#   python load_test_user_store.py --processes 4 --threads 8 --writes 200
+
+
+def write_plants(db_file, worker, threads, writes, users):
+    store = UserStore(db_file)
+
+    def run(thread):
+        for i in range(writes):
+            username = users[i % len(users)]
+            store.add_user_plant(username, 'Aloe_Vera', '/image/Aloe_Vera/Image_1.jpg', f'{worker}-{thread}-{i}')
+
+    thread_list = [Thread(target=run, args=(thread,)) for thread in range(threads)]
+    for thread in thread_list:
+        thread.start()
+    for thread in thread_list:
+        thread.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent write test of the SQLite user store.")
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--writes', type=int, default=200, help="Writes per thread")
+    parser.add_argument('--users', type=int, default=5)
+    args = parser.parse_args()
+
+    db_file = os.path.join(tempfile.mkdtemp(), 'load_test.db')
+    store = UserStore(db_file)
+    users = [f'user{i}' for i in range(args.users)]
+    for username in users:
+        store.create_user(username, 'not-a-real-hash')
+
+    start = time.perf_counter()
+    processes = [Process(target=write_plants, args=(db_file, worker, args.threads, args.writes, users))
+                 for worker in range(args.processes)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - start
+
+    expected = args.processes * args.threads * args.writes
+    stored = sum(len(store.get_user_plants(username)) for username in users)
+    nicknames = {plant['nickname'] for username in users for plant in store.get_user_plants(username)}
+
+    print(f"{expected} concurrent writes in {elapsed:.2f}s ({expected / elapsed:.0f} writes/s)")
+    print(f"Stored plants: {stored}, unique: {len(nicknames)}, expected: {expected}")
+    if stored != expected or len(nicknames) != expected:
+        raise SystemExit("FAILED: writes were lost")
+    print("OK: no lost updates")
@@ -0,0 +1,243 @@
+import bisect
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+# Lightweight Prometheus-style metrics, kept in memory by each process and
+# rendered on /metrics. A timer costs two perf_counter() calls and one locked
+# bucket increment, so it can stay on the hot path.
+
+# Histogram buckets in seconds, from sub-millisecond (histogram, cache lookups) to model loading
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{escape_label(value)}"' for name, value in pairs) + '}'
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """
+    Histogram with fixed buckets, one series per combination of label values.
+    """
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((labels, [list(data[0]), data[1], data[2]]) for labels, data in self._series.items())
+        for labels, (counts, total, count) in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = format_labels(self.labelnames, labels, [('le', format_value(float(bound)))])
+                lines.append(f'{self.name}_bucket{le} {cumulative}')
+            label_text = format_labels(self.labelnames, labels)
+            lines.append(f'{self.name}_sum{label_text} {format_value(total)}')
+            lines.append(f'{self.name}_count{label_text} {count}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            lines.append(f'{self.name}{format_labels(self.labelnames, labels)} {format_value(value)}')
+        return lines
+
+
+class Gauge:
+    # Value read from a callback when the metrics are rendered
+    def __init__(self, name, help, callback, type='gauge'):
+        self.name = name
+        self.help = help
+        self.callback = callback
+        self.type = type
+
+    def render(self):
+        try:
+            value = self.callback()
+        except Exception as e:
+            print(f"Reading metric {self.name} failed: {e}")
+            return []
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.type}',
+                f'{self.name} {format_value(value)}']
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _add(self, metric):
+        with self._lock:
+            # Registering the same name twice returns the existing metric (e.g. on module reload)
+            return self._metrics.setdefault(metric.name, metric)
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help, labelnames, buckets))
+
+    def counter(self, name, help, labelnames=()):
+        return self._add(Counter(name, help, labelnames))
+
+    def gauge(self, name, help, callback, type='gauge'):
+        return self._add(Gauge(name, help, callback, type))
+
+    def render(self):
+        """
+        Returns all metrics in the Prometheus text exposition format.
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.histogram('greenspace_stage_seconds',
+                                   'Time spent in each stage of the request handling', ['stage'])
+
+
+### Per-request profiles:
+
+class Profile:
+    """
+    Stage breakdown of one request, filled by the timers that run while it is active.
+    """
+    def __init__(self):
+        self.stages = {}  # stage -> [seconds, calls]
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            entry = self.stages.setdefault(stage, [0.0, 0])
+            entry[0] += seconds
+            entry[1] += 1
+
+    def server_timing(self, total=None):
+        # Value of the Server-Timing response header (durations in ms)
+        with self._lock:
+            parts = [f'{stage};dur={seconds * 1000:.3f}' for stage, (seconds, _) in self.stages.items()]
+        if total is not None:
+            parts.append(f'total;dur={total * 1000:.3f}')
+        return ', '.join(parts)
+
+
+_local = threading.local()
+
+
+def start_profile():
+    profile = Profile()
+    _local.profiles = (profile,)
+    return profile
+
+
+def end_profile():
+    _local.profiles = None
+
+
+def current_profiles():
+    # Profiles the timers of this thread currently record to
+    return getattr(_local, 'profiles', None)
+
+
+@contextmanager
+def recording_to(profiles):
+    """
+    Records the timers of this thread to the given profiles, e.g. in the worker
+    thread that processes a batch gathered from several requests.
+    """
+    previous = current_profiles()
+    _local.profiles = tuple(profiles) or None
+    try:
+        yield
+    finally:
+        _local.profiles = previous
+
+
+def record(stage, seconds):
+    STAGE_SECONDS.observe(seconds, stage)
+    profiles = getattr(_local, 'profiles', None)
+    if profiles:
+        for profile in profiles:
+            profile.add(stage, seconds)
+
+
+class timer:
+    """
+    Context manager timing one stage:
+
+        with timer('decode'):
+            ...
+    """
+    __slots__ = ('stage', 'start')
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+def timed(stage):
+    # Decorator timing every call of a function as one stage
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record(stage, time.perf_counter() - start)
+        return wrapper
+    return decorator
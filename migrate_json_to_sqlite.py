@@ -0,0 +1,16 @@
+import argparse
+from user_store import UserStore, DB_FILE, migrate_json_files
+
+# One-shot migration of user_data.json and user_plants.json into the SQLite user store.
+# Running it again is safe: users that are already in the database are skipped.
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import the JSON user files into the SQLite database.")
+    parser.add_argument('--db', default=DB_FILE)
+    parser.add_argument('--user-data', default='user_data.json')
+    parser.add_argument('--user-plants', default='user_plants.json')
+    args = parser.parse_args()
+
+    store = UserStore(args.db)
+    users, plants = migrate_json_files(store, args.user_data, args.user_plants)
+    print(f"Imported {users} users and {plants} plants into {args.db}")
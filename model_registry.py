@@ -0,0 +1,215 @@
+import os
+import json
+import pickle
+import threading
+import time
+import numpy as np
+from inference_backends import load_category_model
+from metrics import timed
+
+# Paths of the models used by the two prediction stages (relative to the model directory)
+RF_MODEL_FILE = os.path.join('saved_models', 'rf_classifier_model.pkl')
+
+# category_result -> (keras model file, class indices file)
+CATEGORY_MODEL_FILES = {
+    0: ('my_model_flowering_128_for_project.keras', 'class_indices_flowering.json'),
+    1: ('my_model_foliage_128_last.keras', 'class_indices_foliage.json'),
+    2: ('my_model_palms_and_ferns_128_for_project.keras', 'class_indices_palms_and_ferns.json'),
+    3: ('my_model_succulents_and_cacti_128_for_project.keras', 'class_indices_succulents_and_cacti.json'),
+}
+
+CATEGORY_NAMES = {0: 'flowering', 1: 'foliage', 2: 'palms_and_ferns', 3: 'succulents_and_cacti'}
+
+IMG_SIZE = 128  # the input size of the category models
+RF_FEATURES = 768  # 3 x 256 color histogram bins
+
+
+class ModelSet:
+    """
+    One loaded version of all the models needed for recognition.
+
+    Attributes:
+    - version: Label of this version (model directory or the given version name).
+    - rf_model: The first stage RandomForest classifier (sklearn or CompiledForest).
+    - category_models: Dictionary category_result -> Keras model.
+    - class_indices: Dictionary category_result -> {class index: species label}.
+    - loaded_at: Time the version was loaded.
+    """
+    def __init__(self, version, rf_model, category_models, class_indices):
+        self.version = version
+        self.rf_model = rf_model
+        self.category_models = category_models
+        self.class_indices = class_indices
+        self.loaded_at = time.time()
+
+
+def load_class_indices(class_indices_file):
+    # Load the class indices from the JSON file and convert string keys to integers
+    with open(class_indices_file, 'r') as f:
+        indices_to_labels = json.load(f)
+    return {int(k): v for k, v in indices_to_labels.items()}
+
+
+def load_rf_model(filename):
+    # Load the pickled RandomForest model
+    with open(filename, 'rb') as file:
+        return pickle.load(file)
+
+
+class ModelRegistry:
+    """
+    Keeps the RF and the four category CNNs resident in memory.
+
+    The models are loaded and warmed up once, and every request reads the
+    current ModelSet. Calling load() again with another model directory
+    builds the new version next to the old one and swaps it in when it is
+    ready, so a new model version can be deployed without a restart.
+    """
+    def __init__(self, model_dir='.', backend='keras', quantization='float16', num_threads=None,
+                 species_model='per_category', rf_backend='sklearn'):
+        self.model_dir = model_dir
+        # 'sklearn': the pickled forest, 'compiled': the array format of compiled_forest.py
+        self.rf_backend = rf_backend
+        # 'per_category': the four CNNs, 'multihead': one shared backbone (see multihead_model.py)
+        self.species_model = species_model
+        # How the category models are run, see inference_backends.py
+        self.backend = backend
+        self.quantization = quantization
+        self.num_threads = num_threads
+        self._models = None
+        # (model directory, RF) loaded by a process that forks workers afterwards, see preload_shared()
+        self._shared_rf = None
+        self._lock = threading.Lock()
+        self._first_load = threading.Lock()
+        self._listeners = []
+        self.load_error = None
+
+    @timed('model_load')
+    def load(self, model_dir=None, version=None, warm_up=True):
+        """
+        Loads (or reloads) all models and swaps them in.
+
+        Parameters:
+        - model_dir: Directory holding the model files. Defaults to the current model directory.
+        - version: Optional version name. Defaults to the model directory.
+        - warm_up: Run a dummy prediction through each model before swapping it in.
+
+        Returns:
+        - The new ModelSet.
+        """
+        with self._lock:
+            model_dir = model_dir or self.model_dir
+            if self._shared_rf is not None and self._shared_rf[0] == model_dir:
+                rf_model = self._shared_rf[1]
+            else:
+                rf_model = self.load_rf(model_dir)
+            self._shared_rf = None
+
+            category_models = {}
+            class_indices = {}
+            if self.species_model == 'multihead':
+                from multihead_model import load_multihead_category_models
+                category_models = load_multihead_category_models(model_dir)
+            for category, (model_file, class_indices_file) in CATEGORY_MODEL_FILES.items():
+                if category not in category_models:
+                    category_models[category] = load_category_model(model_dir, model_file, self.backend,
+                                                                    self.quantization, self.num_threads)
+                class_indices[category] = load_class_indices(os.path.join(model_dir, class_indices_file))
+
+            models = ModelSet(version or model_dir, rf_model, category_models, class_indices)
+            if warm_up:
+                self.warm_up(models)
+
+            # Swap the new version in; requests already running keep their reference to the old one
+            self._models = models
+            self.model_dir = model_dir
+            print(f"Models loaded: version {models.version}")
+
+        for listener in list(self._listeners):
+            listener(models)
+        return models
+
+    def load_rf(self, model_dir=None):
+        # The first stage model alone, with the configured RF backend
+        model_dir = model_dir or self.model_dir
+        if self.rf_backend == 'compiled':
+            from compiled_forest import CompiledForest, COMPILED_RF_DIR
+            return CompiledForest.load(os.path.join(model_dir, COMPILED_RF_DIR))
+        return load_rf_model(os.path.join(model_dir, RF_MODEL_FILE))
+
+    def preload_shared(self):
+        """
+        Loads the RF in a process that forks workers afterwards (see serve.py).
+
+        Its arrays are then shared copy-on-write by the workers (and memory-mapped
+        with the compiled backend), and the first load() of the same model
+        directory uses it instead of reading the file again. The CNNs are loaded
+        by each worker: the TensorFlow runtime must not be started before a fork.
+        """
+        self._shared_rf = (self.model_dir, self.load_rf())
+
+    def warm_up(self, models):
+        # The first predict builds the graph and allocates buffers, do it before serving traffic
+        models.rf_model.predict(np.zeros((1, RF_FEATURES), dtype=np.float32))
+        dummy_image = np.zeros((1, IMG_SIZE, IMG_SIZE, 3), dtype=np.float32)
+        for model in models.category_models.values():
+            model.predict(dummy_image, verbose=0)
+
+    def get(self):
+        """
+        Returns the current ModelSet, loading the models on first use.
+        """
+        models = self._models
+        if models is None:
+            # Only the first of several concurrent requests does the loading
+            with self._first_load:
+                if self._models is None:
+                    self.load()
+            models = self._models
+        return models
+
+    def preload(self):
+        """
+        Starts loading and warming up the models in a background thread,
+        so the app can start accepting connections straight away.
+
+        Returns:
+        - The started thread.
+        """
+        thread = threading.Thread(target=self._preload, name='model-preload', daemon=True)
+        thread.start()
+        return thread
+
+    def _preload(self):
+        try:
+            self.get()
+            self.load_error = None
+        except Exception as e:
+            self.load_error = str(e)
+            print(f"Model preloading failed: {e}")
+
+    def is_loaded(self):
+        return self._models is not None
+
+    @property
+    def version(self):
+        models = self._models
+        return models.version if models is not None else None
+
+    def add_listener(self, callback):
+        # callback(models) is called every time a new version is swapped in
+        self._listeners.append(callback)
+
+
+# Shared registry used by functions.py and app.py
+registry = ModelRegistry(os.environ.get('GREENSPACE_MODEL_DIR', '.'),
+                         backend=os.environ.get('GREENSPACE_INFERENCE_BACKEND', 'keras'),
+                         quantization=os.environ.get('GREENSPACE_TFLITE_QUANTIZATION', 'float16'),
+                         num_threads=int(os.environ['GREENSPACE_INFERENCE_THREADS'])
+                         if os.environ.get('GREENSPACE_INFERENCE_THREADS') else None,
+                         species_model=os.environ.get('GREENSPACE_SPECIES_MODEL', 'per_category'),
+                         rf_backend=os.environ.get('GREENSPACE_RF_BACKEND', 'sklearn'))
+
+
+def get_registry():
+    return registry
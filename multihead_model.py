@@ -0,0 +1,265 @@
+import os
+import csv
+import json
+import time
+import argparse
+import subprocess
+import sys
+import numpy as np
+from model_registry import CATEGORY_MODEL_FILES, CATEGORY_NAMES, IMG_SIZE, load_class_indices
+
+# One shared convolutional backbone with a small head per category, instead of four
+# independent CNNs. The RF still picks the category, the backbone runs once and only
+# the head of that category is evaluated.
+#
+#   python multihead_model.py train --epochs 30
+#   python multihead_model.py compare
+#
+# The app uses it with GREENSPACE_SPECIES_MODEL=multihead.
+
+MULTIHEAD_MODEL_FILE = 'my_model_multihead_128.keras'
+
+
+def category_species(model_dir='.'):
+    # Head output order = the order of the existing class_indices_*.json files
+    species = {}
+    for category, (_, class_indices_file) in CATEGORY_MODEL_FILES.items():
+        indices_to_labels = load_class_indices(os.path.join(model_dir, class_indices_file))
+        species[category] = [indices_to_labels[i] for i in sorted(indices_to_labels)]
+    return species
+
+
+def build_multihead_model(category_sizes, img_size=IMG_SIZE):
+    """
+    Builds the backbone of train_model with one classification head per category.
+
+    Parameters:
+    - category_sizes: Dictionary category_result -> number of species.
+
+    Returns:
+    - A Keras model with one softmax output per category, named head_<category name>.
+    """
+    from tensorflow.keras import layers, models
+
+    inputs = layers.Input(shape=(img_size, img_size, 3))
+
+    # Convolutional layers with batch normalization and dropout (same as train_model)
+    x = inputs
+    for filters, dropout in ((32, 0), (64, 0.1), (64, 0), (128, 0.2), (256, 0.2)):
+        x = layers.Conv2D(filters, (3, 3), strides=1, padding='same', activation='relu')(x)
+        if dropout:
+            x = layers.Dropout(dropout)(x)
+        x = layers.BatchNormalization()(x)
+        x = layers.MaxPool2D((2, 2), strides=2, padding='same')(x)
+    features = layers.Flatten(name='backbone_features')(x)
+
+    outputs = {}
+    for category, num_classes in sorted(category_sizes.items()):
+        name = CATEGORY_NAMES[category]
+        h = layers.Dense(units=128, activation='relu', name=f'head_{name}_dense')(features)
+        h = layers.Dropout(0.2, name=f'head_{name}_dropout')(h)
+        outputs[f'head_{name}'] = layers.Dense(units=num_classes, activation='softmax', name=f'head_{name}')(h)
+
+    return models.Model(inputs=inputs, outputs=outputs)
+
+
+class MultiHeadModel:
+    """
+    Serving wrapper: the backbone and every head as separate callables, so a
+    prediction runs the backbone once and then only the heads it needs.
+    """
+    def __init__(self, model):
+        from tensorflow.keras import layers, models
+
+        self.backbone = models.Model(model.input, model.get_layer('backbone_features').output)
+        self.heads = {}
+        for category, name in CATEGORY_NAMES.items():
+            # Rebuild the head on its own input (dropout is inactive at inference)
+            head_input = layers.Input(shape=self.backbone.output.shape[1:])
+            h = model.get_layer(f'head_{name}_dense')(head_input)
+            self.heads[category] = models.Model(head_input, model.get_layer(f'head_{name}')(h))
+
+    def features(self, batch):
+        return self.backbone(np.asarray(batch, dtype=np.float32), training=False)
+
+    def predict_heads(self, batch, categories):
+        # Backbone once, then the given heads: {category: probabilities}
+        features = self.features(batch)
+        return {category: self.heads[category](features, training=False).numpy() for category in categories}
+
+    def head(self, category):
+        return CategoryHead(self, category)
+
+
+class CategoryHead:
+    # Keras-like predict() for one category, used in place of the per-category models
+    def __init__(self, multihead, category):
+        self.multihead = multihead
+        self.category = category
+
+    def predict(self, batch, verbose=0):
+        return self.multihead.predict_heads(batch, [self.category])[self.category]
+
+
+def load_multihead_category_models(model_dir='.'):
+    """
+    Loads the shared model once and returns a category_result -> CategoryHead dictionary.
+    """
+    import tensorflow as tf
+
+    multihead = MultiHeadModel(tf.keras.models.load_model(os.path.join(model_dir, MULTIHEAD_MODEL_FILE)))
+    return {category: multihead.head(category) for category in CATEGORY_NAMES}
+
+
+def read_dataset(csv_file='image_data.csv', base_dir='house_plant_species', model_dir='.'):
+    # (image path, category_result, class index in the category) for every row of image_data.csv
+    species = category_species(model_dir)
+    category_ids = {name: category for category, name in CATEGORY_NAMES.items()}
+    class_ids = {category: {label: i for i, label in enumerate(labels)} for category, labels in species.items()}
+
+    rows = []
+    with open(csv_file, newline='') as file:
+        for row in csv.DictReader(file):
+            category = category_ids.get(row['category'])
+            if category is None or row['species'] not in class_ids[category]:
+                continue
+            rows.append((os.path.join(base_dir, row['species'], row['image_name']),
+                         category, class_ids[category][row['species']]))
+    return rows, species
+
+
+def make_tf_dataset(rows, category_sizes, batch_size, training):
+    import tensorflow as tf
+    from dataset_shards import make_augmentation
+
+    paths = [row[0] for row in rows]
+    categories = [row[1] for row in rows]
+    class_ids = [row[2] for row in rows]
+    dataset = tf.data.Dataset.from_tensor_slices((paths, categories, class_ids))
+    if training:
+        dataset = dataset.shuffle(len(rows), seed=0, reshuffle_each_iteration=True)
+
+    def load(path, category, class_id):
+        image = tf.io.decode_image(tf.io.read_file(path), channels=3, expand_animations=False)
+        image = tf.cast(tf.image.resize(image, (IMG_SIZE, IMG_SIZE), method='nearest'), tf.float32) / 255.0
+        # Each image only trains the head of its own category
+        targets = {}
+        weights = {}
+        for c, num_classes in category_sizes.items():
+            name = f'head_{CATEGORY_NAMES[c]}'
+            is_category = tf.cast(tf.equal(category, c), tf.float32)
+            targets[name] = tf.one_hot(class_id, num_classes) * is_category
+            weights[name] = is_category
+        return image, targets, weights
+
+    dataset = dataset.map(load, num_parallel_calls=tf.data.AUTOTUNE).batch(batch_size)
+    if training:
+        # Same random rotation, zoom, shift and flip as the category models
+        augmentation = make_augmentation()
+        dataset = dataset.map(lambda images, targets, weights: (augmentation(images, training=True), targets, weights),
+                              num_parallel_calls=tf.data.AUTOTUNE)
+    return dataset.prefetch(tf.data.AUTOTUNE)
+
+
+def train_multihead(csv_file='image_data.csv', base_dir='house_plant_species', epochs=30, batch_size=32,
+                    validation_split=0.2, output_file=MULTIHEAD_MODEL_FILE):
+    """
+    Trains the shared backbone and the four heads in one run and saves the model.
+
+    Returns:
+    - The trained model and its training history.
+    """
+    from tensorflow.keras.callbacks import EarlyStopping
+    from tensorflow.keras.optimizers import RMSprop
+    from dataset_shards import split_rows
+
+    rows, species = read_dataset(csv_file, base_dir)
+    category_sizes = {category: len(labels) for category, labels in species.items()}
+
+    # Same validation images as the category models (flow_from_directory's validation subset)
+    split = split_rows(rows, validation_split)
+    train_rows = [row[:3] for row in split if not row[3]]
+    val_rows = [row[:3] for row in split if row[3]]
+
+    model = build_multihead_model(category_sizes)
+    heads = [f'head_{CATEGORY_NAMES[c]}' for c in sorted(category_sizes)]
+    # Same optimizer as train_model, so the accuracy can be compared with the four models
+    model.compile(optimizer=RMSprop(learning_rate=0.0001),
+                  loss={head: 'categorical_crossentropy' for head in heads},
+                  weighted_metrics={head: ['accuracy'] for head in heads})
+
+    history = model.fit(make_tf_dataset(train_rows, category_sizes, batch_size, training=True),
+                        validation_data=make_tf_dataset(val_rows, category_sizes, batch_size, training=False),
+                        epochs=epochs,
+                        callbacks=[EarlyStopping(patience=5, restore_best_weights=True)])
+    model.save(output_file)
+    print(f'Model saved as {output_file}')
+    return model, history
+
+
+def measure(setup, model_dir='.', runs=50):
+    """
+    Loads one setup and measures its memory and single-image latency.
+    Run in a fresh process for each setup so the RSS numbers don't mix.
+    """
+    import psutil
+    import tensorflow as tf  # imported before measuring, the runtime itself is the same in both setups
+
+    process = psutil.Process()
+    rss_before = process.memory_info().rss
+    start = time.perf_counter()
+    if setup == 'multihead':
+        category_models = load_multihead_category_models(model_dir)
+    else:
+        category_models = {category: tf.keras.models.load_model(os.path.join(model_dir, model_file))
+                           for category, (model_file, _) in CATEGORY_MODEL_FILES.items()}
+    load_seconds = time.perf_counter() - start
+
+    image = np.random.RandomState(0).rand(1, IMG_SIZE, IMG_SIZE, 3).astype(np.float32)
+    for model in category_models.values():
+        model.predict(image, verbose=0)  # warm up
+    rss_after = process.memory_info().rss
+
+    latencies = []
+    for i in range(runs):
+        model = category_models[i % len(category_models)]
+        start = time.perf_counter()
+        model.predict(image, verbose=0)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    return {
+        "setup": setup,
+        "models_rss_mb": round((rss_after - rss_before) / 1e6, 1),
+        "total_rss_mb": round(rss_after / 1e6, 1),
+        "load_seconds": round(load_seconds, 2),
+        "latency_ms_p50": round(float(np.percentile(latencies, 50)), 2),
+        "latency_ms_p95": round(float(np.percentile(latencies, 95)), 2),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shared-backbone species model.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    train_parser = subparsers.add_parser('train', help="Train the multi-head model on image_data.csv")
+    train_parser.add_argument('--epochs', type=int, default=30)
+    train_parser.add_argument('--batch-size', type=int, default=32)
+    compare_parser = subparsers.add_parser('compare', help="Memory and latency: four models vs multi-head")
+    compare_parser.add_argument('--model-dir', default='.')
+    compare_parser.add_argument('--runs', type=int, default=50)
+    measure_parser = subparsers.add_parser('measure', help=argparse.SUPPRESS)
+    measure_parser.add_argument('setup', choices=['four_models', 'multihead'])
+    measure_parser.add_argument('--model-dir', default='.')
+    measure_parser.add_argument('--runs', type=int, default=50)
+    args = parser.parse_args()
+
+    if args.command == 'train':
+        train_multihead(epochs=args.epochs, batch_size=args.batch_size)
+    elif args.command == 'measure':
+        print(json.dumps(measure(args.setup, args.model_dir, args.runs)))
+    else:
+        for setup in ('four_models', 'multihead'):
+            output = subprocess.run([sys.executable, __file__, 'measure', setup, '--model-dir', args.model_dir,
+                                     '--runs', str(args.runs)], capture_output=True, text=True, check=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{result['setup']:>12}: models {result['models_rss_mb']} MB RSS (process {result['total_rss_mb']} MB), "
+                  f"load {result['load_seconds']} s, latency p50 {result['latency_ms_p50']} ms / p95 {result['latency_ms_p95']} ms")
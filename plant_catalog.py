@@ -0,0 +1,109 @@
+import os
+import json
+import hashlib
+import threading
+import time
+from metrics import timed
+
+PLANTS_CATALOG = 'corrected_species_data.json'
+
+
+class CatalogSnapshot:
+    """
+    One immutable version of the plant catalog with its indexes.
+
+    Attributes:
+    - plants: Dictionary catalog key -> plant data (as in the JSON file).
+    - by_mapping_name: Dictionary mapping_name (species folder name) -> catalog key.
+    - details: Dictionary catalog key -> (serialized /plant_details body, ETag).
+    - stat: (mtime_ns, size) of the file the snapshot was loaded from.
+    """
+    def __init__(self, plants, stat):
+        self.plants = plants
+        self.stat = stat
+        self.by_mapping_name = {}
+        self.details = {}
+        for key, plant_info in plants.items():
+            mapping_name = plant_info.get('mapping_name')
+            if mapping_name:
+                self.by_mapping_name[mapping_name] = key
+
+            # Pre-serialize the /plant_details response of every plant
+            body = json.dumps({
+                "success": True,
+                "description": plant_info.get('description', {}),
+                "details": plant_info.get('details', {}),
+                "care_info": plant_info.get('care_info', {})
+            }, sort_keys=True).encode('utf-8')
+            self.details[key] = (body, hashlib.sha1(body).hexdigest())
+
+
+class PlantCatalog:
+    """
+    Keeps corrected_species_data.json in memory with O(1) lookups.
+
+    The file is reloaded when its mtime or size changes (checked at most every
+    check_interval seconds). A reload builds a new snapshot and swaps it in,
+    so requests never see a half-built index.
+    """
+    def __init__(self, path=PLANTS_CATALOG, check_interval=5):
+        self.path = path
+        self.check_interval = check_interval
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _file_stat(self):
+        stat = os.stat(self.path)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    @timed('catalog_load')
+    def load(self):
+        with self._lock:
+            stat = self._file_stat()
+            with open(self.path, 'r', encoding='utf-8') as file:
+                plants = json.load(file)
+            self._snapshot = CatalogSnapshot(plants, stat)
+            self._checked_at = time.monotonic()
+        return self._snapshot
+
+    def snapshot(self):
+        """
+        Returns the current snapshot, reloading the file if it changed.
+        """
+        snapshot = self._snapshot
+        if snapshot is None:
+            return self.load()
+        if time.monotonic() - self._checked_at >= self.check_interval:
+            self._checked_at = time.monotonic()
+            try:
+                if self._file_stat() != snapshot.stat:
+                    snapshot = self.load()
+            except (OSError, json.JSONDecodeError) as e:
+                # Keep serving the last good version while the file is being rewritten
+                print(f"Reloading {self.path} failed: {e}")
+        return snapshot
+
+    def all(self):
+        return self.snapshot().plants
+
+    def get(self, key):
+        return self.snapshot().plants.get(key)
+
+    def key_for_mapping_name(self, mapping_name):
+        # Catalog key of a species folder name (the label predicted by the models)
+        return self.snapshot().by_mapping_name.get(mapping_name)
+
+    def details_response(self, key):
+        """
+        Returns the serialized /plant_details body and its ETag, or None if the plant doesn't exist.
+        """
+        return self.snapshot().details.get(key)
+
+
+# Shared catalog used by app.py
+plant_catalog = PlantCatalog()
+
+
+def get_plant_catalog():
+    return plant_catalog
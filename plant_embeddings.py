@@ -0,0 +1,309 @@
+import os
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from model_registry import CATEGORY_MODEL_FILES, CATEGORY_NAMES, get_registry
+from metrics import timer
+
+# "Similar plants": the penultimate layer (Dense 128) of the category CNNs as an embedding
+# of every dataset image, searched with an inverted file (IVF) index.
+#
+#   python plant_embeddings.py build            # after training or replacing the category models
+#
+# Each category has its own embedding space (its own CNN), so there is one index per
+# category, and an upload is searched in the index of the category the RF predicts.
+# The embeddings are L2-normalized float16; the index clusters them with k-means and a
+# query only scans the rows of the nprobe clusters closest to it.
+#
+# The index records the mtime of the .keras file it was built from; when the registry
+# swaps in other models, the index is reloaded and not used until it matches them.
+# Memory: the embedding models are the .keras category models. With the keras backend
+# the resident models are reused; with the tflite or multihead backends the .keras files
+# are loaded once more per process, on the first /similar_plants request.
+
+EMBEDDINGS_DIR = os.path.join('saved_models', 'embeddings')
+INDEX_FILE = 'embedding_index.json'
+
+
+def embedding_model(model):
+    """
+    Returns a Keras model that outputs the activations of the last hidden Dense layer.
+
+    Parameters:
+    - model: A category model (Keras) as trained by train_model.
+    """
+    import tensorflow as tf
+
+    dense_layers = [i for i, layer in enumerate(model.layers[:-1]) if isinstance(layer, tf.keras.layers.Dense)]
+    if not dense_layers:
+        raise ValueError("The model has no hidden Dense layer to use as embedding")
+    # Rebuilt layer by layer: a loaded Sequential model that was never called has no defined input
+    inputs = tf.keras.Input(shape=model.input_shape[1:])
+    outputs = inputs
+    for layer in model.layers[:dense_layers[-1] + 1]:
+        outputs = layer(outputs)
+    return tf.keras.Model(inputs, outputs)
+
+
+def category_embedding_models(models, model_dir='.'):
+    # category_result -> embedding model; the resident Keras models are reused, other backends load the .keras file
+    import tensorflow as tf
+
+    embedding_models = {}
+    for category, (model_file, _) in CATEGORY_MODEL_FILES.items():
+        model = models.category_models.get(category) if models is not None else None
+        if not hasattr(model, 'layers'):
+            model = tf.keras.models.load_model(os.path.join(model_dir, model_file))
+        embedding_models[category] = embedding_model(model)
+    return embedding_models
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def embed(embedding_model, cnn_inputs):
+    # L2-normalized embeddings of a batch of preprocessed 128x128 images
+    return normalize(embedding_model(np.asarray(cnn_inputs, dtype=np.float32), training=False).numpy())
+
+
+def build_ivf(embeddings, nlist=None, random_state=0):
+    """
+    Clusters the embeddings and orders them by cluster.
+
+    Returns:
+    - (order of the rows, centroids, offsets): the rows of cluster i are
+      order[offsets[i]:offsets[i + 1]].
+    """
+    from sklearn.cluster import KMeans
+
+    count = len(embeddings)
+    nlist = nlist or max(1, int(np.sqrt(count)))
+    nlist = min(nlist, count)
+    kmeans = KMeans(n_clusters=nlist, n_init=1, random_state=random_state).fit(embeddings)
+    centroids = normalize(kmeans.cluster_centers_)
+    assignments = kmeans.labels_
+    order = np.argsort(assignments, kind='stable')
+    offsets = np.searchsorted(assignments[order], np.arange(nlist + 1)).astype(np.int32)
+    return order, centroids, offsets
+
+
+def build_embeddings(output_dir=EMBEDDINGS_DIR, csv_file='image_data.csv', base_dir='house_plant_species',
+                     model_dir='.', batch_size=64, workers=8, nlist=None):
+    """
+    Computes the embedding of every dataset image with the model of its category
+    and writes the float16 matrices and IVF indexes.
+
+    A relative output_dir is relative to model_dir, where SimilarityIndex reads it.
+    """
+    from multihead_model import read_dataset
+    from preprocessing import prepare_image
+
+    rows, _ = read_dataset(csv_file, base_dir, model_dir)
+    embedding_models = category_embedding_models(None, model_dir)
+    output_dir = os.path.join(model_dir, output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+
+    index = {"created": time.strftime('%Y-%m-%dT%H:%M:%S'), "categories": {}}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for category, name in CATEGORY_NAMES.items():
+            paths = [path for path, row_category, _ in rows if row_category == category]
+            kept_paths = []
+            embeddings = []
+            for start in range(0, len(paths), batch_size):
+                batch_paths = paths[start:start + batch_size]
+                prepared = list(executor.map(prepare_image, batch_paths))
+                valid = [(path, image) for path, image in zip(batch_paths, prepared) if image is not None]
+                if not valid:
+                    continue
+                kept_paths += [path for path, _ in valid]
+                embeddings.append(embed(embedding_models[category], [image.cnn_input for _, image in valid]))
+            if not embeddings:
+                print(f"No images for {name}")
+                continue
+
+            embeddings = np.concatenate(embeddings)
+            order, centroids, offsets = build_ivf(embeddings, nlist)
+            np.save(os.path.join(output_dir, f'embeddings_{name}.npy'), embeddings[order].astype(np.float16))
+            np.save(os.path.join(output_dir, f'centroids_{name}.npy'), centroids)
+            np.save(os.path.join(output_dir, f'offsets_{name}.npy'), offsets)
+            model_file = os.path.join(model_dir, CATEGORY_MODEL_FILES[category][0])
+            index["categories"][name] = {
+                "paths": [kept_paths[i].replace('\\', '/') for i in order],
+                "model_mtime": os.path.getmtime(model_file) if os.path.exists(model_file) else None,
+            }
+            print(f"{name}: {len(embeddings)} embeddings in {len(centroids)} clusters")
+
+    tmp_path = os.path.join(output_dir, f'{INDEX_FILE}.{os.getpid()}.tmp')
+    with open(tmp_path, 'w') as file:
+        json.dump(index, file)
+    os.replace(tmp_path, os.path.join(output_dir, INDEX_FILE))
+    return index
+
+
+class CategoryIndex:
+    def __init__(self, embeddings, centroids, offsets, paths):
+        self.embeddings = embeddings
+        self.centroids = centroids
+        self.offsets = offsets
+        self.paths = paths
+
+    def search(self, query, k=8, nprobe=4):
+        """
+        Returns the k nearest images as (path, cosine similarity), best first.
+        """
+        nearest_clusters = np.argsort(self.centroids @ query)[::-1][:nprobe]
+        rows = np.concatenate([np.arange(self.offsets[c], self.offsets[c + 1]) for c in nearest_clusters])
+        if len(rows) == 0:
+            return []
+        scores = self.embeddings[rows].astype(np.float32) @ query
+        k = min(k, len(rows))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return [(self.paths[rows[i]], float(scores[i])) for i in best]
+
+
+class SimilarityIndex:
+    """
+    The embedding indexes of all categories, memory-mapped, plus the
+    embedding models of the current model version.
+    """
+    def __init__(self, index_dir=EMBEDDINGS_DIR, nprobe=4):
+        self.index_dir = index_dir
+        self.nprobe = nprobe
+        self._categories = None
+        self._embedding_models = None
+        self._outdated = []  # categories whose model changed since the index was built
+        self._lock = threading.Lock()
+
+    def _path(self, file_name):
+        # The index directory is relative to the model directory, like the models
+        return os.path.join(get_registry().model_dir, self.index_dir, file_name)
+
+    def load(self):
+        with open(self._path(INDEX_FILE), 'r') as file:
+            index = json.load(file)
+        model_dir = get_registry().model_dir
+        categories = {}
+        outdated = []
+        for category, name in CATEGORY_NAMES.items():
+            entry = index["categories"].get(name)
+            if entry is None:
+                continue
+            model_file = os.path.join(model_dir, CATEGORY_MODEL_FILES[category][0])
+            model_mtime = os.path.getmtime(model_file) if os.path.exists(model_file) else None
+            if entry.get("model_mtime") != model_mtime:
+                outdated.append(name)
+            categories[category] = CategoryIndex(
+                np.load(self._path(f'embeddings_{name}.npy'), mmap_mode='r'),
+                np.load(self._path(f'centroids_{name}.npy')),
+                np.load(self._path(f'offsets_{name}.npy')),
+                entry["paths"])
+        self._outdated = outdated
+        self._categories = categories
+        return categories
+
+    def is_available(self):
+        return os.path.exists(self._path(INDEX_FILE))
+
+    def is_current(self):
+        # Whether the index was built with the category models that are loaded now
+        if self._categories is None:
+            with self._lock:
+                if self._categories is None:
+                    self.load()
+        return not self._outdated
+
+    def clear_models(self, *args):
+        # Registry listener: the index and the embedding models are reloaded for the new version
+        with self._lock:
+            self._categories = None
+            self._embedding_models = None
+
+    def _get(self):
+        if self._categories is None or self._embedding_models is None:
+            with self._lock:
+                if self._categories is None:
+                    self.load()
+                if self._embedding_models is None:
+                    registry = get_registry()
+                    self._embedding_models = category_embedding_models(registry.get(), registry.model_dir)
+        return self._categories, self._embedding_models
+
+    def find_similar_batch(self, queries):
+        """
+        Finds the dataset images that look most like each of several images:
+        one RF predict for all of them and one embedding predict per category.
+
+        Parameters:
+        - queries: List of (image source, k): path, bytes or RGB array, and the number of images to return.
+
+        Returns:
+        - List with (category_result, list of (image path, similarity)) for each query,
+          or None if the image can't be read.
+        """
+        from preprocessing import prepare_image
+
+        categories, embedding_models = self._get()
+        results = [None] * len(queries)
+        prepared = [prepare_image(source) for source, _ in queries]
+        valid = [i for i, image in enumerate(prepared) if image is not None]
+        if not valid:
+            return results
+
+        models = get_registry().get()
+        with timer('rf_predict'):
+            category_results = models.rf_model.predict(np.stack([prepared[i].hist_features for i in valid]))
+        groups = {}
+        for i, category_result in zip(valid, category_results):
+            groups.setdefault(int(category_result), []).append(i)
+
+        for category_result, indices in groups.items():
+            if category_result not in categories:
+                for i in indices:
+                    results[i] = (category_result, [])
+                continue
+            with timer('embedding'):
+                vectors = embed(embedding_models[category_result], [prepared[i].cnn_input for i in indices])
+            with timer('similarity_search'):
+                index = categories[category_result]
+                for i, query in zip(indices, vectors):
+                    results[i] = (category_result, index.search(query, queries[i][1], self.nprobe))
+        return results
+
+    def find_similar(self, source, k=8):
+        """
+        Finds the dataset images that look most like an image.
+
+        Returns:
+        - (category_result, list of (image path, similarity)), or None if the image can't be read.
+        """
+        return self.find_similar_batch([(source, k)])[0]
+
+
+# Shared index used by app.py
+similarity_index = SimilarityIndex(nprobe=int(os.environ.get('GREENSPACE_SIMILAR_NPROBE', 4)))
+
+
+def get_similarity_index():
+    return similarity_index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Embeddings of the dataset images for the similar plants search.")
+    parser.add_argument('command', choices=['build'])
+    parser.add_argument('--output', default=EMBEDDINGS_DIR, help="Output folder, relative to --model-dir")
+    parser.add_argument('--model-dir', default='.')
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--workers', type=int, default=8, help="Threads decoding the images")
+    parser.add_argument('--nlist', type=int, default=None, help="Number of clusters per category (default: sqrt(images))")
+    args = parser.parse_args()
+
+    build_embeddings(args.output, model_dir=args.model_dir, batch_size=args.batch_size, workers=args.workers,
+                     nlist=args.nlist)
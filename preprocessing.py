@@ -0,0 +1,165 @@
+import numpy as np
+from metrics import timer
+
+HIST_SIZE = 256  # the image size used for the color histogram of the first stage
+CNN_SIZE = 128  # the input size of the category models
+
+# Offsets that put the R, G and B values into their own 256-bin block
+CHANNEL_OFFSETS = np.array([0, 256, 512], dtype=np.uint16)
+
+# EXIF orientation tag and the transform that turns the stored pixels upright
+EXIF_ORIENTATION_TAG = 0x0112
+ORIENTATION_TRANSFORMS = {
+    2: lambda image: image[:, ::-1],
+    3: lambda image: image[::-1, ::-1],
+    4: lambda image: image[::-1],
+    5: lambda image: image.transpose(1, 0, 2),
+    6: lambda image: image.transpose(1, 0, 2)[:, ::-1],
+    7: lambda image: image.transpose(1, 0, 2)[::-1, ::-1],
+    8: lambda image: image.transpose(1, 0, 2)[::-1],
+}
+
+
+class PreparedImage:
+    """
+    An image decoded once, with the inputs of both prediction stages.
+
+    Attributes:
+    - hist_features: The 768 color histogram features for the RF model.
+    - cnn_input: The normalized 128x128x3 float32 array for the category models.
+    """
+    def __init__(self, hist_features, cnn_input):
+        self.hist_features = hist_features
+        self.cnn_input = cnn_input
+
+
+def color_histogram(image_rgb):
+    """
+    Computes the R, G and B histograms (256 bins each) in one pass.
+
+    Gives the same values as three cv2.calcHist calls concatenated.
+
+    Parameters:
+    - image_rgb: uint8 array of shape (height, width, 3).
+
+    Returns:
+    - float32 array with 768 features.
+    """
+    values = image_rgb.reshape(-1, 3).astype(np.uint16) + CHANNEL_OFFSETS
+    return np.bincount(values.ravel(), minlength=3 * 256).astype(np.float32)
+
+
+def decode_image(data):
+    """
+    Decodes encoded image bytes to an RGB array.
+
+    Parameters:
+    - data: The content of an image file.
+
+    Returns:
+    - uint8 RGB array, or None if the bytes are not a valid image.
+    """
+    import cv2
+
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    # EXIF orientation is ignored, like keras' load_img did for the CNN input (see exif_orientation)
+    image = cv2.imdecode(buffer, cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION)
+    if image is None:
+        return None
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+
+def exif_orientation(data):
+    """
+    Reads the EXIF orientation of encoded image bytes without decoding the pixels.
+
+    Parameters:
+    - data: The content of an image file.
+
+    Returns:
+    - The orientation (1 to 8), 1 if the image has none.
+    """
+    import io
+    from PIL import Image
+
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            orientation = image.getexif().get(EXIF_ORIENTATION_TAG, 1)
+    except Exception:
+        return 1
+    return orientation if orientation in ORIENTATION_TRANSFORMS else 1
+
+
+def apply_orientation(image, orientation):
+    # Rotates/flips a decoded image like cv2.imread does with the EXIF orientation
+    transform = ORIENTATION_TRANSFORMS.get(orientation)
+    return np.ascontiguousarray(transform(image)) if transform else image
+
+
+def to_rgb(image):
+    # Accept grayscale and RGBA arrays as well
+    import cv2
+
+    if image.ndim == 2:
+        return cv2.cvtColor(image, cv2.COLOR_GRAY2RGB)
+    if image.shape[-1] == 4:
+        return cv2.cvtColor(image, cv2.COLOR_RGBA2RGB)
+    return image
+
+
+def prepare_rgb(image_rgb, orientation=1):
+    """
+    Builds the inputs of both stages from an RGB array.
+
+    Parameters:
+    - image_rgb: uint8 RGB array of any size, as stored (EXIF orientation not applied).
+    - orientation: The EXIF orientation of the image, applied to the histogram input only.
+
+    Returns:
+    - A PreparedImage.
+    """
+    import cv2
+
+    # First stage: histogram of the upright image resized to 256x256, the RF was trained
+    # on images read with cv2.imread, which applies the EXIF orientation
+    with timer('histogram'):
+        hist_image = cv2.resize(apply_orientation(image_rgb, orientation), (HIST_SIZE, HIST_SIZE))
+        hist_features = color_histogram(hist_image)
+
+    # Second stage: nearest neighbour resize to 128x128 (same as keras' load_img) and normalize
+    with timer('cnn_resize'):
+        cnn_image = cv2.resize(image_rgb, (CNN_SIZE, CNN_SIZE), interpolation=cv2.INTER_NEAREST_EXACT)
+        cnn_input = cnn_image.astype(np.float32) / 255.0
+
+    return PreparedImage(hist_features, cnn_input)
+
+
+def prepare_image(source):
+    """
+    Decodes an image once and prepares the inputs of both prediction stages.
+
+    Parameters:
+    - source: The image bytes, an already decoded uint8 RGB array (upright), or a path to the image file.
+
+    Returns:
+    - A PreparedImage, or None if the image can't be read.
+    """
+    if isinstance(source, np.ndarray):
+        return prepare_rgb(to_rgb(source))
+
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        data = source
+    else:
+        try:
+            with timer('read_file'), open(source, 'rb') as file:
+                data = file.read()
+        except OSError as e:
+            print(f"Image not found or corrupted: {source} ({e})")
+            return None
+
+    with timer('decode'):
+        image_rgb = decode_image(data)
+    if image_rgb is None:
+        print("Image not found or corrupted")
+        return None
+    return prepare_rgb(image_rgb, exif_orientation(data))
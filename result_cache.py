@@ -0,0 +1,138 @@
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+def perceptual_hash(image_rgb):
+    """
+    Computes a 64 bit difference hash (dHash) of an image.
+
+    Recompressed or resized copies of the same photo usually get the same hash.
+
+    Parameters:
+    - image_rgb: uint8 RGB array.
+
+    Returns:
+    - The hash as a hex string.
+    """
+    import cv2
+
+    gray = cv2.cvtColor(image_rgb, cv2.COLOR_RGB2GRAY)
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return f"{value:016x}"
+
+
+class ResultCache:
+    """
+    LRU cache of recognition results keyed by the hash of the image bytes
+    (and optionally by a perceptual hash of the decoded image).
+
+    Entries expire after ttl seconds and the least recently used entries are
+    dropped when max_entries is reached. clear() is called when a new model
+    version is loaded.
+    """
+    def __init__(self, max_entries=1024, ttl=3600, perceptual=False):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.perceptual = perceptual
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, results = entry
+            if self.ttl and time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return results
+
+    def put(self, key, results, generation=None):
+        with self._lock:
+            # Don't store results computed with models that were swapped out meanwhile
+            if generation is not None and generation != self._generation:
+                return
+            self._entries[key] = (time.monotonic(), results)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self, *args):
+        # Accepts the ModelSet when used as a model registry listener
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+
+    def recognize(self, data, recognize):
+        """
+        Returns the cached results of an image, or computes and caches them.
+
+        Parameters:
+        - data: The image bytes.
+        - recognize: Function image -> results (called with the bytes, or with
+          the decoded RGB array when the perceptual key was computed).
+
+        Returns:
+        - A copy of the results (None if the image couldn't be recognized).
+        """
+        generation = self._generation
+        keys = ['sha256:' + hashlib.sha256(data).hexdigest()]
+        results = self.get(keys[0])
+        source = data
+
+        if results is None and self.perceptual:
+            from preprocessing import decode_image, exif_orientation
+
+            image_rgb = decode_image(data)
+            if image_rgb is not None:
+                keys.append('dhash:' + perceptual_hash(image_rgb))
+                results = self.get(keys[1])
+                # Reuse the decoded image for the recognition, unless the histogram needs the
+                # EXIF orientation that the array doesn't carry
+                if exif_orientation(data) == 1:
+                    source = image_rgb
+                if results is not None:
+                    # Remember the exact bytes too, the next request won't need to decode
+                    self.put(keys[0], results, generation)
+
+        with self._lock:
+            if results is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        if results is None:
+            results = recognize(source)
+            if results is None:
+                return None
+            for key in keys:
+                self.put(key, results, generation)
+
+        # The caller adjusts the results for the response, keep the cached ones intact
+        return copy.deepcopy(results)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
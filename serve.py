@@ -0,0 +1,309 @@
+import os
+import sys
+import time
+import json
+import signal
+import socket
+import argparse
+import tempfile
+import threading
+
+# Multi-process serving: one master process loads the read-only data once and
+# forks the workers, which all accept connections on the same listening socket.
+#
+#   python serve.py --workers 4 --port 8000
+#   python serve.py memory <master pid>          # RSS / PSS / USS of the master and its workers
+#   kill -USR1 <master pid>                      # the master prints the same report
+#
+# Before forking, the master loads the plant catalog, the example-image index and
+# the RF (see ModelRegistry.preload_shared) and imports OpenCV, so the workers share
+# those pages copy-on-write; with GREENSPACE_RF_BACKEND=compiled the forest is
+# memory-mapped and shared through the page cache. TensorFlow is not imported in the
+# master: its runtime (thread pools) must not be started before a fork, so each worker
+# imports it, loads and warms up the CNNs itself (with GREENSPACE_INFERENCE_BACKEND=tflite
+# the model files are memory-mapped).
+#
+# Each worker gets cpu_count / workers intra-op threads (TensorFlow, TFLite, OpenMP,
+# OpenCV), so the workers together don't oversubscribe the CPU. Variables already set
+# in the environment (e.g. GREENSPACE_INFERENCE_THREADS) are kept.
+#
+# Per-worker memory: USS (unique set size) is the memory only that worker uses, i.e.
+# what starting one more worker costs; PSS splits the shared pages between the
+# processes that map them. Both come from /proc/<pid>/smaps_rollup (Linux).
+# The metrics of /metrics are per process.
+#
+# Model reloads: POST /admin/reload_models on any worker is forwarded to the master
+# (SIGUSR2 plus a request file), which signals every worker to load the new version,
+# so all the workers (and the ones started later) serve the same version. The route
+# answers 202 and each worker logs the outcome of its reload. The master only loads
+# the RF of the new version when it has to start a worker.
+
+
+def worker_threads(workers):
+    return max(1, (os.cpu_count() or 1) // workers)
+
+
+def set_thread_limits(threads):
+    # Must run before TensorFlow and OpenCV are imported
+    for name in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'TF_NUM_INTRAOP_THREADS',
+                 'GREENSPACE_INFERENCE_THREADS'):
+        os.environ.setdefault(name, str(threads))
+    os.environ.setdefault('TF_NUM_INTEROP_THREADS', '1')
+
+
+def preload():
+    """
+    Imports the app in the master process without loading the CNNs.
+
+    Returns:
+    - The app module, with the catalog, example index and RF loaded.
+    """
+    os.environ['GREENSPACE_MODEL_PRELOAD'] = 'lazy'
+    import app as app_module
+    from model_registry import get_registry
+
+    get_registry().preload_shared()
+    # Imported (not initialized) so its memory is shared too
+    import cv2  # noqa: F401
+    return app_module
+
+
+def read_reload_request(reload_file):
+    # {"model_dir": ..., "version": ...} of the last reload, {} if there was none
+    try:
+        with open(reload_file, 'r') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def forward_reload(reload_file, master_pid):
+    # Installed as app.model_reload_hook in the workers: the master reloads every worker
+    def request_reload(model_dir=None, version=None):
+        tmp_path = f'{reload_file}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump({"model_dir": model_dir, "version": version}, file)
+        os.replace(tmp_path, reload_file)
+        os.kill(master_pid, signal.SIGUSR2)
+    return request_reload
+
+
+def reload_worker(reload_file):
+    # SIGUSR2 in a worker: load the requested version in the background, requests keep using the current one
+    from model_registry import get_registry
+
+    def load():
+        request = read_reload_request(reload_file)
+        try:
+            models = get_registry().load(model_dir=request.get('model_dir'), version=request.get('version'))
+            print(f"Worker {os.getpid()}: reloaded version {models.version}")
+        except Exception as e:
+            # The previous version stays active
+            print(f"Worker {os.getpid()}: model loading failed: {e}")
+
+    threading.Thread(target=load, name='model-reload', daemon=True).start()
+
+
+def run_worker(app_module, listener, host, port, threads, reload_file, master_pid, version=None):
+    from werkzeug.serving import make_server
+    import cv2
+    from model_registry import get_registry
+
+    app_module.user_store.after_fork()
+    app_module.model_reload_hook = forward_reload(reload_file, master_pid)
+    cv2.setNumThreads(threads)
+    # SIGTERM stops serve_forever, see spawn()
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGUSR1, signal.SIG_DFL)
+    signal.signal(signal.SIGUSR2, lambda signum, frame: reload_worker(reload_file))
+
+    try:
+        get_registry().load(version=version)
+    except Exception as e:
+        print(f"Worker {os.getpid()}: loading the models failed: {e}")
+        os._exit(1)
+    server = make_server(host, port, app_module.app, threaded=True, fd=listener.fileno())
+    print(f"Worker {os.getpid()} ready")
+    server.serve_forever()
+
+
+def spawn(app_module, listener, host, port, threads, reload_file, version=None):
+    master_pid = os.getpid()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            run_worker(app_module, listener, host, port, threads, reload_file, master_pid, version)
+        except SystemExit:
+            pass
+        finally:
+            # Write the buffered submissions, then never return into the master's code
+            app_module.submission_log.flush()
+            os._exit(0)
+    return pid
+
+
+def serve(host='127.0.0.1', port=5000, workers=None, threads=None):
+    """
+    Runs the app in several worker processes that share the preloaded data.
+
+    Parameters:
+    - host, port: Address to listen on.
+    - workers: Number of worker processes (default: GREENSPACE_WORKERS, or one per 2 cores).
+    - threads: Intra-op threads per worker (default: cpu_count / workers).
+    """
+    workers = workers or int(os.environ.get('GREENSPACE_WORKERS', max(1, (os.cpu_count() or 1) // 2)))
+    threads = threads or worker_threads(workers)
+    set_thread_limits(threads)
+
+    listener = socket.create_server((host, port), backlog=128)
+    listener.set_inheritable(True)
+    app_module = preload()
+    print(f"Serving on http://{host}:{port} with {workers} workers, {threads} threads each")
+
+    pids = set()
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(pids):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGUSR1, lambda signum, frame: print_memory_report(os.getpid()))
+
+    from model_registry import get_registry
+
+    registry = get_registry()
+    reload_file = os.path.join(tempfile.gettempdir(), f'greenspace-reload-{os.getpid()}.json')
+    # Model directory and version the workers serve (the ones started later too), and the
+    # model directory of the RF preloaded in the master
+    current = {"model_dir": registry.model_dir, "version": None}
+    loaded = {"model_dir": registry.model_dir, "version": None}
+    reload_requested = threading.Event()
+
+    # Only a flag: the reload is handled by the loop below, not in the signal handler
+    signal.signal(signal.SIGUSR2, lambda signum, frame: reload_requested.set())
+
+    def reload_workers():
+        # A worker forwarded POST /admin/reload_models: each worker loads the new version itself
+        request = read_reload_request(reload_file)
+        current["model_dir"] = request.get('model_dir') or current["model_dir"]
+        current["version"] = request.get('version')
+        print(f"Reloading the models of {len(pids)} workers from {current['model_dir']}")
+        for pid in list(pids):
+            try:
+                os.kill(pid, signal.SIGUSR2)
+            except ProcessLookupError:
+                pass
+
+    def start_worker():
+        # Preload the RF of the version the new worker will serve, once per version
+        if current["model_dir"] != loaded["model_dir"]:
+            try:
+                registry.model_dir = current["model_dir"]
+                registry.preload_shared()
+                loaded.update(current)
+            except Exception as e:
+                print(f"Loading the models of {current['model_dir']} failed, keeping the previous version: {e}")
+                registry.model_dir = loaded["model_dir"]
+                current.update(loaded)
+        pids.add(spawn(app_module, listener, host, port, threads, reload_file, current["version"]))
+
+    for _ in range(workers):
+        start_worker()
+
+    while pids:
+        if reload_requested.is_set():
+            reload_requested.clear()
+            reload_workers()
+        try:
+            # Poll, so a reload request is handled while the workers run
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid == 0:
+            time.sleep(0.2)
+            continue
+        pids.discard(pid)
+        if not stopping:
+            # Replace a crashed worker, but don't spin if they fail at startup
+            print(f"Worker {pid} exited with status {status}, starting a new one")
+            time.sleep(1)
+            start_worker()
+    listener.close()
+    if os.path.exists(reload_file):
+        os.remove(reload_file)
+
+
+### Memory report:
+
+def read_memory(pid):
+    """
+    Reads the memory counters of a process from /proc (Linux).
+
+    Returns:
+    - Dictionary with rss, pss and uss in bytes.
+    """
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup', 'r') as file:
+        for line in file:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].endswith(':') and parts[1].isdigit():
+                values[parts[0][:-1]] = int(parts[1]) * 1024
+    return {"rss": values.get('Rss', 0), "pss": values.get('Pss', 0),
+            "uss": values.get('Private_Clean', 0) + values.get('Private_Dirty', 0)}
+
+
+def child_pids(pid):
+    children = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', 'r') as file:
+                stat = file.read()
+        except OSError:
+            continue
+        # The fields after the command name (which may contain spaces): state, ppid, ...
+        if int(stat.rsplit(')', 1)[1].split()[1]) == pid:
+            children.append(int(entry))
+    return sorted(children)
+
+
+def print_memory_report(master_pid):
+    print(f"{'process':<16}{'RSS MB':>10}{'PSS MB':>10}{'USS MB':>10}")
+    total_pss = 0
+    for role, pid in [('master', master_pid)] + [('worker', pid) for pid in child_pids(master_pid)]:
+        try:
+            memory = read_memory(pid)
+        except OSError as e:
+            print(f"Reading the memory of {pid} failed: {e}")
+            continue
+        total_pss += memory['pss']
+        print(f"{f'{role} {pid}':<16}{memory['rss'] / 2**20:>10.1f}{memory['pss'] / 2**20:>10.1f}"
+              f"{memory['uss'] / 2**20:>10.1f}")
+    print(f"{'total (PSS)':<16}{'':>10}{total_pss / 2**20:>10.1f}")
+    sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the app with several worker processes.")
+    subparsers = parser.add_subparsers(dest='command')
+    memory_parser = subparsers.add_parser('memory', help="Memory of a running master and its workers")
+    memory_parser.add_argument('pid', type=int)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--threads', type=int, default=None, help="Intra-op threads per worker")
+    args = parser.parse_args()
+
+    if args.command == 'memory':
+        print_memory_report(args.pid)
+    else:
+        serve(args.host, args.port, args.workers, args.threads)
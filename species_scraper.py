@@ -0,0 +1,442 @@
+import os
+import json
+import time
+import hashlib
+import argparse
+import threading
+from datetime import datetime, timezone
+from urllib.parse import quote, urljoin, urlsplit
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from plant_catalog import PLANTS_CATALOG
+from images_transfer import SPECIES_LIST
+
+try:
+    import fcntl
+except ImportError:  # Windows: the merge is still atomic, but concurrent runs aren't serialized
+    fcntl = None
+
+# Scrapes the plant care data of corrected_species_data.json (what webscrap.ipynb did
+# with one Selenium session) with a pool of HTTP fetch workers.
+#
+#   python species_scraper.py update                     # only the species missing from the catalog
+#   python species_scraper.py update --max-age 30        # and the entries older than 30 days
+#   python species_scraper.py update --species "Moth Orchid" --workers 8 --rate 2
+#   python species_scraper.py serve-fixtures --pages scrape_cache --port 8765
+#   python species_scraper.py update --base-url http://127.0.0.1:8765 --catalog /tmp/catalog.json
+#
+# Every fetched page is kept in CACHE_DIR, so re-running after an interruption doesn't
+# fetch anything twice. The results are merged into the catalog file under a lock and
+# written to a temporary file that replaces it, so the app (which reloads the catalog
+# when the file changes) never reads a half-written file.
+#
+# Fixture mode: serve-fixtures serves the pages recorded in a cache directory on a
+# local port, by path and query string, and --base-url points the scraper to it, so
+# the whole scraper runs offline against recorded pages.
+
+BASE_URL = 'https://perenual.com'
+SEARCH_URL = '/plant-species-database-search-finder?search={query}'
+CACHE_DIR = 'scrape_cache'
+USER_AGENT = 'GreenSpace species scraper'
+
+# Search name (catalog key) of every species, in the order of SPECIES_LIST (mapping names)
+SEARCH_NAMES = [
+    'African_Violet', 'Aloe_Vera', 'Anthurium', 'Dypsis lutescens', 'Asparagus Fern', 'Begonia',
+    "Bird's Nest", 'Strelitzia reginae', 'Nephrolepis_exaltata', 'Calathea', 'Aspidistra_elatior',
+    "Aglaonema 'Cutlass'a", 'Chinese_Money_Plant_Pilea_peperomioides', 'Schlumbergera buckleyi',
+    "Chrysanthemum 'Fireworks Igloo", 'Ctenanthe', "Narcissus 'Ambergate'", 'Dracaena marginata', 'Dumb Cane',
+    'Alocasia', 'Hedera Helix', 'Hyacinth', 'Iron_Cross_begonia', 'Crassula_ovata', 'Kalanchoe', 'Hemerocallis',
+    'Convallaria', 'Pachira_aquatica', 'Monstera_Deliciosa', 'Moth Orchid', 'Parlor_Palm', 'Peace_lily',
+    'Poinsettia', 'Polka_Dot', 'Beaucarnea', 'Pothos', 'Prayer_Plant', 'Rattlesnake', 'Rubber_Plant', 'Sago Palm',
+    'Umbrella Plant', 'Sanseviera pattens', 'Inch Plant', 'kaufmanniana tulip', 'Venus Fly Trap', 'Spineless Yucca',
+    'ZZ Plant'
+]
+SPECIES_MAPPING = dict(zip(SEARCH_NAMES, SPECIES_LIST))
+
+# CSS selectors of the notebook
+RESULT_LINK = 'a.search-container-box.shadow.relative'
+DESCRIPTION = 'div.text-xs.rounded-md.my-2'
+DETAILS = 'div.text-xs.grid.md\\:grid-cols-2.gap-2.bg-gray-100.rounded.p-3'
+DETAIL_ITEM = 'div.flex.items-center.gap-1.capitalize'
+CARE_SECTION = 'div.rounded-md.shadow.p-3'
+CARE_HEADING = 'h3.font-bold.text-xl.capitalize'
+
+
+### Fetching:
+
+class RateLimiter:
+    # At most `rate` requests per second over all the worker threads
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+class PageCache:
+    """
+    Raw pages on disk: <sha1 of the url>.html plus a .json with the url and fetch time.
+    """
+    def __init__(self, cache_dir=CACHE_DIR):
+        self.cache_dir = cache_dir
+
+    def _paths(self, url):
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, f'{key}.html'), os.path.join(self.cache_dir, f'{key}.json')
+
+    def get(self, url, max_age=None):
+        # The cached page, or None if there is none or it is older than max_age seconds
+        page_path, meta_path = self._paths(url)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as file:
+                meta = json.load(file)
+            if max_age is not None and time.time() - meta['fetched_at'] > max_age:
+                return None
+            with open(page_path, 'r', encoding='utf-8') as file:
+                return file.read()
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def put(self, url, text):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        page_path, meta_path = self._paths(url)
+        for path, content in ((page_path, text), (meta_path, json.dumps({"url": url, "fetched_at": time.time()}))):
+            tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                file.write(content)
+            os.replace(tmp_path, path)
+
+    def recorded_pages(self):
+        # path and query -> page file, for the fixture server
+        pages = {}
+        if not os.path.isdir(self.cache_dir):
+            return pages
+        for file_name in os.listdir(self.cache_dir):
+            if not file_name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.cache_dir, file_name), 'r', encoding='utf-8') as file:
+                    url = json.load(file)['url']
+            except (OSError, ValueError, KeyError):
+                continue
+            pages[path_and_query(url)] = os.path.join(self.cache_dir, file_name[:-len('.json')] + '.html')
+        return pages
+
+
+def path_and_query(url):
+    parts = urlsplit(url)
+    return parts.path + (f'?{parts.query}' if parts.query else '')
+
+
+class Fetcher:
+    """
+    Rate-limited, cached HTTP GET shared by the worker threads.
+    """
+    def __init__(self, cache, rate=1.0, max_age=None, timeout=10, retries=3):
+        self.cache = cache
+        self.limiter = RateLimiter(rate)
+        self.max_age = max_age
+        self.timeout = timeout
+        self.retries = retries
+        self._local = threading.local()
+        self.fetched = 0
+        self.cached = 0
+        self._lock = threading.Lock()
+
+    def _session(self):
+        # One requests session (connection pool) per worker thread
+        import requests
+
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+            session.headers['User-Agent'] = USER_AGENT
+        return session
+
+    def get(self, url):
+        text = self.cache.get(url, self.max_age)
+        if text is not None:
+            with self._lock:
+                self.cached += 1
+            return text
+
+        import requests
+
+        for attempt in range(self.retries):
+            self.limiter.wait()
+            try:
+                response = self._session().get(url, timeout=self.timeout)
+            except requests.RequestException as e:
+                error = e
+            else:
+                if response.status_code == 200:
+                    self.cache.put(url, response.text)
+                    with self._lock:
+                        self.fetched += 1
+                    return response.text
+                if response.status_code not in (429, 500, 502, 503, 504):
+                    raise ValueError(f"GET {url} returned {response.status_code}")
+                error = ValueError(f"GET {url} returned {response.status_code}")
+                retry_after = response.headers.get('Retry-After', '')
+                if retry_after.isdigit():
+                    time.sleep(min(int(retry_after), 60))
+                    continue
+            time.sleep(2 ** attempt)
+        raise error
+
+
+### Parsing:
+
+def first_result_url(search_page, base_url):
+    # Link of the first search result, resolved against base_url (so recorded pages stay local)
+    from bs4 import BeautifulSoup
+
+    link = BeautifulSoup(search_page, 'html.parser').select_one(RESULT_LINK)
+    if link is None or not link.get('href'):
+        return None
+    return urljoin(base_url, path_and_query(urljoin(base_url, link['href'])))
+
+
+def parse_species_page(page):
+    """
+    Extracts the description, details and care info of a species page.
+
+    Returns:
+    - Dictionary with description, details and care_info (None if the page has no description).
+    """
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(page, 'html.parser')
+    description = soup.select_one(DESCRIPTION)
+    if description is None:
+        return None
+
+    details = {}
+    details_box = soup.select_one(DETAILS)
+    if details_box is not None:
+        for detail in details_box.select(DETAIL_ITEM):
+            key, value = detail.find('h3'), detail.find('p')
+            if key is not None and value is not None:
+                details[key.get_text().strip().strip(':')] = value.get_text().strip()
+
+    care_info = {}
+    for section in soup.select(CARE_SECTION):
+        heading, text = section.select_one(CARE_HEADING), section.find('p')
+        if heading is not None and text is not None:
+            care_info[heading.get_text().strip()] = text.get_text().strip()
+
+    return {"description": description.get_text().strip(), "details": details, "care_info": care_info}
+
+
+def scrape_species(fetcher, search_name, base_url=BASE_URL):
+    """
+    Searches one species and scrapes its first result.
+
+    Returns:
+    - The catalog entry without mapping_name, or None if nothing was found.
+    """
+    search_url = urljoin(base_url, SEARCH_URL.format(query=quote(search_name.replace('_', ' '))))
+    species_url = first_result_url(fetcher.get(search_url), base_url)
+    if species_url is None:
+        return None
+    return parse_species_page(fetcher.get(species_url))
+
+
+### Catalog update:
+
+def entry_age(entry, catalog_mtime):
+    # Seconds since the entry was scraped (entries of the notebook count from the file's mtime)
+    scraped_at = entry.get('scraped_at') if entry else None
+    if scraped_at:
+        return time.time() - datetime.fromisoformat(scraped_at).timestamp()
+    return time.time() - catalog_mtime
+
+
+def species_to_update(catalog, catalog_mtime, species, max_age=None):
+    # New species, species without data, and (with max_age) the entries older than max_age seconds
+    names = []
+    for name in species:
+        entry = catalog.get(name)
+        if not entry or entry.get('description') is None:
+            names.append(name)
+        elif max_age is not None and entry_age(entry, catalog_mtime) > max_age:
+            names.append(name)
+    return names
+
+
+def read_catalog(catalog_file):
+    try:
+        with open(catalog_file, 'r', encoding='utf-8') as file:
+            return json.load(file), os.path.getmtime(catalog_file)
+    except FileNotFoundError:
+        return {}, time.time()
+
+
+def merge_into_catalog(catalog_file, updates):
+    """
+    Merges the scraped entries into the catalog file atomically.
+
+    The file is read again under an exclusive lock, so entries written by another
+    run in the meantime are kept, and replaced in one rename. The line endings of
+    the existing file are kept.
+    """
+    lock_fd = os.open(f'{catalog_file}.lock', os.O_WRONLY | os.O_CREAT, 0o644)
+    try:
+        if fcntl is not None:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX)
+        catalog, _ = read_catalog(catalog_file)
+        newline = '\n'
+        if os.path.exists(catalog_file):
+            with open(catalog_file, 'rb') as file:
+                newline = '\r\n' if b'\r\n' in file.read(4096) else '\n'
+        for name, entry in updates.items():
+            catalog[name] = entry
+
+        tmp_path = f'{catalog_file}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8', newline=newline) as file:
+            json.dump(catalog, file, ensure_ascii=False, indent=4)
+        os.replace(tmp_path, catalog_file)
+    finally:
+        if fcntl is not None:
+            fcntl.flock(lock_fd, fcntl.LOCK_UN)
+        os.close(lock_fd)
+
+
+def update_catalog(catalog_file=PLANTS_CATALOG, species=None, max_age=None, workers=4, rate=1.0,
+                   base_url=BASE_URL, cache_dir=CACHE_DIR):
+    """
+    Scrapes the species that are new, have no data or are older than max_age, and merges them into the catalog.
+
+    Parameters:
+    - catalog_file: corrected_species_data.json.
+    - species: Search names to consider (default: all of SEARCH_NAMES).
+    - max_age: Re-scrape the entries (and cached pages) older than this many seconds; None: only missing ones.
+    - workers: Number of concurrent fetch workers.
+    - rate: Maximum number of requests per second over all workers.
+    - base_url: The site, or the address of the fixture server.
+
+    Returns:
+    - Dictionary with the lists of updated and failed species and the fetch counts.
+    """
+    catalog, catalog_mtime = read_catalog(catalog_file)
+    names = species_to_update(catalog, catalog_mtime, species or SEARCH_NAMES, max_age)
+    fetcher = Fetcher(PageCache(cache_dir), rate, max_age)
+
+    def scrape(name):
+        try:
+            return name, scrape_species(fetcher, name, base_url)
+        except Exception as e:
+            print(f"Error occurred while processing {name}: {e}")
+            return name, None
+
+    updates = {}
+    failed = []
+    scraped_at = datetime.now(timezone.utc).isoformat(timespec='seconds')
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for name, data in executor.map(scrape, names):
+            if data is None:
+                failed.append(name)
+                if name not in catalog:
+                    # Keep the species in the catalog with empty data, like the notebook
+                    updates[name] = {"mapping_name": SPECIES_MAPPING.get(name), "description": None,
+                                     "details": None, "care_info": None}
+                continue
+            mapping_name = (catalog.get(name) or {}).get('mapping_name') or SPECIES_MAPPING.get(name)
+            updates[name] = {"mapping_name": mapping_name, **data, "scraped_at": scraped_at}
+
+    if updates:
+        merge_into_catalog(catalog_file, updates)
+    return {"updated": sorted(name for name in updates if name not in failed), "failed": failed,
+            "fetched": fetcher.fetched, "cached": fetcher.cached}
+
+
+### Fixture mode:
+
+class FixtureServer:
+    """
+    Local HTTP stand-in for the site, serving the pages recorded in a cache directory.
+
+        with FixtureServer('scrape_cache') as server:
+            update_catalog(..., base_url=server.url)
+    """
+    def __init__(self, pages_dir=CACHE_DIR, host='127.0.0.1', port=0):
+        pages = PageCache(pages_dir).recorded_pages()
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                page_file = pages.get(self.path)
+                if page_file is None:
+                    self.send_error(404)
+                    return
+                with open(page_file, 'rb') as file:
+                    body = file.read()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.pages = pages
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.url = f'http://{host}:{self.server.server_address[1]}'
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name='fixture-server', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrape the plant care data into the plant catalog.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    update_parser = subparsers.add_parser('update', help="Scrape new and outdated species")
+    update_parser.add_argument('--catalog', default=PLANTS_CATALOG)
+    update_parser.add_argument('--species', action='append', help="Search name (default: all species)")
+    update_parser.add_argument('--max-age', type=float, default=None,
+                               help="Re-scrape entries older than this many days")
+    update_parser.add_argument('--workers', type=int, default=4)
+    update_parser.add_argument('--rate', type=float, default=1.0, help="Requests per second")
+    update_parser.add_argument('--base-url', default=BASE_URL)
+    update_parser.add_argument('--cache', default=CACHE_DIR)
+    fixture_parser = subparsers.add_parser('serve-fixtures', help="Serve recorded pages on a local port")
+    fixture_parser.add_argument('--pages', default=CACHE_DIR)
+    fixture_parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    if args.command == 'update':
+        max_age = args.max_age * 24 * 60 * 60 if args.max_age is not None else None
+        result = update_catalog(args.catalog, args.species, max_age, args.workers, args.rate, args.base_url,
+                                args.cache)
+        print(f"Updated {len(result['updated'])} species, {len(result['failed'])} failed "
+              f"({result['fetched']} pages fetched, {result['cached']} from the cache)")
+        for name in result['failed']:
+            print(f"No data found for {name}")
+    else:
+        server = FixtureServer(args.pages, port=args.port)
+        print(f"Serving {len(server.pages)} recorded pages on {server.url}")
+        try:
+            server.server.serve_forever()
+        except KeyboardInterrupt:
+            pass
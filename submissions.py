@@ -0,0 +1,175 @@
+import os
+import json
+import atexit
+import threading
+from collections import Counter
+from metrics import timed
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are still serialized inside the process
+    fcntl = None
+
+SUBMISSIONS_FILE = 'submitted_plants.json'
+
+# Durability policies:
+# - 'immediate': write every submission before answering the request
+# - 'batch': write buffered submissions every flush_interval seconds (or when the buffer is full)
+# - 'fsync': like 'batch', and fsync the file after every write
+DURABILITY_POLICIES = ('immediate', 'batch', 'fsync')
+
+
+def normalize_plant_name(plant_name):
+    # "  Monstera   deliciosa " and "monstera Deliciosa" count as the same name
+    return ' '.join(plant_name.split()).casefold()
+
+
+class SubmissionLog:
+    """
+    Buffered writer of the plant names submitted for future training.
+
+    Submissions are appended to SUBMISSIONS_FILE (one JSON object per line) in
+    batches, with one locked append per batch so lines from several worker
+    processes never interleave. The counts per normalized name are kept up to
+    date by reading only the part of the file appended since the last summary.
+    """
+    def __init__(self, path=SUBMISSIONS_FILE, flush_interval=2.0, max_buffer=100, durability='batch'):
+        if durability not in DURABILITY_POLICIES:
+            raise ValueError(f"Unknown durability policy {durability}, use one of {DURABILITY_POLICIES}")
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.durability = durability
+
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+        # Incremental aggregation of the log
+        self._read_lock = threading.Lock()
+        self._offset = 0
+        self._counts = Counter()
+        self._names = {}
+        self._total = 0
+
+        atexit.register(self.flush)
+
+    @timed('submission_submit')
+    def submit(self, record):
+        """
+        Queues one submission, e.g. {"plant_name": "Rose"}.
+        """
+        line = json.dumps(record) + "\n"
+        with self._lock:
+            self._buffer.append(line)
+            buffered = len(self._buffer)
+
+        if self.durability == 'immediate':
+            self.flush()
+            return
+        self._ensure_flusher()
+        if buffered >= self.max_buffer:
+            self._wake.set()
+
+    def pending(self):
+        with self._lock:
+            return len(self._buffer)
+
+    @timed('submission_flush')
+    def flush(self):
+        """
+        Appends the buffered submissions to the file in one write.
+        """
+        with self._lock:
+            lines, self._buffer = self._buffer, []
+        if not lines:
+            return
+        data = ''.join(lines).encode('utf-8')
+
+        with self._write_lock:
+            try:
+                self._append(data)
+            except OSError:
+                # Keep the submissions for the next flush, ahead of the newer ones
+                with self._lock:
+                    self._buffer[:0] = lines
+                raise
+
+    def _append(self, data):
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            view = memoryview(data)
+            while view:
+                written = os.write(fd, view)
+                view = view[written:]
+            if self.durability == 'fsync':
+                os.fsync(fd)
+        finally:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def _ensure_flusher(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='submission-flusher', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"Writing {self.path} failed: {e}")
+
+    def _read_new_lines(self):
+        # Count only what was appended since the last call (by any process)
+        with self._read_lock:
+            try:
+                with open(self.path, 'rb') as file:
+                    file.seek(self._offset)
+                    data = file.read()
+            except FileNotFoundError:
+                return
+
+            # A line that is still being written is counted next time
+            complete = data.rfind(b"\n") + 1
+            self._offset += complete
+            for line in data[:complete].splitlines():
+                try:
+                    plant_name = json.loads(line).get('plant_name')
+                except (ValueError, AttributeError):
+                    continue
+                # Only lines with a string name count (the offset already moved past this chunk)
+                if not isinstance(plant_name, str) or not plant_name.strip():
+                    continue
+                key = normalize_plant_name(plant_name)
+                self._counts[key] += 1
+                self._names[key] = plant_name.strip()
+                self._total += 1
+
+    def summary(self, limit=20):
+        """
+        Returns the most submitted names with their counts.
+
+        Parameters:
+        - limit: Number of names to return.
+        """
+        self._read_new_lines()
+        with self._read_lock:
+            top = [{"name": self._names[key], "normalized": key, "count": count}
+                   for key, count in self._counts.most_common(limit)]
+            return {
+                "total": self._total,
+                "unique": len(self._counts),
+                "pending": self.pending(),
+                "top": top,
+            }
@@ -0,0 +1,40 @@
+import os
+import sys
+import glob
+import shutil
+import atexit
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Files app.py reads when it is imported
+APP_FILES = ('corrected_species_data.json', 'class_indices_*.json')
+
+
+def import_app():
+    """
+    Imports app.py in a temporary working directory, without loading the models.
+
+    The files the app creates when it is imported (database, example image
+    index, ...) are written there instead of into the repository.
+
+    Returns:
+    - The app module.
+    """
+    if 'app' in sys.modules:
+        return sys.modules['app']
+
+    work_dir = tempfile.mkdtemp()
+    atexit.register(shutil.rmtree, work_dir, True)
+    for pattern in APP_FILES:
+        for path in glob.glob(os.path.join(REPO_DIR, pattern)):
+            shutil.copy(path, work_dir)
+    os.environ['GREENSPACE_MODEL_PRELOAD'] = 'lazy'
+    os.environ['GREENSPACE_DB'] = os.path.join(work_dir, 'greenspace.db')
+
+    cwd = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        import app
+    finally:
+        os.chdir(cwd)
+    return app
@@ -0,0 +1,126 @@
+import io
+import time
+import threading
+import unittest
+from batching import MicroBatcher, QueueFull, DeadlineExceeded
+from app_fixture import import_app
+
+
+class BlockingBatch:
+    # process_batch that waits until release() is called, recording the batches it got
+    def __init__(self):
+        self.batches = []
+        self.started = threading.Event()
+        self._release = threading.Event()
+
+    def __call__(self, items):
+        self.batches.append(list(items))
+        self.started.set()
+        self._release.wait(5)
+        return [item * 10 for item in items]
+
+    def release(self):
+        self._release.set()
+
+
+class MicroBatcherTest(unittest.TestCase):
+    def test_results_in_order(self):
+        batcher = MicroBatcher(lambda items: [item * 10 for item in items], max_batch_size=4, max_wait_ms=50)
+        futures = [batcher.submit(i) for i in range(6)]
+        self.assertEqual([future.result(timeout=5) for future in futures], [0, 10, 20, 30, 40, 50])
+
+    def test_queue_full(self):
+        process = BlockingBatch()
+        batcher = MicroBatcher(process, max_batch_size=1, max_wait_ms=0, max_queue=1)
+        running = batcher.submit(1)
+        self.assertTrue(process.started.wait(5))
+        queued = batcher.submit(2)
+        with self.assertRaises(QueueFull) as raised:
+            batcher.submit(3)
+        self.assertGreaterEqual(raised.exception.retry_after, 1)
+
+        process.release()
+        self.assertEqual((running.result(timeout=5), queued.result(timeout=5)), (10, 20))
+
+    def test_deadline(self):
+        process = BlockingBatch()
+        batcher = MicroBatcher(process, max_batch_size=1, max_wait_ms=0)
+        running = batcher.submit(1)
+        self.assertTrue(process.started.wait(5))
+        # Waits behind the running batch: the caller gives up, the worker drops the item
+        with self.assertRaises(DeadlineExceeded):
+            batcher(2, timeout=0.05)
+        expired = batcher.submit(3, deadline=time.monotonic() + 0.05)
+        time.sleep(0.1)
+
+        process.release()
+        self.assertEqual(running.result(timeout=5), 10)
+        with self.assertRaises(DeadlineExceeded):
+            expired.result(timeout=5)
+        self.assertEqual(batcher(4, timeout=5), 40)
+        self.assertEqual(process.batches, [[1], [4]])
+
+    def test_errors_reach_every_caller(self):
+        def fail(items):
+            raise RuntimeError('models not loaded')
+
+        batcher = MicroBatcher(fail, max_batch_size=4, max_wait_ms=50)
+        futures = [batcher.submit(i) for i in range(3)]
+        for future in futures:
+            with self.assertRaises(RuntimeError):
+                future.result(timeout=5)
+
+
+class RecognizeOverloadTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = import_app()
+        cls.client = cls.app.app.test_client()
+
+    def setUp(self):
+        self.recognition_batcher = self.app.recognition_batcher
+        self.timeout = self.app.RECOGNIZE_TIMEOUT
+        self.app.result_cache.clear()
+
+    def tearDown(self):
+        self.app.recognition_batcher = self.recognition_batcher
+        self.app.RECOGNIZE_TIMEOUT = self.timeout
+
+    def post_image(self, content=b'image bytes'):
+        return self.client.post('/recognize', data={'file': (io.BytesIO(content), 'plant.jpg')})
+
+    def test_queue_full_is_429(self):
+        process = BlockingBatch()
+        self.app.recognition_batcher = MicroBatcher(process, max_batch_size=1, max_wait_ms=0, max_queue=1)
+        self.app.recognition_batcher.submit(1)
+        self.assertTrue(process.started.wait(5))
+        self.app.recognition_batcher.submit(2)
+
+        response = self.post_image()
+        process.release()
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response.headers)
+        self.assertIn('error', response.get_json())
+
+    def test_deadline_is_503(self):
+        process = BlockingBatch()
+        self.app.recognition_batcher = MicroBatcher(process, max_batch_size=1, max_wait_ms=0)
+        self.app.RECOGNIZE_TIMEOUT = 0.05
+
+        response = self.post_image()
+        process.release()
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response.headers)
+
+    def test_inference_error_is_json_503(self):
+        def fail(items):
+            raise RuntimeError('models not loaded')
+
+        self.app.recognition_batcher = MicroBatcher(fail)
+        response = self.post_image()
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('models not loaded', response.get_json()['error'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from compiled_forest import CompiledForest, check_against_sklearn
+
+
+def histogram_features(count, seed):
+    # Colour histogram-like features (768 counts) for 4 categories
+    rng = np.random.RandomState(seed)
+    labels = rng.randint(4, size=count)
+    features = rng.poisson(20, size=(count, 768)).astype(np.float32)
+    for category in range(4):
+        features[labels == category, category * 192:(category + 1) * 192] += 15
+    return features, labels
+
+
+class CompiledForestTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        X, y = histogram_features(400, seed=0)
+        cls.forest = RandomForestClassifier(n_estimators=20, random_state=42).fit(X, y)
+        cls.compiled = CompiledForest.from_sklearn(cls.forest)
+        cls.X_test, _ = histogram_features(200, seed=1)
+
+    def test_same_predictions(self):
+        self.assertEqual(check_against_sklearn(self.forest, self.compiled, self.X_test), 0)
+        np.testing.assert_array_equal(self.compiled.apply(self.X_test),
+                                      self.forest.apply(self.X_test) + self.compiled.roots)
+
+    def test_same_probabilities(self):
+        np.testing.assert_allclose(self.compiled.predict_proba(self.X_test), self.forest.predict_proba(self.X_test),
+                                   rtol=0, atol=1e-12)
+
+    def test_single_row(self):
+        self.assertEqual(self.compiled.predict(self.X_test[0]).tolist(), self.forest.predict(self.X_test[:1]).tolist())
+
+    def test_saved_and_memory_mapped(self):
+        directory = tempfile.mkdtemp()
+        try:
+            self.compiled.save(directory)
+            loaded = CompiledForest.load(directory, mmap=True)
+            self.assertIsInstance(loaded.value, np.memmap)
+            np.testing.assert_array_equal(loaded.predict_proba(self.X_test), self.compiled.predict_proba(self.X_test))
+            self.assertEqual(loaded.classes_.tolist(), self.forest.classes_.tolist())
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
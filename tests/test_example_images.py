@@ -0,0 +1,81 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from PIL import Image
+from example_images import ExampleImageIndex
+from thumbnails import ThumbnailCache, THUMBNAIL_SIZES
+
+
+def write_image(path, size=(800, 600)):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    Image.new('RGB', size, 'green').save(path, 'JPEG')
+
+
+class ExampleImageIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.base_dir = os.path.join(self.tmp_dir, 'house_plant_species')
+        self.index_file = os.path.join(self.tmp_dir, 'example_images.json')
+        write_image(os.path.join(self.base_dir, 'Tulip', 'b.jpg'))
+        write_image(os.path.join(self.base_dir, 'Tulip', 'a.jpg'))
+        os.makedirs(os.path.join(self.base_dir, 'Calathea'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def make_index(self):
+        return ExampleImageIndex(self.base_dir, self.index_file, check_interval=0)
+
+    def test_first_image_of_each_species(self):
+        index = self.make_index()
+        self.assertEqual(index.lookup('Tulip'), os.path.join(self.base_dir, 'Tulip', 'a.jpg'))
+        self.assertIsNone(index.lookup('Calathea'))
+        self.assertIsNone(index.lookup('Unknown'))
+        # Stored for the next start
+        with open(self.index_file, 'r') as file:
+            self.assertIn('Tulip', json.load(file)["images"])
+
+    def test_rebuilt_when_the_dataset_changes(self):
+        index = self.make_index()
+        self.assertIsNone(index.lookup('Calathea'))
+        write_image(os.path.join(self.base_dir, 'Calathea', 'c.jpg'))
+        # The folder mtime changes when a file is added (set explicitly, some file systems are coarse)
+        stat = os.stat(os.path.join(self.base_dir, 'Calathea'))
+        os.utime(os.path.join(self.base_dir, 'Calathea'), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        self.assertEqual(index.lookup('Calathea'), os.path.join(self.base_dir, 'Calathea', 'c.jpg'))
+
+
+class ThumbnailCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.base_dir = os.path.join(self.tmp_dir, 'house_plant_species')
+        self.cache = ThumbnailCache(self.base_dir, os.path.join(self.tmp_dir, 'thumbnail_cache'))
+        write_image(os.path.join(self.base_dir, 'Tulip', 'a.jpg'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_thumbnail(self):
+        path, etag = self.cache.get('Tulip/a.jpg', 'small', 'webp')
+        with Image.open(path) as image:
+            self.assertEqual(max(image.size), THUMBNAIL_SIZES['small'])
+            self.assertEqual(image.format, 'WEBP')
+        # Served from the cache with the same ETag
+        self.assertEqual(self.cache.get('Tulip/a.jpg', 'small', 'webp'), (path, etag))
+
+    def test_missing_image(self):
+        self.assertIsNone(self.cache.get('Tulip/missing.jpg', 'small', 'jpeg'))
+        self.assertIsNone(self.cache.get('../outside.jpg', 'small', 'jpeg'))
+
+    def test_corrupt_image(self):
+        with open(os.path.join(self.base_dir, 'Tulip', 'broken.jpg'), 'wb') as file:
+            file.write(b'not an image')
+        self.assertIsNone(self.cache.get('Tulip/broken.jpg', 'medium', 'jpeg'))
+        thumbnail_dir = os.path.join(self.tmp_dir, 'thumbnail_cache', 'medium', 'Tulip')
+        self.assertEqual(os.listdir(thumbnail_dir) if os.path.isdir(thumbnail_dir) else [], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
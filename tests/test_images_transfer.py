@@ -0,0 +1,104 @@
+import os
+import csv
+import shutil
+import tempfile
+import unittest
+from images_transfer import move_images, load_manifest, save_manifest
+
+
+class ImagesTransferTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.source_dir = os.path.join(self.tmp_dir, 'dataset')
+        self.target_dir = os.path.join(self.tmp_dir, 'house_plant_species')
+        self.manifest_file = os.path.join(self.tmp_dir, 'transfer_manifest.json')
+        self.csv_file = os.path.join(self.tmp_dir, 'image_data.csv')
+        os.makedirs(os.path.join(self.source_dir, 'Aloe_Vera'))
+        os.makedirs(os.path.join(self.target_dir, 'Aloe_Vera'))
+        self.write_source('Aloe_Vera/Image_1.jpg', b'first')
+        self.write_source('Aloe_Vera/Image_2.jpg', b'second')
+        # Same content as Image_1.jpg
+        self.write_source('Aloe_Vera/Image_3.jpg', b'first')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_source(self, image, content):
+        with open(os.path.join(self.source_dir, image), 'wb') as file:
+            file.write(content)
+
+    def read_target(self, image):
+        with open(os.path.join(self.target_dir, image), 'rb') as file:
+            return file.read()
+
+    def move(self):
+        return move_images(self.source_dir, self.target_dir, manifest_file=self.manifest_file,
+                           csv_file=self.csv_file, workers=2)
+
+    def csv_images(self):
+        with open(self.csv_file, newline='') as file:
+            return sorted(row['image_name'] for row in csv.DictReader(file))
+
+    def test_moves_and_skips_duplicates(self):
+        result = self.move()
+        self.assertEqual((result["moved"], result["duplicates"], result["failed"]), (2, 1, 0))
+        self.assertEqual(self.read_target('Aloe_Vera/Image_1.jpg'), b'first')
+        self.assertEqual(self.read_target('Aloe_Vera/Image_2.jpg'), b'second')
+        self.assertFalse(os.path.exists(os.path.join(self.target_dir, 'Aloe_Vera/Image_3.jpg')))
+        self.assertEqual(self.csv_images(), ['Image_1.jpg', 'Image_2.jpg'])
+
+        # Nothing new: the rerun doesn't move or count anything again
+        result = self.move()
+        self.assertEqual((result["moved"], result["duplicates"], result["failed"]), (0, 0, 0))
+
+    def test_new_download_under_a_moved_name(self):
+        self.move()
+        # bing-image-downloader saves a new image as Image_1.jpg again
+        self.write_source('Aloe_Vera/Image_1.jpg', b'new download')
+
+        result = self.move()
+        self.assertEqual((result["moved"], result["duplicates"]), (1, 0))
+        self.assertFalse(os.path.exists(os.path.join(self.source_dir, 'Aloe_Vera/Image_1.jpg')))
+        self.assertEqual(self.read_target('Aloe_Vera/Image_1.jpg'), b'first')
+        self.assertEqual(self.read_target('Aloe_Vera/Image_1_copy.jpg'), b'new download')
+        self.assertEqual(self.csv_images(), ['Image_1.jpg', 'Image_1_copy.jpg', 'Image_2.jpg'])
+
+    def test_same_content_under_a_moved_name(self):
+        self.move()
+        self.write_source('Aloe_Vera/Image_2.jpg', b'second')
+
+        result = self.move()
+        self.assertEqual((result["moved"], result["duplicates"]), (0, 1))
+        entry = load_manifest(self.manifest_file)["files"]['Aloe_Vera/Image_2.jpg']
+        self.assertEqual((entry["status"], entry["target"]), ('duplicate', 'Aloe_Vera/Image_2.jpg'))
+
+    def test_changed_duplicate(self):
+        self.move()
+        # Image_3.jpg was a duplicate of Image_1.jpg and stayed in the source
+        self.write_source('Aloe_Vera/Image_3.jpg', b'third image')
+
+        result = self.move()
+        self.assertEqual((result["moved"], result["duplicates"]), (1, 0))
+        self.assertEqual(self.read_target('Aloe_Vera/Image_3.jpg'), b'third image')
+
+    def test_interrupted_run_resumes(self):
+        self.move()
+        # A run stopped while copying Image_4.jpg across disks: planned, partial copy in the target
+        self.write_source('Aloe_Vera/Image_4.jpg', b'fourth')
+        manifest = load_manifest(self.manifest_file)
+        manifest["files"]['Aloe_Vera/Image_4.jpg'] = {"status": "moving", "sha256": 'partial',
+                                                      "target": 'Aloe_Vera/Image_4.jpg'}
+        manifest["hashes"]['partial'] = 'Aloe_Vera/Image_4.jpg'
+        save_manifest(manifest, self.manifest_file)
+        with open(os.path.join(self.target_dir, 'Aloe_Vera/Image_4.jpg'), 'wb') as file:
+            file.write(b'fou')
+
+        result = self.move()
+        self.assertEqual((result["moved"], result["duplicates"], result["failed"]), (1, 0, 0))
+        self.assertEqual(self.read_target('Aloe_Vera/Image_4.jpg'), b'fourth')
+        self.assertNotIn('partial', load_manifest(self.manifest_file)["hashes"])
+        self.assertEqual(self.csv_images(), ['Image_1.jpg', 'Image_2.jpg', 'Image_4.jpg'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import os
+import glob
+import pickle
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from model_registry import ModelRegistry, CATEGORY_MODEL_FILES, RF_MODEL_FILE, RF_FEATURES
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class FakeCategoryModel:
+    # Stands in for a CNN: uniform probabilities, counts its predictions
+    def __init__(self):
+        self.predictions = 0
+
+    def predict(self, batch, verbose=0):
+        self.predictions += 1
+        return np.full((len(batch), 3), 1 / 3)
+
+
+def fake_load_category_model(model_dir, model_file, *args):
+    path = os.path.join(model_dir, model_file)
+    if not os.path.exists(path):
+        raise FileNotFoundError(path)
+    return FakeCategoryModel()
+
+
+def make_model_dir(parent, name):
+    # RF, empty CNN files and the class indices of the repository
+    model_dir = os.path.join(parent, name)
+    os.makedirs(os.path.join(model_dir, 'saved_models'))
+    rng = np.random.RandomState(0)
+    forest = RandomForestClassifier(n_estimators=2, random_state=0).fit(rng.rand(20, RF_FEATURES),
+                                                                        rng.randint(4, size=20))
+    with open(os.path.join(model_dir, RF_MODEL_FILE), 'wb') as file:
+        pickle.dump(forest, file)
+    for path in glob.glob(os.path.join(REPO_DIR, 'class_indices_*.json')):
+        shutil.copy(path, model_dir)
+    for model_file, _ in CATEGORY_MODEL_FILES.values():
+        open(os.path.join(model_dir, model_file), 'w').close()
+    return model_dir
+
+
+@mock.patch('model_registry.load_category_model', fake_load_category_model)
+class ModelRegistryTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.v1 = make_model_dir(self.tmp_dir, 'v1')
+        self.v2 = make_model_dir(self.tmp_dir, 'v2')
+        self.registry = ModelRegistry(self.v1)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_loaded_once_and_warmed_up(self):
+        models = []
+        threads = [threading.Thread(target=lambda: models.append(self.registry.get())) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # Concurrent first requests share one load
+        self.assertTrue(all(m is models[0] for m in models))
+        self.assertEqual(self.registry.version, self.v1)
+        self.assertTrue(all(model.predictions == 1 for model in models[0].category_models.values()))
+
+    def test_hot_swap(self):
+        swapped = []
+        self.registry.add_listener(swapped.append)
+        old = self.registry.get()
+        new = self.registry.load(model_dir=self.v2, version='v2')
+
+        self.assertIs(self.registry.get(), new)
+        self.assertEqual((self.registry.version, self.registry.model_dir), ('v2', self.v2))
+        self.assertEqual(swapped, [old, new])
+        # Requests that started before the swap keep using the old models
+        self.assertEqual(old.version, self.v1)
+
+    def test_failed_load_keeps_the_current_version(self):
+        current = self.registry.get()
+        os.remove(os.path.join(self.v2, 'my_model_foliage_128_last.keras'))
+        with self.assertRaises(FileNotFoundError):
+            self.registry.load(model_dir=self.v2, version='v2')
+        self.assertIs(self.registry.get(), current)
+        self.assertEqual(self.registry.model_dir, self.v1)
+
+    def test_background_preload_error(self):
+        registry = ModelRegistry(os.path.join(self.tmp_dir, 'missing'))
+        registry.preload().join(10)
+        self.assertFalse(registry.is_loaded())
+        self.assertIn('missing', registry.load_error)
+
+    def test_shared_rf_is_reused(self):
+        self.registry.preload_shared()
+        shared_rf = self.registry._shared_rf[1]
+        self.assertIs(self.registry.load().rf_model, shared_rf)
+        # Another model directory loads its own RF
+        self.assertIsNot(self.registry.load(model_dir=self.v2).rf_model, shared_rf)
+
+
+if __name__ == '__main__':
+    unittest.main()
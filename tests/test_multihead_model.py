@@ -0,0 +1,74 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+from model_registry import CATEGORY_NAMES
+from multihead_model import build_multihead_model, MultiHeadModel, make_tf_dataset, train_multihead
+from dataset_shards import split_rows
+
+
+class MultiHeadModelTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.category_sizes = {0: 3, 1: 5, 2: 2, 3: 4}
+        cls.model = build_multihead_model(cls.category_sizes)
+
+    def test_heads_match_the_full_model(self):
+        batch = np.random.RandomState(0).rand(2, 128, 128, 3).astype(np.float32)
+        outputs = self.model(batch, training=False)
+        multihead = MultiHeadModel(self.model)
+        predictions = multihead.predict_heads(batch, [1, 3])
+        self.assertEqual(sorted(predictions), [1, 3])
+        for category in (1, 3):
+            np.testing.assert_allclose(predictions[category], outputs[f'head_{CATEGORY_NAMES[category]}'].numpy(),
+                                       rtol=1e-5, atol=1e-6)
+        self.assertEqual(multihead.head(0).predict(batch).shape, (2, 3))
+
+    def test_each_image_trains_its_own_head(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            from PIL import Image
+            path = os.path.join(tmp_dir, 'a.png')
+            Image.new('RGB', (64, 48), 'green').save(path)
+            dataset = make_tf_dataset([(path, 1, 4)], self.category_sizes, batch_size=1, training=True)
+            images, targets, weights = next(iter(dataset))
+        finally:
+            shutil.rmtree(tmp_dir)
+        self.assertEqual(tuple(images.shape), (1, 128, 128, 3))
+        for category, name in CATEGORY_NAMES.items():
+            self.assertEqual(float(weights[f'head_{name}'][0]), float(category == 1))
+        np.testing.assert_array_equal(targets['head_foliage'][0].numpy(), [0, 0, 0, 0, 1])
+
+
+class TrainMultiheadTest(unittest.TestCase):
+    def test_trained_like_the_category_models(self):
+        # 10 images of each of two species
+        rows = [(os.path.join('house_plant_species', species, f'{i:02d}.jpg'), category, class_index)
+                for category, class_index, species in ((0, 0, 'Tulip'), (1, 2, 'Calathea')) for i in range(10)]
+        datasets = {}
+
+        def fake_dataset(dataset_rows, category_sizes, batch_size, training):
+            datasets[training] = dataset_rows
+            return dataset_rows
+
+        model = mock.MagicMock()
+        with mock.patch('multihead_model.read_dataset', return_value=(rows, {c: ['a', 'b', 'c'] for c in range(4)})), \
+                mock.patch('multihead_model.make_tf_dataset', fake_dataset), \
+                mock.patch('multihead_model.build_multihead_model', return_value=model):
+            train_multihead(epochs=1, output_file='unused.keras')
+
+        # flow_from_directory's validation subset: the first 20% of the sorted files of each species
+        split = split_rows(rows)
+        self.assertEqual(datasets[True], [row[:3] for row in split if not row[3]])
+        self.assertEqual(sorted(path for path, _, _ in datasets[False]),
+                         [os.path.join('house_plant_species', species, f'{i:02d}.jpg')
+                          for species in ('Calathea', 'Tulip') for i in range(2)])
+        optimizer = model.compile.call_args.kwargs['optimizer']
+        self.assertEqual(type(optimizer).__name__, 'RMSprop')
+        self.assertAlmostEqual(float(optimizer.learning_rate), 1e-4, places=8)
+
+
+if __name__ == '__main__':
+    unittest.main()
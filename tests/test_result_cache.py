@@ -0,0 +1,76 @@
+import time
+import unittest
+from result_cache import ResultCache
+
+
+class CountingRecognizer:
+    # recognize function returning fresh results and counting its calls
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, data):
+        self.calls += 1
+        return [{"label": data.decode(), "probability": 90.0, "image_path": 'house_plant_species/Tulip/a.jpg'}]
+
+
+class ResultCacheTest(unittest.TestCase):
+    def test_hit_and_miss(self):
+        cache = ResultCache(max_entries=4)
+        recognize = CountingRecognizer()
+        first = cache.recognize(b'tulip', recognize)
+        second = cache.recognize(b'tulip', recognize)
+        self.assertEqual(first, second)
+        self.assertEqual(recognize.calls, 1)
+        self.assertEqual((cache.stats()['hits'], cache.stats()['misses']), (1, 1))
+
+    def test_results_are_copies(self):
+        cache = ResultCache(max_entries=4)
+        recognize = CountingRecognizer()
+        results = cache.recognize(b'tulip', recognize)
+        # The route rewrites the results for the response
+        results[0]['image_path'] = '/image/Tulip/a.jpg?size=medium'
+        results.append({"label": 'extra'})
+
+        cached = cache.recognize(b'tulip', recognize)
+        self.assertEqual(len(cached), 1)
+        self.assertEqual(cached[0]['image_path'], 'house_plant_species/Tulip/a.jpg')
+
+    def test_least_recently_used_is_evicted(self):
+        cache = ResultCache(max_entries=2)
+        recognize = CountingRecognizer()
+        cache.recognize(b'a', recognize)
+        cache.recognize(b'b', recognize)
+        cache.recognize(b'a', recognize)  # 'b' is now the least recently used
+        cache.recognize(b'c', recognize)
+        self.assertEqual((cache.stats()['entries'], cache.stats()['evictions']), (2, 1))
+
+        calls = recognize.calls
+        cache.recognize(b'a', recognize)
+        self.assertEqual(recognize.calls, calls)
+        cache.recognize(b'b', recognize)
+        self.assertEqual(recognize.calls, calls + 1)
+
+    def test_expired_entries(self):
+        cache = ResultCache(max_entries=4, ttl=0.01)
+        recognize = CountingRecognizer()
+        cache.recognize(b'tulip', recognize)
+        time.sleep(0.05)
+        cache.recognize(b'tulip', recognize)
+        self.assertEqual(recognize.calls, 2)
+
+    def test_clear_drops_results_of_the_previous_models(self):
+        cache = ResultCache(max_entries=4)
+        recognize = CountingRecognizer()
+        cache.recognize(b'tulip', recognize)
+        cache.clear()
+        cache.recognize(b'tulip', recognize)
+        self.assertEqual(recognize.calls, 2)
+
+    def test_unrecognized_images_are_not_cached(self):
+        cache = ResultCache(max_entries=4)
+        self.assertIsNone(cache.recognize(b'broken', lambda data: None))
+        self.assertEqual(cache.stats()['entries'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
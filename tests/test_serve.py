@@ -0,0 +1,50 @@
+import os
+import signal
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from serve import worker_threads, set_thread_limits, read_reload_request, forward_reload, read_memory
+
+
+class ServeTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.reload_file = os.path.join(self.tmp_dir, 'greenspace-reload.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_worker_threads(self):
+        with mock.patch('os.cpu_count', return_value=8):
+            self.assertEqual(worker_threads(4), 2)
+            self.assertEqual(worker_threads(16), 1)
+
+    def test_thread_limits_keep_the_environment(self):
+        with mock.patch.dict(os.environ, {'GREENSPACE_INFERENCE_THREADS': '3'}):
+            os.environ.pop('OMP_NUM_THREADS', None)
+            set_thread_limits(2)
+            self.assertEqual(os.environ['OMP_NUM_THREADS'], '2')
+            self.assertEqual(os.environ['GREENSPACE_INFERENCE_THREADS'], '3')
+
+    def test_reload_is_forwarded_to_the_master(self):
+        self.assertEqual(read_reload_request(self.reload_file), {})
+        received = []
+        previous = signal.signal(signal.SIGUSR2, lambda signum, frame: received.append(signum))
+        try:
+            forward_reload(self.reload_file, os.getpid())('/models/v2', 'v2')
+        finally:
+            signal.signal(signal.SIGUSR2, previous)
+        self.assertEqual(received, [signal.SIGUSR2])
+        self.assertEqual(read_reload_request(self.reload_file), {"model_dir": '/models/v2', "version": 'v2'})
+        self.assertEqual(os.listdir(self.tmp_dir), ['greenspace-reload.json'])
+
+    @unittest.skipUnless(os.path.exists('/proc/self/smaps_rollup'), "Linux only")
+    def test_memory_of_this_process(self):
+        memory = read_memory(os.getpid())
+        self.assertGreater(memory['rss'], 0)
+        self.assertLessEqual(memory['uss'], memory['rss'])
+
+
+if __name__ == '__main__':
+    unittest.main()
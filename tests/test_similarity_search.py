@@ -0,0 +1,63 @@
+import unittest
+import numpy as np
+from plant_embeddings import CategoryIndex, build_ivf, normalize
+
+
+def clustered_embeddings(count=600, dims=32, clusters=12, seed=0):
+    # L2-normalized vectors around a few directions, like the embeddings of several species
+    rng = np.random.RandomState(seed)
+    centers = rng.randn(clusters, dims)
+    vectors = centers[rng.randint(clusters, size=count)] + 0.3 * rng.randn(count, dims)
+    return normalize(vectors)
+
+
+class SimilaritySearchTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.embeddings = clustered_embeddings()
+        order, centroids, offsets = build_ivf(cls.embeddings, nlist=16)
+        cls.nlist = len(centroids)
+        cls.paths = [f'image_{i}.jpg' for i in range(len(cls.embeddings))]
+        # Stored like build_embeddings does: float16, ordered by cluster
+        cls.index = CategoryIndex(cls.embeddings[order].astype(np.float16), centroids, offsets,
+                                  [cls.paths[i] for i in order])
+        cls.queries = clustered_embeddings(count=50, seed=1)
+
+    def brute_force(self, query, k):
+        scores = self.embeddings.astype(np.float16).astype(np.float32) @ query
+        best = np.argsort(-scores, kind='stable')[:k]
+        return [(self.paths[i], float(scores[i])) for i in best]
+
+    def test_clusters_cover_every_row(self):
+        self.assertEqual(self.index.offsets[0], 0)
+        self.assertEqual(self.index.offsets[-1], len(self.embeddings))
+        self.assertTrue(np.all(np.diff(self.index.offsets) >= 0))
+        self.assertEqual(sorted(self.index.paths), sorted(self.paths))
+
+    def test_all_clusters_is_brute_force(self):
+        for query in self.queries:
+            found = self.index.search(query, k=8, nprobe=self.nlist)
+            expected = self.brute_force(query, 8)
+            self.assertEqual([path for path, _ in found], [path for path, _ in expected])
+            np.testing.assert_allclose([score for _, score in found], [score for _, score in expected], rtol=1e-5)
+
+    def test_recall_with_few_clusters(self):
+        found_total = 0
+        for query in self.queries:
+            found = {path for path, _ in self.index.search(query, k=8, nprobe=4)}
+            found_total += len(found & {path for path, _ in self.brute_force(query, 8)})
+        self.assertGreaterEqual(found_total / (8 * len(self.queries)), 0.9)
+
+    def test_results_are_sorted(self):
+        found = self.index.search(self.queries[0], k=20, nprobe=4)
+        scores = [score for _, score in found]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
+    def test_k_larger_than_the_probed_rows(self):
+        found = self.index.search(self.queries[0], k=len(self.embeddings) + 10, nprobe=1)
+        self.assertLessEqual(len(found), len(self.embeddings))
+        self.assertEqual(len({path for path, _ in found}), len(found))
+
+
+if __name__ == '__main__':
+    unittest.main()
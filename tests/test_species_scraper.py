@@ -0,0 +1,114 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timezone
+from species_scraper import FixtureServer, update_catalog
+
+# Recorded pages of Begonia and Aloe Vera (search page + species page each)
+FIXTURE_PAGES = os.path.join(os.path.dirname(__file__), 'fixtures', 'scrape_pages')
+OLD = '2020-01-01T00:00:00+00:00'
+
+
+def catalog_entry(mapping_name, description, scraped_at):
+    return {"mapping_name": mapping_name, "description": description, "details": {}, "care_info": {},
+            "scraped_at": scraped_at}
+
+
+class SpeciesScraperTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = FixtureServer(FIXTURE_PAGES).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tmp_dir, 'cache')
+        self.catalog_file = os.path.join(self.tmp_dir, 'catalog.json')
+        now = datetime.now(timezone.utc).isoformat(timespec='seconds')
+        self.write_catalog({
+            # Failed in the notebook: no data yet
+            "Begonia": {"mapping_name": "Begonia_Begonia_spp", "description": None, "details": None,
+                        "care_info": None},
+            "Aloe_Vera": catalog_entry("Aloe_Vera", "Old description.", OLD),
+            "Calathea": catalog_entry("Calathea", "Recent description.", now),
+        })
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_catalog(self, catalog):
+        with open(self.catalog_file, 'w', encoding='utf-8') as file:
+            json.dump(catalog, file, indent=4)
+
+    def read_catalog(self):
+        with open(self.catalog_file, 'r', encoding='utf-8') as file:
+            return json.load(file)
+
+    def update(self, **kwargs):
+        return update_catalog(self.catalog_file, ['Begonia', 'Aloe_Vera', 'Calathea', 'Ctenanthe'], workers=4,
+                              rate=100, base_url=self.server.url, cache_dir=self.cache_dir, **kwargs)
+
+    def test_new_and_failed(self):
+        result = self.update()
+
+        # Begonia has no data and Ctenanthe isn't in the catalog; the others are kept
+        self.assertEqual(result["updated"], ['Begonia'])
+        self.assertEqual(result["failed"], ['Ctenanthe'])
+        self.assertEqual((result["fetched"], result["cached"]), (2, 0))
+
+        catalog = self.read_catalog()
+        begonia = catalog['Begonia']
+        self.assertEqual(begonia['mapping_name'], 'Begonia_Begonia_spp')
+        self.assertEqual(begonia['description'], 'Begonias are flowering perennials with asymmetric leaves.')
+        self.assertEqual(begonia['details'], {"Cycle": "Perennial", "Watering": "Average", "Sun": "Part shade"})
+        self.assertEqual(begonia['care_info']['Sunlight'], 'Bright, indirect light.')
+        self.assertIn('scraped_at', begonia)
+        # A new species without a page is kept with empty data, like the notebook did
+        self.assertEqual(catalog['Ctenanthe'], {"mapping_name": "Ctenanthe", "description": None, "details": None,
+                                                "care_info": None})
+        self.assertEqual(catalog['Aloe_Vera']['description'], 'Old description.')
+        self.assertEqual(catalog['Calathea']['description'], 'Recent description.')
+
+    def test_cached_pages(self):
+        self.update()
+        # Same species missing again: the pages come from the cache
+        catalog = self.read_catalog()
+        catalog['Begonia']['description'] = None
+        self.write_catalog(catalog)
+
+        result = self.update()
+        self.assertEqual(result["updated"], ['Begonia'])
+        self.assertEqual(result["failed"], ['Ctenanthe'])
+        self.assertEqual((result["fetched"], result["cached"]), (0, 2))
+
+    def test_stale_entries(self):
+        self.update()
+        # Aloe_Vera was scraped in 2020: older than 30 days, Calathea and Begonia are recent
+        result = self.update(max_age=30 * 24 * 60 * 60)
+        self.assertEqual(result["updated"], ['Aloe_Vera'])
+        self.assertEqual(result["failed"], ['Ctenanthe'])
+        self.assertEqual((result["fetched"], result["cached"]), (2, 0))
+
+        catalog = self.read_catalog()
+        self.assertEqual(catalog['Aloe_Vera']['description'], 'Aloe vera is a succulent with thick, fleshy leaves.')
+        self.assertNotEqual(catalog['Aloe_Vera']['scraped_at'], OLD)
+        self.assertEqual(catalog['Calathea']['description'], 'Recent description.')
+
+    def test_stale_cached_pages_are_fetched_again(self):
+        self.update()
+        # max_age 0: every entry and every cached page is outdated
+        result = self.update(max_age=0)
+        self.assertEqual(result["updated"], ['Aloe_Vera', 'Begonia'])
+        self.assertEqual(result["failed"], ['Calathea', 'Ctenanthe'])
+        self.assertEqual((result["fetched"], result["cached"]), (4, 0))
+        # A failed scrape doesn't overwrite existing data
+        self.assertEqual(self.read_catalog()['Calathea']['description'], 'Recent description.')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from submissions import SubmissionLog
+
+
+class SubmissionLogTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'submitted_plants.json')
+        # No flusher wakes up during a test: flush() is called explicitly
+        self.log = SubmissionLog(self.path, flush_interval=3600)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def read_lines(self):
+        with open(self.path, 'r') as file:
+            return [json.loads(line) for line in file]
+
+    def test_buffered_until_flush(self):
+        self.log.submit({"plant_name": "Rose"})
+        self.log.submit({"plant_name": "Tulip"})
+        self.assertEqual(self.log.pending(), 2)
+        self.assertFalse(os.path.exists(self.path))
+
+        self.log.flush()
+        self.assertEqual(self.log.pending(), 0)
+        self.assertEqual(self.read_lines(), [{"plant_name": "Rose"}, {"plant_name": "Tulip"}])
+
+    def test_failed_flush_keeps_the_submissions(self):
+        self.log.path = os.path.join(self.tmp_dir, 'missing', 'submitted_plants.json')
+        self.log.submit({"plant_name": "Rose"})
+        with self.assertRaises(OSError):
+            self.log.flush()
+        self.assertEqual(self.log.pending(), 1)
+
+        # The next flush writes them ahead of the newer ones
+        self.log.path = self.path
+        self.log.submit({"plant_name": "Tulip"})
+        self.log.flush()
+        self.assertEqual(self.read_lines(), [{"plant_name": "Rose"}, {"plant_name": "Tulip"}])
+
+    def test_summary_counts_normalized_names(self):
+        for name in ("Monstera deliciosa", "  monstera   Deliciosa ", "Rose"):
+            self.log.submit({"plant_name": name})
+        self.log.flush()
+        summary = self.log.summary()
+        self.assertEqual((summary["total"], summary["unique"], summary["pending"]), (3, 2, 0))
+        self.assertEqual(summary["top"][0]["normalized"], 'monstera deliciosa')
+        self.assertEqual(summary["top"][0]["count"], 2)
+
+        # Only the lines appended since the last summary are read
+        self.log.submit({"plant_name": "rose"})
+        self.log.flush()
+        self.assertEqual(self.log.summary()["top"][0]["count"], 2)
+        self.assertEqual(self.log.summary()["total"], 4)
+
+    def test_summary_skips_bad_lines(self):
+        with open(self.path, 'w') as file:
+            file.write('{"plant_name": "Rose"}\n')
+            file.write('not json\n')
+            file.write('{"plant_name": 42}\n')
+            file.write('{"plant_name": "   "}\n')
+            file.write('["a list"]\n')
+            file.write('{"plant_name": "Tulip"')  # still being written
+        summary = self.log.summary()
+        self.assertEqual((summary["total"], summary["unique"]), (1, 1))
+
+        with open(self.path, 'a') as file:
+            file.write('}\n')
+        self.assertEqual(self.log.summary()["total"], 2)
+
+    def test_immediate_durability(self):
+        log = SubmissionLog(self.path, durability='immediate')
+        log.submit({"plant_name": "Rose"})
+        self.assertEqual(log.pending(), 0)
+        self.assertEqual(self.read_lines(), [{"plant_name": "Rose"}])
+
+    def test_unknown_durability(self):
+        with self.assertRaises(ValueError):
+            SubmissionLog(self.path, durability='never')
+
+
+if __name__ == '__main__':
+    unittest.main()
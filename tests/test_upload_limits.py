@@ -0,0 +1,66 @@
+import io
+import unittest
+from app_fixture import import_app
+
+
+class UploadLimitTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = import_app()
+        cls.client = cls.app.app.test_client()
+
+    def setUp(self):
+        self.max_upload_bytes = self.app.MAX_UPLOAD_BYTES
+        self.app.MAX_UPLOAD_BYTES = 1000
+        self.recognized = []
+        self.recognition_batcher = self.app.recognition_batcher
+        self.app.recognition_batcher = self.recognize
+        self.app.result_cache.clear()
+
+    def tearDown(self):
+        self.app.MAX_UPLOAD_BYTES = self.max_upload_bytes
+        self.app.recognition_batcher = self.recognition_batcher
+
+    def recognize(self, data, timeout=None):
+        # Stands in for the batcher: the upload got through
+        self.recognized.append(data)
+        return None
+
+    def post(self, route, size):
+        return self.client.post(route, data={'file': (io.BytesIO(b'x' * size), 'plant.jpg')})
+
+    def test_without_content_length(self):
+        for route in ('/recognize', '/similar_plants'):
+            response = self.client.post(route, input_stream=io.BytesIO(b'x' * 10),
+                                        content_type='multipart/form-data; boundary=b',
+                                        headers={'Transfer-Encoding': 'chunked'})
+            self.assertEqual(response.status_code, 411, route)
+
+    def test_content_length_over_the_limit(self):
+        limit = self.app.MAX_UPLOAD_BYTES + self.app.UPLOAD_FORM_OVERHEAD
+        for route in ('/recognize', '/similar_plants'):
+            response = self.post(route, limit + 1)
+            self.assertEqual(response.status_code, 413, route)
+        self.assertEqual(self.recognized, [])
+
+    def test_file_over_the_limit_within_the_form_overhead(self):
+        # Passes the Content-Length check, the file itself is still capped when it is read
+        response = self.post('/recognize', self.app.MAX_UPLOAD_BYTES + 1)
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(self.recognized, [])
+
+    def test_upload_within_the_limit(self):
+        response = self.post('/recognize', self.app.MAX_UPLOAD_BYTES)
+        # The stand-in recognizer returns no results
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.recognized, [b'x' * self.app.MAX_UPLOAD_BYTES])
+
+    def test_batch_route_caps_each_file(self):
+        # /recognize_batch carries several files: no per-route Content-Length cap, each file is capped when read
+        response = self.client.post('/recognize_batch', data={'files': (io.BytesIO(b'x' * 1500), 'plant.jpg')})
+        self.assertEqual(response.status_code, 413)
+        self.assertIn('at most', response.get_json()['error'])
+
+
+if __name__ == '__main__':
+    unittest.main()
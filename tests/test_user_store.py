@@ -0,0 +1,77 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from user_store import UserStore, migrate_json_files
+
+USER_DATA = {
+    "Juliya": {"password": "hash-1"},
+    "Sam": {"password": "hash-2"},
+}
+USER_PLANTS = {
+    "Juliya": [
+        {"name": "Anthurium", "image": "/image/Anthurium_Anthurium_andraeanum/Anthurium_1.jpg",
+         "nickname": "Bella Thorn"},
+        {"name": "Peace_lily", "image": "/image/Peace_lily/Image_1.jpg", "nickname": "Lil Plant"},
+    ],
+}
+
+
+class UserStoreMigrationTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.user_data_file = os.path.join(self.tmp_dir, 'user_data.json')
+        self.user_plants_file = os.path.join(self.tmp_dir, 'user_plants.json')
+        self.write_json(self.user_data_file, USER_DATA)
+        self.write_json(self.user_plants_file, USER_PLANTS)
+        self.store = UserStore(os.path.join(self.tmp_dir, 'greenspace.db'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_json(self, path, data):
+        with open(path, 'w') as file:
+            json.dump(data, file)
+
+    def migrate(self):
+        return migrate_json_files(self.store, self.user_data_file, self.user_plants_file)
+
+    def test_migration(self):
+        self.assertEqual(self.migrate(), (2, 2))
+        self.assertEqual(self.store.count_users(), 2)
+        self.assertEqual(self.store.get_user('Juliya'), {"username": "Juliya", "password": "hash-1"})
+        # Same plants, in the order of the JSON file
+        self.assertEqual(self.store.get_user_plants('Juliya'), USER_PLANTS['Juliya'])
+        self.assertEqual(self.store.get_user_plants('Sam'), [])
+
+    def test_migration_runs_once(self):
+        self.migrate()
+        self.store.add_user_plant('Sam', 'Tulip', None, 'Red')
+        # Existing users are skipped with their plants: nothing is imported twice
+        self.assertEqual(self.migrate(), (0, 0))
+        self.assertEqual(len(self.store.get_user_plants('Juliya')), 2)
+        self.assertEqual(self.store.get_user_plants('Sam'), [{"name": "Tulip", "image": None, "nickname": "Red"}])
+
+    def test_missing_files(self):
+        os.remove(self.user_data_file)
+        os.remove(self.user_plants_file)
+        self.assertEqual(self.migrate(), (0, 0))
+        self.assertEqual(self.store.count_users(), 0)
+
+    def test_failed_migration_is_rolled_back(self):
+        # A user without a password fails the import: no user of the file is kept
+        self.write_json(self.user_data_file, {"Juliya": {"password": "hash-1"}, "Broken": {}})
+        with self.assertRaises(KeyError):
+            self.migrate()
+        self.assertEqual(self.store.count_users(), 0)
+        self.assertEqual(self.store.get_user_plants('Juliya'), [])
+
+    def test_create_user(self):
+        self.assertTrue(self.store.create_user('Ana', 'hash-3'))
+        self.assertFalse(self.store.create_user('Ana', 'other'))
+        self.assertEqual(self.store.get_user('Ana')['password'], 'hash-3')
+
+
+if __name__ == '__main__':
+    unittest.main()
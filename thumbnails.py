@@ -0,0 +1,159 @@
+import os
+import argparse
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from werkzeug.security import safe_join
+
+BASE_DIR = 'house_plant_species'
+CACHE_DIR = 'thumbnail_cache'
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+# Longest side of each thumbnail size in pixels
+THUMBNAIL_SIZES = {'small': 160, 'medium': 320, 'large': 640}
+
+# format -> (file extension, mimetype, Pillow format, save options)
+THUMBNAIL_FORMATS = {
+    'webp': ('.webp', 'image/webp', 'WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('.jpg', 'image/jpeg', 'JPEG', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+
+
+def generate_thumbnail(source_path, target_path, size, fmt):
+    """
+    Resizes one image and writes it in the given format.
+
+    Parameters:
+    - source_path: The full resolution image.
+    - target_path: Where to write the thumbnail.
+    - size: One of THUMBNAIL_SIZES.
+    - fmt: One of THUMBNAIL_FORMATS.
+    """
+    from PIL import Image
+
+    max_side = THUMBNAIL_SIZES[size]
+    _, _, pil_format, options = THUMBNAIL_FORMATS[fmt]
+
+    with Image.open(source_path) as img:
+        # Let the JPEG decoder scale down while decoding, much faster for big photos
+        img.draft('RGB', (max_side, max_side))
+        img = img.convert('RGB')
+        img.thumbnail((max_side, max_side), Image.LANCZOS)
+
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        # Write to a temporary file and rename it, so a half written thumbnail is never served
+        tmp_path = f"{target_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            img.save(tmp_path, pil_format, **options)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    os.replace(tmp_path, target_path)
+
+
+class ThumbnailCache:
+    """
+    On-disk cache of resized dataset images.
+
+    Thumbnails are created by the bulk CLI below or lazily on the first
+    request, and recreated when the source image is newer than the thumbnail.
+    """
+    def __init__(self, base_dir=BASE_DIR, cache_dir=CACHE_DIR):
+        self.base_dir = base_dir
+        self.cache_dir = cache_dir
+        # Striped locks so concurrent first requests generate a thumbnail only once
+        self._locks = [threading.Lock() for _ in range(64)]
+
+    def _lock_for(self, key):
+        return self._locks[hash(key) % len(self._locks)]
+
+    def thumbnail_path(self, filename, size, fmt):
+        extension = THUMBNAIL_FORMATS[fmt][0]
+        return safe_join(self.cache_dir, size, filename + extension)
+
+    def get(self, filename, size, fmt):
+        """
+        Returns the thumbnail of a dataset image, generating it if needed.
+
+        Parameters:
+        - filename: Path of the image relative to the dataset folder.
+        - size: One of THUMBNAIL_SIZES.
+        - fmt: One of THUMBNAIL_FORMATS.
+
+        Returns:
+        - (thumbnail path, ETag) or None if the image doesn't exist or can't be decoded.
+        """
+        source_path = safe_join(self.base_dir, filename)
+        target_path = self.thumbnail_path(filename, size, fmt)
+        if source_path is None or target_path is None:
+            return None
+        try:
+            source_stat = os.stat(source_path)
+        except OSError:
+            return None
+
+        if not self._is_fresh(target_path, source_stat):
+            with self._lock_for(target_path):
+                if not self._is_fresh(target_path, source_stat):
+                    try:
+                        generate_thumbnail(source_path, target_path, size, fmt)
+                    except Exception as e:
+                        # Corrupt or unreadable image (Pillow raises OSError, ValueError, ...)
+                        print(f"Thumbnail failed for {filename} ({size}, {fmt}): {e}")
+                        return None
+
+        # The thumbnail bytes only depend on the source image and the size/format
+        etag = f"{size}-{fmt}-{source_stat.st_mtime_ns:x}-{source_stat.st_size:x}"
+        return target_path, etag
+
+    def _is_fresh(self, target_path, source_stat):
+        try:
+            return os.stat(target_path).st_mtime_ns >= source_stat.st_mtime_ns
+        except OSError:
+            return False
+
+
+def list_dataset_images(base_dir=BASE_DIR):
+    # Paths of all images relative to the dataset folder
+    filenames = []
+    for root, _, files in os.walk(base_dir):
+        for file_name in files:
+            if file_name.lower().endswith(IMAGE_EXTENSIONS):
+                filenames.append(os.path.relpath(os.path.join(root, file_name), base_dir).replace('\\', '/'))
+    return sorted(filenames)
+
+
+def _generate_all_for(args):
+    filename, sizes, formats, base_dir, cache_dir = args
+    cache = ThumbnailCache(base_dir, cache_dir)
+    failed = 0
+    for size in sizes:
+        for fmt in formats:
+            if cache.get(filename, size, fmt) is None:
+                failed += 1
+    return failed
+
+
+def generate_all(sizes, formats, workers=None, base_dir=BASE_DIR, cache_dir=CACHE_DIR):
+    """
+    Pre-generates the thumbnails of the whole dataset in parallel.
+
+    Returns:
+    - (number of images, number of failed thumbnails)
+    """
+    filenames = list_dataset_images(base_dir)
+    tasks = [(filename, sizes, formats, base_dir, cache_dir) for filename in filenames]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        failed = sum(executor.map(_generate_all_for, tasks, chunksize=32))
+    return len(filenames), failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-generate thumbnails of the dataset images.")
+    parser.add_argument('--sizes', nargs='+', default=list(THUMBNAIL_SIZES), choices=list(THUMBNAIL_SIZES))
+    parser.add_argument('--formats', nargs='+', default=list(THUMBNAIL_FORMATS), choices=list(THUMBNAIL_FORMATS))
+    parser.add_argument('--workers', type=int, default=None, help="Number of processes (default: all cores)")
+    args = parser.parse_args()
+
+    total, failed = generate_all(args.sizes, args.formats, args.workers)
+    print(f"Thumbnails ready for {total} images ({failed} failed) in {CACHE_DIR}")
@@ -0,0 +1,56 @@
+import os
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from metrics import timed
+
+
+class UploadStore:
+    """
+    Optionally keeps uploaded images on disk (e.g. for future training),
+    without making the request wait for the write.
+
+    Files are named after the hash of their content, so the same photo
+    uploaded twice is stored once and concurrent uploads never overwrite
+    each other.
+    """
+    def __init__(self, folder='uploads', enabled=False):
+        self.folder = folder
+        self.enabled = enabled
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='upload-writer') if enabled else None
+
+    def upload_id(self, data):
+        return hashlib.sha256(data).hexdigest()[:32]
+
+    @timed('upload_save')
+    def persist(self, data, filename=''):
+        """
+        Queues the upload to be written in the background.
+
+        Parameters:
+        - data: The image bytes.
+        - filename: The original file name (only its extension is kept).
+
+        Returns:
+        - The id of the stored upload, or None when persisting is disabled.
+        """
+        if not self.enabled:
+            return None
+        upload_id = self.upload_id(data)
+        extension = os.path.splitext(filename)[1].lower()[:5]
+        path = os.path.join(self.folder, upload_id + extension)
+        self._writer.submit(self._write, path, data)
+        return upload_id
+
+    @timed('upload_write')
+    def _write(self, path, data):
+        if os.path.exists(path):
+            return
+        try:
+            os.makedirs(self.folder, exist_ok=True)
+            # Write to a temporary file first so a half written upload is never visible
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as file:
+                file.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Saving upload {path} failed: {e}")
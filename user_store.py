@@ -0,0 +1,135 @@
+import os
+import json
+import sqlite3
+import threading
+from metrics import timed
+
+DB_FILE = os.environ.get('GREENSPACE_DB', 'greenspace.db')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    password TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS user_plants (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT NOT NULL REFERENCES users(username),
+    name TEXT NOT NULL,
+    image TEXT,
+    nickname TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_user_plants_username ON user_plants (username, id);
+'''
+
+
+class UserStore:
+    """
+    Users and their plant collections in an embedded SQLite database.
+
+    The database runs in WAL mode, so readers don't block the writer, and
+    every write is a single-row insert in its own transaction. Each thread
+    keeps one connection and reuses it across requests.
+    """
+    def __init__(self, db_file=DB_FILE):
+        self.db_file = db_file
+        self._local = threading.local()
+        self._connection().executescript(SCHEMA)
+
+    def after_fork(self):
+        # SQLite connections must not be used across a fork, the new process opens its own
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_file, timeout=30, isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute('PRAGMA foreign_keys=ON')
+            self._local.connection = connection
+        return connection
+
+    @timed('user_store.get_user')
+    def get_user(self, username):
+        """
+        Returns the user as a dictionary with the password hash, or None.
+        """
+        row = self._connection().execute(
+            'SELECT username, password FROM users WHERE username = ?', (username,)).fetchone()
+        return dict(row) if row else None
+
+    @timed('user_store.create_user')
+    def create_user(self, username, password_hash):
+        """
+        Creates a user.
+
+        Returns:
+        - False if the username is already taken.
+        """
+        cursor = self._connection().execute(
+            'INSERT OR IGNORE INTO users (username, password) VALUES (?, ?)', (username, password_hash))
+        return cursor.rowcount == 1
+
+    @timed('user_store.get_user_plants')
+    def get_user_plants(self, username):
+        """
+        Returns the plants of a user in the order they were added.
+        """
+        rows = self._connection().execute(
+            'SELECT name, image, nickname FROM user_plants WHERE username = ? ORDER BY id', (username,)).fetchall()
+        return [dict(row) for row in rows]
+
+    @timed('user_store.add_user_plant')
+    def add_user_plant(self, username, name, image, nickname):
+        self._connection().execute(
+            'INSERT INTO user_plants (username, name, image, nickname) VALUES (?, ?, ?, ?)',
+            (username, name, image, nickname))
+
+    def count_users(self):
+        return self._connection().execute('SELECT COUNT(*) FROM users').fetchone()[0]
+
+    def import_json(self, user_data, user_plants):
+        """
+        Imports the content of user_data.json and user_plants.json in one transaction.
+        Users that already exist are skipped, with their plants.
+
+        Returns:
+        - (number of imported users, number of imported plants)
+        """
+        connection = self._connection()
+        imported_users = 0
+        imported_plants = 0
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            for username, user in user_data.items():
+                cursor = connection.execute(
+                    'INSERT OR IGNORE INTO users (username, password) VALUES (?, ?)', (username, user['password']))
+                if cursor.rowcount != 1:
+                    continue
+                imported_users += 1
+                for plant in user_plants.get(username, []):
+                    connection.execute(
+                        'INSERT INTO user_plants (username, name, image, nickname) VALUES (?, ?, ?, ?)',
+                        (username, plant.get('name'), plant.get('image'), plant.get('nickname')))
+                    imported_plants += 1
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        return imported_users, imported_plants
+
+
+def read_json_file(path):
+    try:
+        with open(path, 'r') as file:
+            return json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def migrate_json_files(store, user_data_file='user_data.json', user_plants_file='user_plants.json'):
+    # Copy the users and collections of the old JSON files into the database
+    return store.import_json(read_json_file(user_data_file), read_json_file(user_plants_file))